@@ -8,14 +8,21 @@ Telegram Bot для системы лояльности
 Версия: 1.0.0
 """
 
+import asyncio
+import json
 import logging
+import secrets
+import signal
 import sys
 import os
+from contextlib import suppress
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
 from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ConversationHandler, filters
 )
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, Update
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -25,77 +32,217 @@ load_dotenv()
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 from src.config import config, setup_logging
-from src.handlers.client_handlers import ClientHandlers, REGISTER_NAME, REGISTER_PHONE, REGISTER_BIRTH_DATE, REGISTER_CONFIRM
-from src.handlers.client_handlers import SELF_REGISTER_NAME, SELF_REGISTER_PHONE, SELF_REGISTER_BIRTH_DATE, SELF_REGISTER_CONFIRM
-from src.handlers.bonus_handlers import BonusHandlers, ADD_POINTS_CLIENT, ADD_POINTS_AMOUNT, ADD_POINTS_CONFIRM
-from src.handlers.bonus_handlers import SPEND_POINTS_CLIENT, SPEND_POINTS_AMOUNT, SPEND_POINTS_CONFIRM
-from src.handlers.bonus_handlers import PURCHASE_CLIENT, PURCHASE_AMOUNT, PURCHASE_POINTS, PURCHASE_CONFIRM
-from src.handlers.stats_handlers import StatsHandlers
-from src.handlers.admin_handlers import AdminHandlers, ADD_STAFF_NAME, ADD_STAFF_PHONE, ADD_STAFF_ROLE, ADD_STAFF_CONFIRM
-from src.utils.scheduler import birthday_scheduler, notification_scheduler
+# Модули обработчиков импортируются лениво (src.utils.startup): при первом
+# вызове, в фоне после старта или, для диалогов, параллельно с открытием пула
+from src.handlers.period_stats_handlers import PERIODS as STATS_PERIODS, ROLLUPS_KEY
+from src.utils.dispatcher import ChatOrderedDispatcher, chat_key
+from src.utils.webhook import WebhookListener
+from src.utils.callback_router import CallbackRouter
+from src.utils.client_cache import client_cache, invalidating
+from src.utils.search_index import client_search_index
+from src.utils.segments import segment_index
+from src.utils.client_listing import CURSOR_PREFIX, client_listing
+from src.utils.database import connect, database, has_role
+from src.utils.rate_limiter import TelegramRateLimiter
+from src.utils.broadcast import run_due_broadcasts
+from src.utils.birthday import BirthdayBonusJob, local_today
+from src.utils.ledger import PointLedger
+from src.utils.stats_rollups import StatsRollups
+from src.utils.point_lots import PointLots
+from src.utils.persistence import DatabasePersistence
+from src.utils.sharding import WORKER_PATH, ShardFront, shard_for
+from src.utils.shared_state import CacheInvalidation, LeaderElection, create_store
+from src.utils.metrics import TimedRequest, handler_metrics
+from src.utils.startup import DeferredStart, lazy, resolve_all, warm_up
 
 # Настройка логирования
 logger = setup_logging()
 
+# Режим webhook включается заданием WEBHOOK_URL, иначе используется polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+BROADCAST_POLL_INTERVAL = int(os.getenv("BROADCAST_POLL_INTERVAL", "60"))
+SEARCH_INDEX_REFRESH = int(os.getenv("SEARCH_INDEX_REFRESH", "60"))
+STATS_ROLLUP_INTERVAL = int(os.getenv("STATS_ROLLUP_INTERVAL", "60"))
+PERSISTENCE_INTERVAL = float(os.getenv("PERSISTENCE_INTERVAL", "10"))
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", str(24 * 3600)))
+# Диалоги переживают перезапуск, поэтому накопившиеся обновления по умолчанию обрабатываются
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "false").lower() == "true"
+DB_STATUS_ROLES = ("admin", "manager")
+# Метрики обработчиков: /perf и /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Служебный HTTP-порт с /metrics и состоянием очереди (/stats): отдельно от
+# публичного webhook-порта и по умолчанию только на 127.0.0.1; 0 — выключен
+LOCAL_LISTEN = os.getenv("LOCAL_LISTEN", os.getenv("METRICS_LISTEN", "127.0.0.1"))
+LOCAL_PORT = int(os.getenv("LOCAL_PORT", os.getenv("METRICS_PORT", "0")))
+PERF_ROLES = ("admin",)
+BIRTHDAY_HOUR = int(os.getenv("BIRTHDAY_HOUR", "9"))
+# Сгорание баллов по points_expiry_days — ночью, когда операций почти нет
+POINTS_EXPIRY_HOUR = int(os.getenv("POINTS_EXPIRY_HOUR", "3"))
+# Быстрый старт: приём обновлений начинается сразу, планировщики и прогрев
+# модулей — после первого обработанного обновления (или через DEFERRED_START_TIMEOUT)
+FAST_STARTUP = os.getenv("FAST_STARTUP", "true").lower() == "true"
+DEFERRED_START_TIMEOUT = float(os.getenv("DEFERRED_START_TIMEOUT", "30"))
+ALLOWED_UPDATES = ["message", "callback_query"]
+# Собственный Bot API сервер (или его имитация в бенчмарках), например http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").rstrip("/")
+# Несколько процессов: при SHARDS > 1 main() запускает входной процесс (ShardFront),
+# который раздаёт обновления по чатам SHARDS рабочим; SHARD_INDEX / SHARD_PORT /
+# SHARD_SECRET рабочим задаёт он. Планировщики работают в одном рабочем — ведущем
+SHARDS = int(os.getenv("SHARDS", "1"))
+SHARD_INDEX = os.getenv("SHARD_INDEX", "")
+SHARD_WORKER = SHARD_INDEX != ""
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", "8600"))
+SHARD_PORT = int(os.getenv("SHARD_PORT", "0")) or SHARD_BASE_PORT + int(SHARD_INDEX or 0)
+SHARD_SECRET = os.getenv("SHARD_SECRET", "")
+LEADER_LOCK = "rock_coffee_schedulers"
+
+ADMIN_CALLBACKS = (
+    "staff_management", "admin_stats", "promotions", "system_settings", "list_staff"
+)
+
+COMMAND_HINTS = {
+    "start_add_points": "/add_points",
+    "start_spend_points": "/spend_points",
+    "start_purchase": "/purchase"
+}
+
+CLIENT_HANDLERS = "src.handlers.client_handlers:ClientHandlers"
+STATS_HANDLERS = "src.handlers.stats_handlers:StatsHandlers"
+ADMIN_HANDLERS = "src.handlers.admin_handlers:AdminHandlers"
+EXPORT_HANDLERS = "src.handlers.export_handlers:ExportHandlers"
+BIRTHDAY_HANDLERS = "src.handlers.birthday_handlers:BirthdayHandlers"
+CLIENT_LIST_HANDLERS = "src.handlers.client_list_handlers:ClientListHandlers"
+# Баланс и карточка клиента читаются через кэш клиентов (load_client)
+CLIENT_LOOKUP_HANDLERS = "src.handlers.client_lookup_handlers:ClientLookupHandlers"
+PERIOD_STATS_HANDLERS = "src.handlers.period_stats_handlers:PeriodStatsHandlers"
+
+confirm_delete_client = lazy(f"{CLIENT_HANDLERS}.confirm_delete_client")
+manage_single_client = lazy(f"{CLIENT_LOOKUP_HANDLERS}.manage_single_client")
+
 class LoyaltyBot:
     """Основной класс бота системы лояльности"""
     
     def __init__(self):
         self.application = None
+        self.dispatcher = None
+        self.webhook_listener = None
+        self.local_listener = None
+        self.callback_router = None
+        self.notification_scheduler = None
+        self.store = None
+        self.cache_bus = None
+        self.leader = None
+        self.deferred_start = DeferredStart(self._start_deferred_services, timeout=DEFERRED_START_TIMEOUT)
+        # Общий лимитер для всех массовых отправок бота
+        self.rate_limiter = TelegramRateLimiter()
+        self.stats_rollups = StatsRollups(database)
+        self.point_lots = PointLots(database)
+        owns = (lambda chat_id: shard_for(chat_id, SHARDS) == int(SHARD_INDEX)) if SHARD_WORKER else None
+        self.persistence = DatabasePersistence(
+            database, update_interval=PERSISTENCE_INTERVAL, ttl=CONVERSATION_TTL, owns=owns
+        )
+        self._background_tasks = []
+        # Службы ведущего процесса: останавливаются, если ведущим стал другой
+        self._leader_tasks = []
+        self._services_ready = asyncio.Event()
+        self._stop_event = asyncio.Event()
+        handler_metrics.enabled = METRICS_ENABLED
+        if METRICS_ENABLED:
+            database.query_observer = handler_metrics.record_db
         self._setup_bot()
     
     def _setup_bot(self):
         """Настройка бота и обработчиков"""
         logger.debug("Starting bot setup...")
-        logger.debug(f"Telegram token: {config.telegram_token[:20]}...")
+        logger.debug("Telegram token: %s...", config.telegram_token[:20])
         
         # Создаем приложение
         logger.debug("Creating Telegram application...")
-        self.application = Application.builder().token(config.telegram_token).build()
+        builder = (
+            Application.builder()
+            .token(config.telegram_token)
+            .persistence(self.persistence)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(f"{TELEGRAM_API_URL}/bot").base_file_url(f"{TELEGRAM_API_URL}/file/bot")
+        if METRICS_ENABLED:
+            # Время запросов к Bot API приписывается обработчику, который их сделал
+            builder = builder.request(TimedRequest(connection_pool_size=256))
+        if WEBHOOK_URL or SHARD_WORKER:
+            # Порядок внутри чата обеспечивает ChatOrderedDispatcher,
+            # поэтому PTB не должен сериализовать обновления сам
+            builder = builder.concurrent_updates(UPDATE_WORKERS)
+        self.application = builder.build()
+        self.application.bot_data["rate_limiter"] = self.rate_limiter
+        self.application.bot_data[ROLLUPS_KEY] = self.stats_rollups
         logger.debug("Telegram application created successfully")
         
         # Добавляем обработчики команд
         logger.debug("Adding command handlers...")
         self._add_command_handlers()
         
-        # Добавляем conversation handlers
-        logger.debug("Adding conversation handlers...")
-        self._add_conversation_handlers()
-        
-        # Добавляем callback handlers  
-        logger.debug("Adding callback handlers...")
-        self._add_callback_handlers()
+        # Conversation и callback handlers добавляются в _initialize_bot: модули
+        # диалогов импортируются параллельно с открытием пула
         
         # Добавляем обработчик ошибок
         logger.debug("Adding error handler...")
         self.application.add_error_handler(self._error_handler)
+        if FAST_STARTUP:
+            self.deferred_start.install(self.application)
         
         logger.info("Bot setup completed successfully")
-        logger.debug(f"Total handlers registered: {len(self.application.handlers)}")
+    
+    def _instrument_handlers(self):
+        """Метрики для всех зарегистрированных обработчиков"""
+        if not METRICS_ENABLED:
+            return
+        # Маршруты callback-запросов замеряются по отдельности, а не общим dispatch
+        handler_metrics.instrument(
+            self.application, exclude=[self.callback_router.dispatch, self.deferred_start.handler.callback]
+        )
+        self.callback_router.wrap_handlers(handler_metrics.wrap)
     
     def _add_command_handlers(self):
         """Добавление обработчиков команд"""
         commands = [
-            ("start", ClientHandlers.start_command, "Client start command"),
-            ("balance", ClientHandlers.balance_command, "Balance check command"),
-            ("search", ClientHandlers.search_client_command, "Client search command"),
-            ("delete_client", ClientHandlers.delete_client_command, "Delete client command"),
-            ("test_db", ClientHandlers.test_db_connection, "Test database connection"),
-            ("stats", StatsHandlers.stats_menu, "Statistics menu command"),
-            ("admin", AdminHandlers.admin_menu, "Admin panel command"),
-            ("export", StatsHandlers.export_data_command, "Data export command"),
-            ("staff", AdminHandlers.staff_management_menu, "Staff management command"),
+            ("start", lazy(f"{CLIENT_HANDLERS}.start_command"), "Client start command"),
+            ("balance", lazy(f"{CLIENT_LOOKUP_HANDLERS}.balance_command"), "Balance check command"),
+            ("search", lazy("src.handlers.search_handlers:SearchHandlers.search_client_command"), "Client search command"),
+            ("delete_client", lazy(f"{CLIENT_HANDLERS}.delete_client_command"), "Delete client command"),
+            ("test_db", self._test_db_command, "Database pool status command"),
+            ("perf", self._perf_command, "Handler performance command"),
+            ("segments", lazy("src.handlers.segment_handlers:SegmentHandlers.segments_command"), "Broadcast segments command"),
+            ("stats", lazy(f"{STATS_HANDLERS}.stats_menu"), "Statistics menu command"),
+            ("admin", lazy(f"{ADMIN_HANDLERS}.admin_menu"), "Admin panel command"),
+            ("export", lazy(f"{EXPORT_HANDLERS}.export_data_command"), "Data export command"),
+            ("staff", lazy(f"{ADMIN_HANDLERS}.staff_management_menu"), "Staff management command"),
         ]
         
         for command, handler, description in commands:
-            logger.debug(f"Registering command handler: /{command} -> {description}")
+            logger.debug("Registering command handler: /%s -> %s", command, description)
             self.application.add_handler(CommandHandler(command, handler))
         
         logger.info(f"Command handlers registered: {len(commands)} commands")
-        logger.debug("Available commands: " + ", ".join([f"/{cmd}" for cmd, _, _ in commands]))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Available commands: %s", ", ".join(f"/{cmd}" for cmd, _, _ in commands))
     
     def _add_conversation_handlers(self):
-        """Добавление conversation handlers"""
+        """Добавление conversation handlers (состояния диалогов определены в модулях обработчиков)"""
+        from src.handlers.client_handlers import ClientHandlers, REGISTER_NAME, REGISTER_PHONE, REGISTER_BIRTH_DATE, REGISTER_CONFIRM
+        from src.handlers.client_handlers import SELF_REGISTER_NAME, SELF_REGISTER_PHONE, SELF_REGISTER_BIRTH_DATE, SELF_REGISTER_CONFIRM
+        from src.handlers.bonus_handlers import BonusHandlers, ADD_POINTS_CLIENT, ADD_POINTS_AMOUNT, ADD_POINTS_CONFIRM
+        from src.handlers.bonus_handlers import SPEND_POINTS_CLIENT, SPEND_POINTS_AMOUNT, SPEND_POINTS_CONFIRM
+        from src.handlers.bonus_handlers import PURCHASE_CLIENT, PURCHASE_AMOUNT, PURCHASE_POINTS, PURCHASE_CONFIRM
+        from src.handlers.points_handlers import PointsHandlers
+        from src.handlers.admin_handlers import AdminHandlers, ADD_STAFF_NAME, ADD_STAFF_PHONE, ADD_STAFF_ROLE, ADD_STAFF_CONFIRM
         
         # Регистрация клиента
         registration_conv = ConversationHandler(
@@ -111,7 +258,9 @@ class LoyaltyBot:
                 REGISTER_BIRTH_DATE: [MessageHandler(filters.TEXT & ~filters.COMMAND, ClientHandlers.register_birth_date)],
                 REGISTER_CONFIRM: [CallbackQueryHandler(ClientHandlers.confirm_registration)]
             },
-            fallbacks=[CommandHandler("cancel", ClientHandlers.cancel_registration)]
+            fallbacks=[CommandHandler("cancel", ClientHandlers.cancel_registration)],
+            name="registration",
+            persistent=True
         )
         
         # Начисление баллов
@@ -123,9 +272,14 @@ class LoyaltyBot:
             states={
                 ADD_POINTS_CLIENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.add_points_client)],
                 ADD_POINTS_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.add_points_amount)],
-                ADD_POINTS_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.add_points_confirm)]
+                ADD_POINTS_CONFIRM: [MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    invalidating(PointsHandlers.add_points_confirm, self._invalidate_dialog_client)
+                )]
             },
-            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)]
+            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)],
+            name="add_points",
+            persistent=True
         )
         
         # Списание баллов
@@ -137,9 +291,14 @@ class LoyaltyBot:
             states={
                 SPEND_POINTS_CLIENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.spend_points_client)],
                 SPEND_POINTS_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.spend_points_amount)],
-                SPEND_POINTS_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.spend_points_confirm)]
+                SPEND_POINTS_CONFIRM: [MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    invalidating(PointsHandlers.spend_points_confirm, self._invalidate_dialog_client)
+                )]
             },
-            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)]
+            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)],
+            name="spend_points",
+            persistent=True
         )
         
         # Оформление покупки
@@ -149,9 +308,14 @@ class LoyaltyBot:
                 PURCHASE_CLIENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.purchase_client)],
                 PURCHASE_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.purchase_amount)],
                 PURCHASE_POINTS: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.purchase_points)],
-                PURCHASE_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, BonusHandlers.purchase_confirm)]
+                PURCHASE_CONFIRM: [MessageHandler(
+                    filters.TEXT & ~filters.COMMAND,
+                    invalidating(PointsHandlers.purchase_confirm, self._invalidate_dialog_client)
+                )]
             },
-            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)]
+            fallbacks=[CommandHandler("cancel", BonusHandlers.cancel_operation)],
+            name="purchase",
+            persistent=True
         )
         
         # Добавление сотрудника
@@ -168,7 +332,9 @@ class LoyaltyBot:
                 ADD_STAFF_ROLE: [CallbackQueryHandler(AdminHandlers.add_staff_role, pattern="^role_")],
                 ADD_STAFF_CONFIRM: [MessageHandler(filters.TEXT & ~filters.COMMAND, AdminHandlers.add_staff_confirm)]
             },
-            fallbacks=[CommandHandler("cancel", AdminHandlers.cancel_add_staff)]
+            fallbacks=[CommandHandler("cancel", AdminHandlers.cancel_add_staff)],
+            name="add_staff",
+            persistent=True
         )
         
         # Самостоятельная регистрация клиентов
@@ -185,7 +351,9 @@ class LoyaltyBot:
                     CallbackQueryHandler(ClientHandlers.cancel_self_registration, pattern="^cancel_self_registration$")
                 ]
             },
-            fallbacks=[CommandHandler("cancel", ClientHandlers.cancel_self_registration)]
+            fallbacks=[CommandHandler("cancel", ClientHandlers.cancel_self_registration)],
+            name="self_registration",
+            persistent=True
         )
         
         # Добавляем все conversation handlers
@@ -201,91 +369,101 @@ class LoyaltyBot:
     
     def _add_callback_handlers(self):
         """Добавление callback handlers"""
+        router = CallbackRouter()
         
         # Основные callback handlers
-        self.application.add_handler(
-            CallbackQueryHandler(StatsHandlers.stats_callback_handler, pattern="^stats_")
-        )
-        
-        self.application.add_handler(
-            CallbackQueryHandler(AdminHandlers.admin_callback_handler, pattern="^(staff_management|admin_stats|promotions|system_settings|force_birthday_check|backup_data|list_staff)$")
-        )
-        
-        self.application.add_handler(
-            CallbackQueryHandler(StatsHandlers.send_birthday_bonuses, pattern="^send_birthday_bonuses$")
-        )
-        
+        # Сводные экраны читают только предрасчитанные сводки
+        for data in STATS_PERIODS:
+            router.exact(data, lazy(f"{PERIOD_STATS_HANDLERS}.period_stats"))
+        router.prefix("stats_", lazy(f"{STATS_HANDLERS}.stats_callback_handler"))
+        admin_callback = lazy(f"{ADMIN_HANDLERS}.admin_callback_handler")
+        for data in ADMIN_CALLBACKS:
+            router.exact(data, admin_callback)
+        birthday_bonuses = lazy(f"{BIRTHDAY_HANDLERS}.run_birthday_bonuses")
+        router.exact("send_birthday_bonuses", birthday_bonuses)
+        router.exact("force_birthday_check", birthday_bonuses)
+        router.exact("backup_data", lazy(f"{EXPORT_HANDLERS}.backup_data_callback"))
         
         # Callback handlers для удаления клиентов
-        self.application.add_handler(
-            CallbackQueryHandler(ClientHandlers.confirm_delete_client, pattern="^confirm_delete_")
+        router.pattern("confirm_delete_{client_id}", self._confirm_delete_client)
+        router.exact("cancel_delete", lazy(f"{CLIENT_HANDLERS}.cancel_delete_client"))
+        
+        # Основное меню: запрос подтверждается до вызова обработчика
+        router.exact("search_client", self._show_search_hint, answer=True)
+        # register_client обрабатывается в conversation handler
+        router.exact("register_client", self._ignore_callback, answer=True)
+        router.exact("about_loyalty", lazy(f"{CLIENT_HANDLERS}.about_loyalty_program"), answer=True)
+        router.exact("back_to_start", lazy(f"{CLIENT_HANDLERS}.start_command"), answer=True)
+        router.exact("manage_clients", lazy(f"{CLIENT_HANDLERS}.manage_clients_menu"), answer=True)
+        list_clients = lazy(f"{CLIENT_LIST_HANDLERS}.list_clients")
+        router.exact("list_all_clients", list_clients, answer=True)
+        router.prefix(CURSOR_PREFIX, list_clients, answer=True)
+        router.pattern("manage_client_{client_id}", self._manage_single_client, answer=True)
+        router.exact("bonus_operations", self._show_bonus_operations, answer=True)
+        router.exact("statistics", self._show_statistics_hint, answer=True)
+        for data in COMMAND_HINTS:
+            router.exact(data, self._show_command_hint, answer=True)
+        
+        # Один обработчик вместо последовательного перебора regex-шаблонов
+        self.callback_router = router
+        self.application.add_handler(CallbackQueryHandler(router.dispatch))
+        
+        logger.info(f"Callback handlers добавлены: {len(router)} маршрутов")
+    
+    @staticmethod
+    def _invalidate_dialog_client(update, context, user_data):
+        """Сброс кэша клиента после подтверждения операции с баллами"""
+        client_cache.invalidate_from_user_data(user_data)
+        client_listing.invalidate()
+    
+    async def _confirm_delete_client(self, update, context, client_id):
+        try:
+            await confirm_delete_client(update, context)
+        finally:
+            client_cache.invalidate_client(client_id)
+            client_search_index.remove(client_id)
+            segment_index.remove(client_id)
+            client_listing.invalidate()
+            if self.cache_bus is not None:
+                self.cache_bus.client_deleted(client_id)
+    
+    async def _ignore_callback(self, update, context):
+        """Callback, обрабатываемый в другом месте"""
+    
+    async def _show_search_hint(self, update, context):
+        await update.callback_query.edit_message_text(
+            "🔍 Поиск клиента\n\n"
+            "Используйте команду: /search <телефон/ID/имя>"
         )
+    
+    async def _manage_single_client(self, update, context, client_id):
+        await manage_single_client(update, context, client_id)
+    
+    async def _show_bonus_operations(self, update, context):
+        keyboard = [
+            [InlineKeyboardButton("➕ Начислить баллы", callback_data="start_add_points")],
+            [InlineKeyboardButton("➖ Списать баллы", callback_data="start_spend_points")],
+            [InlineKeyboardButton("🛍️ Оформить покупку", callback_data="start_purchase")]
+        ]
+        reply_markup = InlineKeyboardMarkup(keyboard)
         
-        self.application.add_handler(
-            CallbackQueryHandler(ClientHandlers.cancel_delete_client, pattern="^cancel_delete$")
+        await update.callback_query.edit_message_text(
+            "💰 Операции с бонусными баллами\n\n"
+            "Выберите тип операции:",
+            reply_markup=reply_markup
         )
-        
-        
-        # Общий callback handler для остальных случаев
-        self.application.add_handler(CallbackQueryHandler(self._general_callback_handler))
-        
-        logger.info("Callback handlers добавлены")
     
-    async def _general_callback_handler(self, update, context):
-        """Общий обработчик callback запросов"""
+    async def _show_statistics_hint(self, update, context):
+        await update.callback_query.edit_message_text(
+            "📊 Статистика\n\n"
+            "Используйте команду: /stats"
+        )
+    
+    async def _show_command_hint(self, update, context):
         query = update.callback_query
-        await query.answer()
-        
-        data = query.data
-        
-        # Обработка основного меню
-        if data == "search_client":
-            await query.edit_message_text(
-                "🔍 Поиск клиента\n\n"
-                "Используйте команду: /search <телефон/ID/имя>"
-            )
-        elif data == "register_client":
-            # Этот случай обрабатывается в conversation handler
-            pass
-        elif data == "about_loyalty":
-            await ClientHandlers.about_loyalty_program(update, context)
-        elif data == "back_to_start":
-            # Возвращаем пользователя в начальное меню
-            await ClientHandlers.start_command(update, context)
-        elif data == "manage_clients":
-            await ClientHandlers.manage_clients_menu(update, context)
-        elif data == "list_all_clients":
-            await ClientHandlers.list_all_clients(update, context)
-        elif data.startswith("manage_client_"):
-            client_id = data.split("_", 2)[-1]
-            await ClientHandlers.manage_single_client(update, context, client_id)
-        elif data == "bonus_operations":
-            keyboard = [
-                [InlineKeyboardButton("➕ Начислить баллы", callback_data="start_add_points")],
-                [InlineKeyboardButton("➖ Списать баллы", callback_data="start_spend_points")],
-                [InlineKeyboardButton("🛍️ Оформить покупку", callback_data="start_purchase")]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                "💰 Операции с бонусными баллами\n\n"
-                "Выберите тип операции:",
-                reply_markup=reply_markup
-            )
-        elif data == "statistics":
-            await query.edit_message_text(
-                "📊 Статистика\n\n"
-                "Используйте команду: /stats"
-            )
-        elif data in ["start_add_points", "start_spend_points", "start_purchase"]:
-            command_map = {
-                "start_add_points": "/add_points",
-                "start_spend_points": "/spend_points", 
-                "start_purchase": "/purchase"
-            }
-            await query.edit_message_text(
-                f"Используйте команду: {command_map[data]}"
-            )
+        await query.edit_message_text(
+            f"Используйте команду: {COMMAND_HINTS[query.data]}"
+        )
     
     async def _error_handler(self, update, context):
         """Расширенный обработчик ошибок"""
@@ -323,7 +501,7 @@ class LoyaltyBot:
             except Exception as e:
                 logger.error(f"Failed to send error message to user: {e}")
     
-    def _setup_notification_callback(self):
+    def _setup_notification_callback(self, notification_scheduler):
         """Настройка callback для отправки уведомлений"""
         async def send_notification(message: str):
             """Отправка уведомления администратору"""
@@ -337,16 +515,239 @@ class LoyaltyBot:
         
         notification_scheduler.add_notification_callback(send_notification)
     
+    async def _post_init(self, application):
+        """Запуск фоновых задач после инициализации приложения"""
+        # В одном процессе хранилище локальное и ведущим он становится сразу
+        self.store = create_store(database, shared=SHARD_WORKER)
+        if SHARD_WORKER:
+            self.cache_bus = CacheInvalidation(self.store)
+            await self.cache_bus.start()
+        self.leader = LeaderElection(self.store, LEADER_LOCK, self._start_leader_services, self._stop_leader_services)
+        self._background_tasks.append(asyncio.create_task(self.leader.run()))
+        # Поисковый индекс и сводки прогреваются в фоне, не задерживая приём обновлений
+        self._background_tasks.append(asyncio.create_task(self._search_index_loop()))
+        if FAST_STARTUP:
+            self._background_tasks.append(asyncio.create_task(self.deferred_start.run()))
+        else:
+            await self._start_deferred_services()
+        if LOCAL_PORT and not SHARD_WORKER:
+            self.local_listener = WebhookListener(None, host=LOCAL_LISTEN, port=LOCAL_PORT)
+            if METRICS_ENABLED:
+                self.local_listener.add_route("/metrics", self._metrics_route)
+            if self.dispatcher is not None:
+                self.local_listener.add_route("/stats", self._dispatcher_stats_route)
+            await self.local_listener.start()
+    
+    async def _post_shutdown(self, application):
+        """Остановка фоновых задач"""
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+        if self.local_listener is not None:
+            await self.local_listener.stop()
+            self.local_listener = None
+        if self.cache_bus is not None:
+            self.cache_bus.stop()
+        if self.store is not None:
+            await self.store.close()
+    
+    async def _start_deferred_services(self):
+        """Планировщики и прогрев модулей обработчиков: после первого обновления"""
+        self._services_ready.set()
+        if FAST_STARTUP:
+            self._background_tasks.append(asyncio.create_task(warm_up()))
+    
+    async def _start_leader_services(self):
+        """Службы, которые работают только в ведущем процессе"""
+        self._leader_tasks = [
+            asyncio.create_task(self._broadcast_loop()),
+            asyncio.create_task(self._stats_rollup_loop()),
+            asyncio.create_task(self._scheduler_services()),
+        ]
+    
+    async def _stop_leader_services(self):
+        for task in self._leader_tasks:
+            task.cancel()
+        await asyncio.gather(*self._leader_tasks, return_exceptions=True)
+        self._leader_tasks = []
+    
+    async def _scheduler_services(self):
+        """Бонусы, сгорание баллов и уведомления: после отложенного старта"""
+        from src.utils.scheduler import notification_scheduler
+        
+        await self._services_ready.wait()
+        if self.notification_scheduler is None:
+            self._setup_notification_callback(notification_scheduler)
+            self.notification_scheduler = notification_scheduler
+        notification_scheduler.start()
+        logger.info("Schedulers started")
+        try:
+            await asyncio.gather(self._birthday_loop(), self._points_expiry_loop())
+        finally:
+            notification_scheduler.stop()
+    
+    async def _broadcast_loop(self):
+        """Отправка запланированных рассылок и возобновление прерванных"""
+        while True:
+            try:
+                async with connect() as connection:
+                    await run_due_broadcasts(
+                        connection, self.application.bot, self.rate_limiter, segments=segment_index,
+                        today=local_today(config.timezone)
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обработки рассылок: {e}")
+            await asyncio.sleep(BROADCAST_POLL_INTERVAL)
+    
+    async def _search_index_loop(self):
+        """Загрузка поискового индекса и сегментов рассылок, догрузка изменённых клиентов"""
+        while True:
+            try:
+                async with connect() as connection:
+                    await client_search_index.refresh(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обновления поискового индекса: {e}")
+            try:
+                async with connect() as connection:
+                    await segment_index.refresh(connection, local_today(config.timezone))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обновления сегментов клиентов: {e}")
+            await asyncio.sleep(SEARCH_INDEX_REFRESH)
+    
+    async def _stats_rollup_loop(self):
+        """Догоняющее обновление сводок статистики и партий баллов"""
+        while True:
+            try:
+                await self.stats_rollups.catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обновления сводок статистики: {e}")
+            try:
+                await self.point_lots.catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка обновления партий баллов: {e}")
+            await asyncio.sleep(STATS_ROLLUP_INTERVAL)
+    
+    async def _test_db_command(self, update, context):
+        """/test_db — проверка пула соединений и его состояние"""
+        user_id = update.effective_user.id
+        if user_id != config.admin_id:
+            async with connect() as connection:
+                if not await has_role(connection, user_id, DB_STATUS_ROLES):
+                    await update.message.reply_text("❌ Недостаточно прав")
+                    return
+        
+        healthy = await database.health_check()
+        stats = database.stats()
+        cache = client_cache.stats()
+        lines = [
+            "✅ База данных доступна" if healthy else "❌ База данных недоступна",
+            "",
+            f"• Backend: {stats.backend}",
+            f"• Соединения: {stats.size} (свободно {stats.idle}, занято {stats.in_use}), "
+            f"лимит {stats.min_size}..{stats.max_size}",
+            f"• Выдано соединений: {stats.acquires}",
+            f"• Ожидание соединения: ср. {stats.acquire_wait_avg_ms:.2f} мс, макс. {stats.acquire_wait_max_ms:.2f} мс",
+        ]
+        if stats.last_check_ms is not None:
+            lines.append(f"• Проверка SELECT 1: {stats.last_check_ms:.2f} мс")
+        lines.append(f"• Кэш клиентов: {cache.size} записей, попаданий {cache.hit_rate:.0%}")
+        await update.message.reply_text("\n".join(lines))
+    
+    async def _perf_command(self, update, context):
+        """/perf — самые затратные обработчики: задержка, время базы и Telegram, ошибки"""
+        user_id = update.effective_user.id
+        if user_id != config.admin_id:
+            async with connect() as connection:
+                if not await has_role(connection, user_id, PERF_ROLES):
+                    await update.message.reply_text("❌ Недостаточно прав")
+                    return
+        
+        if not handler_metrics.enabled:
+            await update.message.reply_text("Метрики выключены (METRICS_ENABLED=false)")
+            return
+        top = handler_metrics.top(10)
+        if not top:
+            await update.message.reply_text("Данных пока нет")
+            return
+        lines = ["⏱ Обработчики по суммарному времени", ""]
+        for name, stats in top:
+            calls = stats.latency.count
+            lines.append(
+                f"• {name}: {calls} вызовов, p50 {stats.latency.quantile(0.5) * 1000:.0f} мс, "
+                f"p99 {stats.latency.quantile(0.99) * 1000:.0f} мс, "
+                f"база {stats.db_seconds / calls * 1000:.1f} мс, "
+                f"Telegram {stats.telegram_seconds / calls * 1000:.1f} мс, ошибок {stats.errors}"
+            )
+        await update.message.reply_text("\n".join(lines))
+    
+    async def _birthday_loop(self):
+        """Ежедневное начисление бонусов именинникам (и один раз при запуске)"""
+        while True:
+            try:
+                job = BirthdayBonusJob(
+                    database, self.application.bot, config.birthday_bonus, config.timezone,
+                    limiter=self.rate_limiter
+                )
+                result = await job.run()
+                if result.awarded:
+                    await self.application.bot.send_message(chat_id=config.admin_id, text=result.summary)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка начисления бонусов на день рождения: {e}")
+            
+            await asyncio.sleep(self._seconds_until(BIRTHDAY_HOUR))
+    
+    async def _points_expiry_loop(self):
+        """Ежедневное сгорание баллов, срок которых наступил"""
+        while True:
+            await asyncio.sleep(self._seconds_until(POINTS_EXPIRY_HOUR))
+            try:
+                result = await self.point_lots.expire(local_today(config.timezone))
+                if result.expired:
+                    await self.application.bot.send_message(chat_id=config.admin_id, text=result.summary)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка сгорания баллов: {e}")
+    
+    @staticmethod
+    def _seconds_until(hour: int) -> float:
+        """Секунды до ближайшего наступления часа hour по времени бота"""
+        now = datetime.now(ZoneInfo(config.timezone))
+        next_run = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+        if next_run <= now:
+            next_run += timedelta(days=1)
+        return (next_run - now).total_seconds()
+    
     async def _initialize_bot(self):
         """Асинхронная инициализация бота"""
         logger.debug("Initializing bot...")
         try:
+            # Модули диалогов импортируются, пока открывается пул; оба шага нужны
+            # до initialize(): при нём загружаются сохранённые диалоги
+            await asyncio.gather(database.open(), asyncio.to_thread(self._add_conversation_handlers))
+            # Маршрутизатор callback-запросов — после диалогов, чтобы не перехватывать их точки входа
+            self._add_callback_handlers()
+            self._instrument_handlers()
+            # initialize() уже получает данные бота (getMe), отдельный запрос не нужен
             await self.application.initialize()
-            await self.application.bot.initialize()
+            self.application.bot_data["db"] = database
+            self.application.bot_data["ledger"] = PointLedger(database)
             logger.debug("✅ Bot initialized successfully")
             
-            # Получаем информацию о боте
-            bot_info = await self.application.bot.get_me()
+            bot_info = self.application.bot.bot
             logger.info(f"🤖 Bot info: @{bot_info.username} ({bot_info.first_name})")
             logger.info(f"   • Bot ID: {bot_info.id}")
             
@@ -368,30 +769,22 @@ class LoyaltyBot:
                 logger.error("❌ Telegram bot token not found in environment variables")
                 logger.error("Please set TELEGRAM_BOT_TOKEN in .env file")
                 return
-            logger.debug(f"✅ Telegram token found: {config.telegram_token[:20]}...")
+            logger.debug("✅ Telegram token found: %s...", config.telegram_token[:20])
             
             if not config.admin_id:
                 logger.error("❌ Admin Telegram ID not found in environment variables")
                 logger.error("Please set TELEGRAM_ADMIN_ID in .env file")
                 return
-            logger.debug(f"✅ Admin ID found: {config.admin_id}")
+            logger.debug("✅ Admin ID found: %s", config.admin_id)
+            
+            if not FAST_STARTUP:
+                # Прежний порядок: все модули обработчиков загружаются до приёма обновлений
+                resolve_all()
             
             # Инициализируем бота асинхронно
             logger.debug("Initializing bot asynchronously...")
-            import asyncio
             asyncio.get_event_loop().run_until_complete(self._initialize_bot())
             
-            # Настраиваем уведомления
-            logger.debug("Setting up notification callbacks...")
-            self._setup_notification_callback()
-            logger.debug("✅ Notification callbacks configured")
-            
-            # Запускаем планировщики
-            logger.debug("Starting schedulers...")
-            birthday_scheduler.start()
-            notification_scheduler.start()
-            logger.debug("✅ Schedulers started successfully")
-            
             # Выводим конфигурацию
             logger.info("🤖 BOT CONFIGURATION:")
             logger.info(f"   • Timezone: {config.timezone}")
@@ -400,14 +793,20 @@ class LoyaltyBot:
             logger.info(f"   • Log level: {config.log_level}")
             logger.info(f"   • Admin ID: {config.admin_id}")
             
+            if WEBHOOK_URL or SHARD_WORKER:
+                logger.info("🚀 STARTING BOT WEBHOOK...")
+                asyncio.get_event_loop().run_until_complete(self._run_webhook())
+                return
+            
             logger.info("🚀 STARTING BOT POLLING...")
             logger.debug("Poll configuration: message and callback_query updates only")
-            logger.debug("Drop pending updates: True")
+            logger.debug("Drop pending updates: %s", DROP_PENDING_UPDATES)
             
             # Запускаем бота
             self.application.run_polling(
-                allowed_updates=["message", "callback_query"],
-                drop_pending_updates=True
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=DROP_PENDING_UPDATES,
+                close_loop=False
             )
             
         except KeyboardInterrupt:
@@ -422,18 +821,151 @@ class LoyaltyBot:
             logger.info("🔄 Starting shutdown procedure...")
             self._shutdown()
     
+    async def _enqueue_update(self, payload: dict):
+        """Постановка webhook-обновления в очередь диспетчера"""
+        update = Update.de_json(payload, self.application.bot)
+        await self.dispatcher.submit(chat_key(update), lambda: self.application.process_update(update))
+    
+    def _dispatcher_stats_route(self):
+        """GET-маршрут с метриками очереди обновлений и кэша клиентов"""
+        return "application/json", json.dumps({
+            "dispatcher": self.dispatcher.stats().as_dict(),
+            "client_cache": client_cache.stats().as_dict(),
+            "database": database.stats().as_dict(),
+            "search_index": client_search_index.stats(),
+            "segments": segment_index.stats()["segments"]
+        })
+    
+    def _metrics_route(self):
+        """GET /metrics в текстовом формате Prometheus"""
+        return "text/plain; version=0.0.4", handler_metrics.render_prometheus()
+    
+    async def _run_webhook(self):
+        """Приём обновлений через webhook с конкурентной обработкой"""
+        self.dispatcher = ChatOrderedDispatcher(workers=UPDATE_WORKERS, max_pending=UPDATE_QUEUE_SIZE)
+        if SHARD_WORKER:
+            # Рабочий шарда получает обновления только от входного процесса
+            self.webhook_listener = WebhookListener(
+                self._enqueue_update, host="127.0.0.1", port=SHARD_PORT, path=WORKER_PATH,
+                secret_token=SHARD_SECRET or None
+            )
+        else:
+            self.webhook_listener = WebhookListener(
+                self._enqueue_update,
+                host=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                path=WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None
+            )
+        if SHARD_WORKER:
+            # Порт рабочего открыт только на 127.0.0.1: служебные маршруты — на нём же,
+            # остальные режимы отдают их на LOCAL_PORT (_post_init)
+            self.webhook_listener.add_route("/stats", self._dispatcher_stats_route)
+            if METRICS_ENABLED:
+                self.webhook_listener.add_route("/metrics", self._metrics_route)
+        
+        await self.application.start()
+        await self._post_init(self.application)
+        await self.dispatcher.start()
+        await self.webhook_listener.start()
+        
+        if SHARD_WORKER:
+            logger.info(f"Shard {SHARD_INDEX}/{SHARDS} ready on port {SHARD_PORT} ({UPDATE_WORKERS} workers)")
+        else:
+            # В отличие от polling, накопившиеся обновления не сбрасываем
+            await self.application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                allowed_updates=ALLOWED_UPDATES,
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=min(100, UPDATE_WORKERS * 4)
+            )
+            logger.info(f"Webhook set: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH} ({UPDATE_WORKERS} workers)")
+        
+        # SIGTERM (в том числе от входного процесса) — штатная остановка с записью диалогов
+        with suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, self._stop_event.set)
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.webhook_listener.stop()
+            await self.dispatcher.stop(drain=True)
+            await self.application.stop()
+            await self.application.shutdown()
+            await self._post_shutdown(self.application)
+    
     def _shutdown(self):
         """Корректное завершение работы бота"""
         logger.info("Останавливаем планировщики...")
         
         try:
-            birthday_scheduler.stop()
-            notification_scheduler.stop()
+            if self.notification_scheduler is not None:
+                self.notification_scheduler.stop()
         except Exception as e:
             logger.error(f"Ошибка при остановке планировщиков: {e}")
         
+        try:
+            loop = asyncio.get_event_loop()
+            if not loop.is_closed():
+                loop.run_until_complete(database.close())
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии пула соединений: {e}")
+        
         logger.info("Бот остановлен")
 
+async def run_shard_front():
+    """Входной процесс: приём обновлений и раздача их SHARDS рабочим процессам"""
+    front = ShardFront(SHARDS, SHARD_BASE_PORT, SHARD_SECRET or secrets.token_hex(16))
+    bot_urls = {}
+    if TELEGRAM_API_URL:
+        bot_urls = {"base_url": f"{TELEGRAM_API_URL}/bot", "base_file_url": f"{TELEGRAM_API_URL}/file/bot"}
+    bot = Bot(config.telegram_token, **bot_urls)
+    stop_event = asyncio.Event()
+    with suppress(NotImplementedError):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop_event.set)
+    
+    # Состояние шардов — только на служебном порту, не на публичном webhook
+    local_listener = None
+    if LOCAL_PORT:
+        local_listener = WebhookListener(None, host=LOCAL_LISTEN, port=LOCAL_PORT)
+        local_listener.add_route("/stats", lambda: ("application/json", json.dumps({"shards": front.stats()})))
+    
+    await front.start()
+    try:
+        if local_listener is not None:
+            await local_listener.start()
+        async with bot:
+            if WEBHOOK_URL:
+                listener = WebhookListener(
+                    front.route, host=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                    secret_token=WEBHOOK_SECRET or None
+                )
+                await listener.start()
+                await bot.set_webhook(
+                    url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                    allowed_updates=ALLOWED_UPDATES,
+                    secret_token=WEBHOOK_SECRET or None,
+                    max_connections=min(100, UPDATE_WORKERS * 4 * SHARDS)
+                )
+                logger.info(f"Webhook set: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH} ({SHARDS} shards)")
+                try:
+                    await stop_event.wait()
+                finally:
+                    await listener.stop()
+            else:
+                logger.info(f"Polling for {SHARDS} shards")
+                polling = asyncio.create_task(
+                    front.poll(bot, ALLOWED_UPDATES, drop_pending=DROP_PENDING_UPDATES)
+                )
+                stopping = asyncio.create_task(stop_event.wait())
+                await asyncio.wait([polling, stopping], return_when=asyncio.FIRST_COMPLETED)
+                for task in (polling, stopping):
+                    task.cancel()
+                await asyncio.gather(polling, stopping, return_exceptions=True)
+    finally:
+        if local_listener is not None:
+            await local_listener.stop()
+        await front.stop(drain=True)
+
 def main():
     """Главная функция"""
     print("=" * 60)
@@ -459,6 +991,13 @@ def main():
         print("Configure all necessary parameters")
         return
     
+    if SHARDS > 1 and not SHARD_WORKER:
+        try:
+            asyncio.run(run_shard_front())
+        except KeyboardInterrupt:
+            logger.info("🛑 Keyboard interrupt received - shard front stopped")
+        return
+    
     # Создаем и запускаем бота
     bot = LoyaltyBot()
     bot.run()
@@ -0,0 +1,12 @@
+-- Migration 008: Watermarks for streaming /export
+-- Incremental exports continue from the last exported row of each table
+
+CREATE TABLE IF NOT EXISTS export_state (
+  table_name VARCHAR(50) PRIMARY KEY,
+  last_key JSONB NOT NULL,
+  rows_exported BIGINT NOT NULL DEFAULT 0,
+  exported_at TIMESTAMP DEFAULT NOW()
+);
+
+-- Keyset pagination over changed clients
+CREATE INDEX IF NOT EXISTS idx_clients_updated_at_id ON clients(updated_at, id);
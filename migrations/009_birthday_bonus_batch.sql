@@ -0,0 +1,44 @@
+-- Migration 009: Set-based birthday bonuses
+-- Today's birthdays are found through an expression index instead of a full scan,
+-- and each client can receive the bonus at most once per year
+
+CREATE INDEX IF NOT EXISTS idx_clients_birthday_month_day
+  ON clients ((EXTRACT(MONTH FROM birth_date)), (EXTRACT(DAY FROM birth_date)))
+  WHERE is_active = true AND birth_date IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS birthday_bonus_awards (
+  client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+  year INTEGER NOT NULL,
+  points INTEGER NOT NULL,
+  awarded_at TIMESTAMP DEFAULT NOW(),
+  PRIMARY KEY (client_id, year)
+);
+
+-- Lookup of earlier birthday bonuses recorded only in point_transactions
+CREATE INDEX IF NOT EXISTS idx_point_transactions_bonus_client
+  ON point_transactions(client_id, created_at)
+  WHERE operation_type = 'bonus';
+
+-- Writers (the bot's set-based award, the TypeScript services) update balance,
+-- visit_count and last_visit themselves in the same transaction as the insert.
+-- The AFTER INSERT trigger keeps only total_spent, so a bonus is credited once
+CREATE OR REPLACE FUNCTION log_point_transaction()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE clients
+    SET total_spent = CASE
+            WHEN NEW.operation_type = 'spend' THEN COALESCE(total_spent, 0) + ABS(NEW.points)
+            WHEN NEW.operation_type = 'earn' AND NEW.amount IS NOT NULL THEN COALESCE(total_spent, 0) + NEW.amount
+            ELSE total_spent
+        END
+    WHERE id = NEW.client_id
+      AND NEW.operation_type IN ('spend', 'earn');
+
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS trigger_log_point_transaction ON point_transactions;
+CREATE TRIGGER trigger_log_point_transaction
+    AFTER INSERT ON point_transactions
+    FOR EACH ROW EXECUTE FUNCTION log_point_transaction();
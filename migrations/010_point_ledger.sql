@@ -0,0 +1,17 @@
+-- Migration 010: Idempotent point ledger
+-- Balance changes are applied by the writer in the same statement as the
+-- point_transactions insert (UPDATE ... RETURNING with a balance guard).
+-- The AFTER INSERT trigger from migration 009 stays: it only maintains
+-- clients.total_spent, for the ledger and the TypeScript services alike
+
+ALTER TABLE point_transactions ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(100);
+ALTER TABLE point_transactions ADD COLUMN IF NOT EXISTS balance_after INTEGER;
+
+-- A redelivered Telegram update carries the same key and is rejected as a whole
+CREATE UNIQUE INDEX IF NOT EXISTS idx_point_transactions_idempotency_key
+  ON point_transactions(idempotency_key)
+  WHERE idempotency_key IS NOT NULL;
+
+-- Balances can no longer go negative, whatever the writer
+ALTER TABLE clients DROP CONSTRAINT IF EXISTS clients_balance_non_negative;
+ALTER TABLE clients ADD CONSTRAINT clients_balance_non_negative CHECK (balance >= 0) NOT VALID;
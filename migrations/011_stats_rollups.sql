@@ -0,0 +1,49 @@
+-- Migration 011: Precomputed statistics rollups
+-- Hourly and daily summaries are filled by a catch-up job that only reads
+-- point_transactions / clients rows newer than the ids kept in stats_rollup_state.
+-- pending_id / pending_at hold a sequence value read while older transactions
+-- were still open; rows up to it are read once those transactions have ended
+
+CREATE TABLE IF NOT EXISTS stats_hourly (
+  hour TIMESTAMP PRIMARY KEY,
+  transactions INTEGER NOT NULL DEFAULT 0,
+  points_earned BIGINT NOT NULL DEFAULT 0,
+  points_spent BIGINT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+  new_clients INTEGER NOT NULL DEFAULT 0,
+  active_clients INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS stats_daily (
+  day DATE PRIMARY KEY,
+  transactions INTEGER NOT NULL DEFAULT 0,
+  points_earned BIGINT NOT NULL DEFAULT 0,
+  points_spent BIGINT NOT NULL DEFAULT 0,
+  revenue DECIMAL(14,2) NOT NULL DEFAULT 0,
+  new_clients INTEGER NOT NULL DEFAULT 0,
+  active_clients INTEGER NOT NULL DEFAULT 0
+);
+
+-- Which clients were active in each hour / day / week / month bucket
+CREATE TABLE IF NOT EXISTS stats_active_clients (
+  period VARCHAR(5) NOT NULL,
+  bucket TIMESTAMP NOT NULL,
+  client_id INTEGER NOT NULL,
+  PRIMARY KEY (period, bucket, client_id)
+);
+
+-- Distinct active clients for week and month buckets
+CREATE TABLE IF NOT EXISTS stats_active_totals (
+  period VARCHAR(5) NOT NULL,
+  bucket TIMESTAMP NOT NULL,
+  active_clients INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (period, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS stats_rollup_state (
+  name VARCHAR(50) PRIMARY KEY,
+  last_id BIGINT NOT NULL DEFAULT 0,
+  pending_id BIGINT,
+  pending_at TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,14 @@
+-- Migration 012: Persistent conversation state
+-- ConversationHandler states and user_data of the Python bot, written in
+-- batches by DatabasePersistence so half-finished dialogs survive restarts
+
+CREATE TABLE IF NOT EXISTS bot_persistence (
+  kind VARCHAR(64) NOT NULL,
+  key VARCHAR(100) NOT NULL,
+  data BYTEA NOT NULL,
+  updated_at TIMESTAMP NOT NULL,
+  PRIMARY KEY (kind, key)
+);
+
+-- Expiry of abandoned conversations
+CREATE INDEX IF NOT EXISTS idx_bot_persistence_updated_at ON bot_persistence(updated_at);
@@ -0,0 +1,15 @@
+-- Migration 013: Keyset pagination of the client list
+-- One index per sort option; expressions match ClientListing.SORTS so each
+-- page is an index range scan regardless of how deep it is
+
+CREATE INDEX IF NOT EXISTS idx_clients_list_last_visit
+  ON clients ((COALESCE(last_visit, '1970-01-01')), id)
+  WHERE is_active = true;
+
+CREATE INDEX IF NOT EXISTS idx_clients_list_balance
+  ON clients (balance, id)
+  WHERE is_active = true;
+
+CREATE INDEX IF NOT EXISTS idx_clients_list_full_name
+  ON clients (full_name, id)
+  WHERE is_active = true;
@@ -0,0 +1,5 @@
+-- Migration 014: Materialized client segments
+-- Rule text for broadcasts with segment = 'custom' (evaluated by SegmentIndex)
+-- (changed clients are picked up through idx_clients_updated_at_id from migration 008)
+
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS segment_rule TEXT;
@@ -0,0 +1,39 @@
+-- Migration 015: Point lots for points_expiry_days
+-- Every credit in point_transactions becomes a lot with its own expiry date,
+-- debits consume the oldest open lots first (FIFO). Lots are filled by a
+-- catch-up job that reads only transactions newer than point_lot_state.last_id
+-- and not past the committed-id horizon (pending_id / pending_at, as in
+-- stats_rollup_state); the nightly expiry reads only lots due that day through idx_point_lots_expiry
+
+CREATE TABLE IF NOT EXISTS point_lots (
+  id BIGSERIAL PRIMARY KEY,
+  client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+  transaction_id INTEGER NOT NULL,
+  points INTEGER NOT NULL,
+  remaining INTEGER NOT NULL CHECK (remaining >= 0),
+  earned_at TIMESTAMP NOT NULL,
+  expires_at DATE,
+  expired_at TIMESTAMP
+);
+
+-- Open lots of a client in FIFO order
+CREATE INDEX IF NOT EXISTS idx_point_lots_open
+  ON point_lots(client_id, id)
+  WHERE remaining > 0;
+
+-- Lots due for expiry
+CREATE INDEX IF NOT EXISTS idx_point_lots_expiry
+  ON point_lots(expires_at)
+  WHERE remaining > 0 AND expires_at IS NOT NULL;
+
+-- Skipping transactions newer than the lot watermark during expiry
+CREATE INDEX IF NOT EXISTS idx_point_transactions_client_tx
+  ON point_transactions(client_id, id);
+
+CREATE TABLE IF NOT EXISTS point_lot_state (
+  name VARCHAR(50) PRIMARY KEY,
+  last_id BIGINT NOT NULL DEFAULT 0,
+  pending_id BIGINT,
+  pending_at TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
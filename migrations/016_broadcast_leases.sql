@@ -0,0 +1,8 @@
+-- Migration 016: Broadcast leases
+-- The Python broadcast engine claims a broadcast by setting lease_owner and
+-- lease_until and renews the lease after every batch. Only broadcasts whose
+-- lease has expired are resumed, so a broadcast the admin panel is still
+-- sending (status 'sending', no lease) is never picked up a second time
+
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS lease_owner VARCHAR(64);
+ALTER TABLE broadcasts ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP;
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+"""
+Построение партий баллов по всей истории point_transactions
+
+По умолчанию партии строятся заново; с --catch-up учитываются только
+транзакции после последнего прохода. --not-before задаёт самую раннюю
+дату сгорания для партий, срок которых по истории уже прошёл (иначе
+они сгорят в первую же ночь после включения).
+
+Запуск: python scripts/backfill_point_lots.py [--catch-up] [--not-before 2026-12-01] [--batch 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.utils.database import database
+from src.utils.point_lots import CATCH_UP_BATCH, PointLots
+
+
+async def run(args):
+    await database.open()
+    try:
+        lots = PointLots(database, batch_size=args.batch)
+        started = time.perf_counter()
+        if args.catch_up:
+            processed = await lots.catch_up()
+        else:
+            processed = await lots.backfill(not_before=args.not_before)
+        print(f"Processed {processed} transactions in {time.perf_counter() - started:.1f} s")
+    finally:
+        await database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--catch-up", action="store_true", help="только новые транзакции")
+    parser.add_argument("--not-before", type=date.fromisoformat, help="самая ранняя дата сгорания, YYYY-MM-DD")
+    parser.add_argument("--batch", type=int, default=CATCH_UP_BATCH)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
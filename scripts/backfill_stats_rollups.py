@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+Заполнение сводок статистики по всей истории операций
+
+По умолчанию сводки пересчитываются с нуля; с --catch-up учитываются
+только транзакции и регистрации после последнего прохода.
+
+Запуск: python scripts/backfill_stats_rollups.py [--catch-up] [--batch 20000]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.utils.database import database
+from src.utils.stats_rollups import CATCH_UP_BATCH, StatsRollups
+
+
+async def run(args):
+    await database.open()
+    try:
+        rollups = StatsRollups(database, batch_size=args.batch)
+        started = time.perf_counter()
+        if args.catch_up:
+            processed = await rollups.catch_up()
+        else:
+            processed = await rollups.backfill()
+        print(f"Processed {processed} rows in {time.perf_counter() - started:.1f} s")
+    finally:
+        await database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--catch-up", action="store_true", help="только новые транзакции")
+    parser.add_argument("--batch", type=int, default=CATCH_UP_BATCH)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
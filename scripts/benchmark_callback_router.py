@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""
+Микробенчмарк маршрутизации callback_data
+
+Сравнивает прежнюю схему (последовательный перебор regex-обработчиков и
+цепочка if/elif с пересборкой словаря) с CallbackRouter при сотнях
+видов callback-запросов.
+
+Запуск: python scripts/benchmark_callback_router.py [--kinds 400] [--calls 200000]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.callback_router import CallbackRouter
+
+
+def build_legacy(exact_kinds, prefix_kinds):
+    """Модель текущего стека: regex-обработчики по порядку, затем if/elif"""
+    regexes = [re.compile(f"^{prefix}") for prefix in prefix_kinds[: len(prefix_kinds) // 2]]
+    regexes.append(re.compile("^(" + "|".join(exact_kinds[:7]) + ")$"))
+    ladder_exact = exact_kinds[7:]
+    ladder_prefixes = prefix_kinds[len(prefix_kinds) // 2:]
+
+    def dispatch(data):
+        for regex in regexes:
+            if regex.match(data):
+                return regex
+        # Аналог _general_callback_handler: линейные сравнения и startswith
+        for kind in ladder_exact:
+            if data == kind:
+                command_map = {"start_add_points": "/add_points", "start_spend_points": "/spend_points",
+                               "start_purchase": "/purchase"}
+                return command_map.get(data, kind)
+        for prefix in ladder_prefixes:
+            if data.startswith(prefix):
+                return prefix
+        return None
+
+    return dispatch
+
+
+def build_router(exact_kinds, prefix_kinds):
+    async def handler(update, context, **kwargs):
+        return None
+
+    router = CallbackRouter()
+    for kind in exact_kinds:
+        router.exact(kind, handler)
+    for prefix in prefix_kinds:
+        router.pattern(prefix + "{item_id:int}", handler)
+    return router.resolve
+
+
+def measure(dispatch, samples, calls):
+    started = time.perf_counter()
+    for index in range(calls):
+        dispatch(samples[index % len(samples)])
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--kinds", type=int, default=400, help="количество видов callback_data")
+    parser.add_argument("--calls", type=int, default=200000, help="количество вызовов на замер")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    exact_kinds = [f"menu_item_{i}" for i in range(args.kinds // 2)]
+    prefix_kinds = [f"action_{i}_" for i in range(args.kinds - len(exact_kinds))]
+    samples = [rng.choice(exact_kinds) for _ in range(500)]
+    samples += [f"{rng.choice(prefix_kinds)}{rng.randint(1, 100000)}" for _ in range(500)]
+    rng.shuffle(samples)
+
+    legacy = build_legacy(exact_kinds, prefix_kinds)
+    router = build_router(exact_kinds, prefix_kinds)
+
+    # Результаты маршрутизации должны совпадать по факту наличия маршрута
+    assert all((legacy(s) is None) == (router(s) is None) for s in samples)
+
+    legacy_ns = measure(legacy, samples, args.calls)
+    router_ns = measure(router, samples, args.calls)
+
+    print(f"Callback kinds:   {args.kinds}")
+    print(f"Legacy stack:     {legacy_ns:10.0f} ns/dispatch")
+    print(f"CallbackRouter:   {router_ns:10.0f} ns/dispatch")
+    print(f"Speed-up:         {legacy_ns / router_ns:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк постраничного списка клиентов
+
+Сравнивает время открытия страницы на разной глубине для keyset-курсора
+(ClientListing) и прежнего подхода с OFFSET на SQLite-базе с индексами
+из миграции 013.
+
+Запуск: python scripts/benchmark_client_listing.py [--clients 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.client_listing import SORTS, ClientListing, Cursor
+from src.utils.database import SQLiteConnection
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, card_number TEXT, full_name TEXT, balance INTEGER, last_visit TIMESTAMP,
+  is_active INTEGER
+);
+"""
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'migrations', '013_client_listing_indexes.sql')
+NAMES = ["Иванов", "Смирнова", "Кузнецов", "Попова", "Васильев", "Петрова", "Соколов", "Михайлова"]
+
+
+async def timed(call, repeats=20):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args):
+    rng = random.Random(1)
+    connection = SQLiteConnection()
+    with open(MIGRATION, encoding="utf-8") as migration:
+        connection.script(SCHEMA + migration.read())
+    connection.db.executemany(
+        "INSERT INTO clients VALUES (?, ?, ?, ?, ?, 1)",
+        (
+            (i, f"RC{i:06d}", f"{rng.choice(NAMES)} {i}", rng.randint(0, 5000),
+             None if rng.random() < 0.1 else f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00")
+            for i in range(1, args.clients + 1)
+        ),
+    )
+    connection.db.commit()
+
+    # Без кэша: измеряем сам запрос страницы
+    listing = ClientListing(page_size=args.page_size, ttl=0)
+    print(f"Clients: {args.clients:,}".replace(",", " "))
+    for sort, option in SORTS.items():
+        order = "ASC" if option.ascending else "DESC"
+        ordered = connection.db.execute(
+            f"SELECT id FROM clients WHERE is_active = true ORDER BY {option.expression} {order}, id {order}"
+        ).fetchall()
+        for fraction in (0.0, 0.5, 0.99):
+            position = int(len(ordered) * fraction)
+            page_number = position // args.page_size + 1
+            anchor = ordered[position - 1][0] if position else None
+            cursor = Cursor(sort, True, page_number, anchor)
+            keyset = await timed(lambda: listing.page(connection, cursor))
+            offset_sql = (
+                f"SELECT id, card_number, full_name, balance, last_visit FROM clients WHERE is_active = true "
+                f"ORDER BY {option.expression} {order}, id {order} LIMIT $1 OFFSET $2"
+            )
+            offset = await timed(lambda: connection.fetch(offset_sql, args.page_size, position))
+            print(f"{option.title:12s} page {page_number:6d}   keyset {keyset:6.3f} ms   offset {offset:8.3f} ms")
+
+    cached = ClientListing(page_size=args.page_size)
+    first = await cached.page(connection, Cursor())
+    await cached.page(connection, first.next_cursor())
+    flip = await timed(lambda: cached.page(connection, first.next_cursor()), repeats=1000)
+    print(f"Cached page flip: {flip * 1000:.1f} µs")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк индекса поиска клиентов
+
+Строит ClientSearchIndex по синтетической базе и измеряет время типичных
+запросов /search: последние цифры телефона, префикс карты, часть имени.
+
+Запуск: python scripts/benchmark_search_index.py [--clients 100000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.search_index import ClientSearchIndex
+
+FIRST_NAMES = ["Иван", "Пётр", "Алексей", "Сергей", "Дмитрий", "Андрей", "Михаил", "Артём", "Ольга",
+               "Елена", "Наталья", "Анна", "Мария", "Татьяна", "Юлия", "Алёна", "Ксения", "Фёдор"]
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров",
+              "Павлов", "Козлов", "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин"]
+
+
+def synthetic_clients(count, rng):
+    for client_id in range(1, count + 1):
+        first = rng.choice(FIRST_NAMES)
+        last = rng.choice(LAST_NAMES)
+        if first[-1] in "аяи":
+            last += "а"
+        yield {
+            "id": client_id,
+            "full_name": f"{last} {first}",
+            "phone": f"+7{rng.randint(9000000000, 9999999999)}",
+            "card_number": f"RC{client_id:06d}",
+        }
+
+
+def measure(index, queries, rounds=3):
+    timings = []
+    for _ in range(rounds):
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--clients", type=int, default=100000, help="размер синтетической базы")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    rows = list(synthetic_clients(args.clients, rng))
+
+    index = ClientSearchIndex()
+    started = time.perf_counter()
+    index.build(rows)
+    build_s = time.perf_counter() - started
+
+    sample = rng.sample(rows, 200)
+    workloads = {
+        "phone, last 4 digits": [row["phone"][-4:] for row in sample],
+        "phone, full number": [row["phone"] for row in sample],
+        "card prefix": [row["card_number"][:6] for row in sample],
+        "partial name": [row["full_name"].split()[0][:5].lower() for row in sample],
+        "full name, е instead of ё": [row["full_name"].replace("ё", "е") for row in sample],
+        "name with typo": [row["full_name"][:-1] + "ы" for row in sample],
+    }
+
+    started = time.perf_counter()
+    index.add({"id": args.clients + 1, "full_name": "Тестов Тест", "phone": "+79990001122", "card_number": "RCX"})
+    index.remove(args.clients + 1)
+    update_ms = (time.perf_counter() - started) * 1000
+
+    print(f"Clients:            {len(index)}")
+    print(f"Build time:         {build_s:.2f} s")
+    print(f"Add + remove:       {update_ms:.3f} ms")
+    for name, queries in workloads.items():
+        p50, p99 = measure(index, queries)
+        print(f"{name:28s} p50 {p50:7.3f} ms   p99 {p99:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк сегментов рассылок: материализованный индекс против запросов к clients
+
+Заполняет SQLite-базу синтетическими клиентами, загружает SegmentIndex и
+сравнивает подсчёт получателей и выборку пачки id для рассылки с
+запросами по таблице clients. Отдельно замеряются догрузка изменённых
+клиентов, построение сегмента по своему правилу и занимаемая память.
+
+Запуск: python scripts/benchmark_segments.py [--clients 200000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.database import SQLiteDatabase
+from src.utils.segments import SegmentIndex
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, telegram_id INTEGER, birth_date DATE, balance INTEGER DEFAULT 0,
+  total_spent NUMERIC DEFAULT 0, visit_count INTEGER DEFAULT 0, last_visit TIMESTAMP,
+  is_active BOOLEAN DEFAULT 1, updated_at TIMESTAMP
+);
+CREATE INDEX idx_clients_updated_at_id ON clients(updated_at, id);
+"""
+
+ELIGIBLE = "is_active = 1 AND telegram_id IS NOT NULL"
+SQL_FILTERS = {
+    "all": "1 = 1",
+    "active": "last_visit >= $1",
+    "vip": "total_spent >= 10000",
+    "birthday": "strftime('%m-%d', birth_date) = strftime('%m-%d', $1)",
+}
+CUSTOM_RULE = "visit_count >= 5 and days_since_visit > 60 and total_spent < 3000"
+
+
+def populate(connection, clients, today, rng):
+    moment = datetime.combine(today, datetime.min.time())
+
+    def rows():
+        for client_id in range(1, clients + 1):
+            visits = rng.randrange(0, 40)
+            yield (
+                client_id,
+                None if rng.random() < 0.05 else 1_000_000 + client_id,
+                date(1970 + rng.randrange(40), rng.randrange(1, 13), rng.randrange(1, 29)),
+                rng.randrange(0, 2000),
+                rng.randrange(0, 30000),
+                visits,
+                moment - timedelta(days=rng.randrange(0, 365)) if visits else None,
+                rng.random() > 0.02,
+                moment - timedelta(days=1),
+            )
+
+    connection.db.executemany("INSERT INTO clients VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows())
+    connection.db.commit()
+
+
+async def timed(call, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = call()
+        if asyncio.iscoroutine(result):
+            await result
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args):
+    rng = random.Random(42)
+    today = date.today()
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteDatabase(os.path.join(directory, "segments.db"))
+        await db.open()
+        db.connection.script(SCHEMA)
+
+        started = time.perf_counter()
+        populate(db.connection, args.clients, today, rng)
+        print(f"Clients:        {args.clients:,}".replace(",", " "))
+        print(f"Populate:       {time.perf_counter() - started:.1f} s")
+
+        index = SegmentIndex()
+        async with db.acquire() as connection:
+            started = time.perf_counter()
+            await index.load(connection, today)
+            print(f"Load + build:   {time.perf_counter() - started:.2f} s")
+
+            active_since = datetime.combine(today - timedelta(days=30), datetime.min.time())
+            for segment, condition in SQL_FILTERS.items():
+                count_sql = f"SELECT COUNT(*) FROM clients WHERE {ELIGIBLE} AND {condition}"
+                batch_sql = f"SELECT id FROM clients WHERE {ELIGIBLE} AND {condition} ORDER BY id LIMIT 500"
+                params = {"active": (active_since,), "birthday": (today,)}.get(segment, ())
+                sql_count = await timed(lambda: connection.fetchval(count_sql, *params), args.repeats)
+                sql_batch = await timed(lambda: connection.fetch(batch_sql, *params), args.repeats)
+                mem_count = await timed(lambda: index.count(segment), args.repeats)
+                mem_batch = await timed(lambda: index.members(segment, limit=500), args.repeats)
+                print(
+                    f"{segment:9s} {index.count(segment):7d} recipients   "
+                    f"count sql {sql_count:7.2f} ms / index {mem_count:6.3f} ms   "
+                    f"batch of 500 sql {sql_batch:7.2f} ms / index {mem_batch:6.3f} ms"
+                )
+
+            started = time.perf_counter()
+            recipients = sum(1 for _ in index.members("all"))
+            print(f"Iterate all {recipients} recipient ids: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            started = time.perf_counter()
+            await index.prepare(CUSTOM_RULE)
+            print(f"Custom rule build: {(time.perf_counter() - started) * 1000:.1f} ms "
+                  f"({index.count('custom', CUSTOM_RULE)} recipients)")
+            custom = await timed(lambda: index.count("custom", CUSTOM_RULE), args.repeats)
+            print(f"Custom rule count (cached): {custom:.3f} ms")
+
+            # Догрузка: 1000 клиентов отметили визит после загрузки индекса
+            changed = rng.sample(range(1, args.clients + 1), 1000)
+            now = datetime.now()
+            for client_id in changed:
+                await connection.execute(
+                    "UPDATE clients SET visit_count = visit_count + 1, total_spent = total_spent + 500, "
+                    "last_visit = $2, updated_at = $2 WHERE id = $1", client_id, now
+                )
+            started = time.perf_counter()
+            refreshed = await index.refresh(connection, today)
+            print(f"Refresh of {refreshed} changed clients: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+            started = time.perf_counter()
+            await index.refresh(connection, today + timedelta(days=1))
+            print(f"Day rollover rebuild: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        print(f"Index memory:   {index.stats()['bytes'] / 1024 / 1024:.2f} MiB")
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
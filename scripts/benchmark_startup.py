@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк запуска бота: время до первого ответа
+
+Поднимает имитацию Bot API на локальном порту, запускает бота отдельным
+процессом (TELEGRAM_API_URL указывает на имитацию, база — SQLite в
+памяти) и отправляет ему /test_db от администратора первым же ответом на
+getUpdates. Замеряется время от старта процесса до начала polling
+(первый getUpdates) и до первого ответа (sendMessage) — в режиме
+FAST_STARTUP и в прежнем порядке запуска.
+
+Запуск: python scripts/benchmark_startup.py [--runs 5]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import sys
+import time
+
+from fake_bot_api import FakeBotApi
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TOKEN = "123456:BENCHMARK"
+ADMIN_ID = 1000
+
+
+def _first_update():
+    text = "/test_db"
+    return {
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": int(time.time()), "text": text,
+            "chat": {"id": ADMIN_ID, "type": "private"},
+            "from": {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+async def measure(fast: bool, timeout: float) -> dict:
+    api = FakeBotApi()
+    api.updates.put_nowait(_first_update())
+    await api.start()
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_ADMIN_ID=str(ADMIN_ID),
+        TELEGRAM_API_URL=api.url,
+        DATABASE_URL="sqlite:///:memory:",
+        FAST_STARTUP="true" if fast else "false",
+        LOG_LEVEL="WARNING",
+    )
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", "import main; main.LoyaltyBot().run()",
+        cwd=ROOT, env=env, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+    )
+    replied = asyncio.create_task(api.replied.wait())
+    exited = asyncio.create_task(process.wait())
+    try:
+        await asyncio.wait({replied, exited}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if not api.replied.is_set():
+            error = (await process.stderr.read()).decode(errors="replace") if exited.done() else ""
+            raise RuntimeError(f"Bot did not respond within {timeout:.0f}s\n{error[-2000:]}")
+    finally:
+        replied.cancel()
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(exited, 10)
+            except asyncio.TimeoutError:
+                process.kill()
+        await api.stop()
+    return {event: (moment - started) * 1000 for event, moment in api.events.items()}
+
+
+async def main(runs: int, timeout: float):
+    for fast in (False, True):
+        results = [await measure(fast, timeout) for _ in range(runs)]
+        mode = "FAST_STARTUP " if fast else "eager        "
+        polling = statistics.median(result["getUpdates"] for result in results)
+        response = statistics.median(result["sendMessage"] for result in results)
+        print(f"{mode} polling started {polling:8.1f} ms   first response {response:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs, args.timeout))
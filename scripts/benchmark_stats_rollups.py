@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Бенчмарк экранов статистики: сводки против агрегатов по point_transactions
+
+Заполняет SQLite-базу синтетическими транзакциями за год, строит сводки
+и сравнивает время получения данных для экранов «сегодня», «неделя» и
+«месяц» с прежним запросом по всей таблице (как в PointService.getTotalStats).
+
+Запуск: python scripts/benchmark_stats_rollups.py [--transactions 1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.utils.database import SQLiteDatabase
+from src.utils.stats_rollups import StatsRollups, period_range
+
+SCHEMA = """
+CREATE TABLE clients (id INTEGER PRIMARY KEY, created_at TIMESTAMP);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT, points INTEGER,
+  amount NUMERIC, created_at TIMESTAMP
+);
+CREATE INDEX idx_point_transactions_created_at ON point_transactions(created_at);
+"""
+
+LEGACY_SQL = """
+SELECT
+  COALESCE(SUM(CASE WHEN operation_type = 'earn' THEN points ELSE 0 END), 0) AS points_earned,
+  COALESCE(SUM(CASE WHEN operation_type = 'spend' THEN ABS(points) ELSE 0 END), 0) AS points_spent,
+  COALESCE(SUM(CASE WHEN operation_type = 'earn' THEN amount ELSE 0 END), 0) AS revenue,
+  COUNT(*) AS transactions,
+  COUNT(DISTINCT client_id) AS active_clients
+FROM point_transactions
+WHERE DATE(created_at) >= DATE($1) AND DATE(created_at) <= DATE($2)
+"""
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'migrations', '011_stats_rollups.sql')
+
+
+def populate(connection, transactions, clients, today, rng):
+    start = datetime.combine(today - timedelta(days=364), datetime.min.time())
+    connection.db.executemany(
+        "INSERT INTO clients (id, created_at) VALUES (?, ?)",
+        ((i, start + timedelta(minutes=rng.randrange(365 * 24 * 60))) for i in range(1, clients + 1))
+    )
+    moments = sorted(rng.randrange(365 * 24 * 3600) for _ in range(transactions))
+
+    def rows():
+        for second in moments:
+            points = rng.randint(1, 50)
+            if rng.random() < 0.7:
+                yield rng.randint(1, clients), 1, "earn", points, points * 10, start + timedelta(seconds=second)
+            else:
+                yield rng.randint(1, clients), 1, "spend", -points, None, start + timedelta(seconds=second)
+
+    connection.db.executemany(
+        "INSERT INTO point_transactions (client_id, operator_id, operation_type, points, amount, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)", rows()
+    )
+    connection.db.commit()
+
+
+async def timed(call, repeats):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        await call()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def run(args):
+    rng = random.Random(42)
+    today = date.today()
+    with tempfile.TemporaryDirectory() as directory:
+        db = SQLiteDatabase(os.path.join(directory, "stats.db"))
+        await db.open()
+        with open(MIGRATION, encoding="utf-8") as migration:
+            db.connection.script(SCHEMA + migration.read())
+
+        started = time.perf_counter()
+        populate(db.connection, args.transactions, args.clients, today, rng)
+        print(f"Transactions:   {args.transactions:,}".replace(",", " "))
+        print(f"Populate:       {time.perf_counter() - started:.1f} s")
+
+        rollups = StatsRollups(db)
+        started = time.perf_counter()
+        await rollups.catch_up()
+        print(f"Backfill:       {time.perf_counter() - started:.1f} s")
+
+        for period in ("day", "week", "month"):
+            first, last = period_range(period, today)
+            legacy = await timed(lambda: db.fetchrow(LEGACY_SQL, first, last), args.repeats)
+            rollup = await timed(lambda: rollups.summary(period, today), args.repeats)
+            print(f"{period:6s} legacy {legacy:9.2f} ms   rollups {rollup:7.3f} ms   x{legacy / rollup:,.0f}")
+
+        # Стоимость свежести: догнать одну новую операцию перед показом экрана
+        db.connection.db.execute(
+            "INSERT INTO point_transactions (client_id, operator_id, operation_type, points, amount, created_at) "
+            "VALUES (1, 1, 'earn', 10, 100, ?)", (datetime.now(),)
+        )
+        db.connection.db.commit()
+        catch_up = await timed(rollups.catch_up, 1)
+        print(f"Catch-up of one new transaction: {catch_up:.2f} ms")
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transactions", type=int, default=1_000_000)
+    parser.add_argument("--clients", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Имитация Telegram Bot API для бенчмарков и нагрузочных тестов
+
+Отвечает на запросы бота по HTTP на локальном порту: getMe, getUpdates
+из очереди updates, sendMessage / editMessageText с правдоподобным
+сообщением, остальное — True. Бот подключается к ней через
+TELEGRAM_API_URL. latency добавляет задержку к каждому ответу, как у
+настоящего Bot API.
+"""
+
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Rock Coffee", "username": "rock_coffee_bot"}
+
+# Методы, которые возвращают отправленное или изменённое сообщение
+MESSAGE_METHODS = ("sendMessage", "editMessageText", "editMessageReplyMarkup", "sendDocument", "sendPhoto")
+
+
+class FakeBotApi:
+    """Минимальная имитация Bot API"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.calls: Counter = Counter()
+        self.events = {}
+        self.replied = asyncio.Event()
+        self._message_id = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def _mark(self, event: str):
+        self.events.setdefault(event, time.perf_counter())
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method = request_line.decode("latin-1").split()[1].rsplit("/", 1)[-1]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length") or 0))
+                params = {}
+                if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+                    params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                result = await self._result(method, params)
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _result(self, method: str, params: dict):
+        self._mark(method)
+        self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return await self._next_updates(min(float(params.get("timeout", 1)), 1.0))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in MESSAGE_METHODS:
+            self.replied.set()
+            return self._message(params)
+        return True
+
+    async def _next_updates(self, timeout: float):
+        try:
+            updates = [await asyncio.wait_for(self.updates.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        while not self.updates.empty():
+            updates.append(self.updates.get_nowait())
+        return updates
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        try:
+            chat_id = int(params.get("chat_id", 0))
+        except ValueError:
+            chat_id = 0
+        return {
+            "message_id": int(params.get("message_id", self._message_id)), "date": int(time.time()),
+            "text": params.get("text", ""), "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER,
+        }
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+"""
+Нагрузочный тест: сколько бариста и клиентов выдерживает один процесс бота
+
+Собирает Application из LoyaltyBot в этом процессе (обработчики, пул базы,
+метрики) против имитации Bot API и прогоняет обновления через
+ChatOrderedDispatcher — так же, как в режиме webhook, только без HTTP.
+Фоновые задачи бота (рассылки, индексы, дни рождения) не запускаются.
+
+Виртуальные пользователи работают по замкнутому циклу: шаг сценария,
+ожидание обработки, пауза --think. Бариста проводят покупки (/purchase),
+клиенты смотрят /start и /balance, менеджеры открывают экраны
+статистики; каждые --burst-interval секунд приходит волна регистраций.
+
+В отчёте — пропускная способность, задержка обработки обновления (p50/p99)
+по шагам сценариев и по обработчикам, число запросов к базе на вызов.
+--output сохраняет результат в JSON, --baseline сравнивает с прошлым
+запуском и завершается с кодом 1 при регрессии.
+
+База берётся из DATABASE_URL (отдельная база с применёнными миграциями).
+Синтетические сотрудники и клиенты получают telegram_id от LOAD_ID_BASE
+и удаляются после прогона (кроме --keep); сводки статистики не
+откатываются, поэтому запускать лучше на тестовой базе.
+
+Запуск: python scripts/load_test.py [--duration 60] [--baristas 20] [--active-clients 200]
+        [--output after.json] [--baseline before.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from telegram import Update
+
+from fake_bot_api import BOT_USER, FakeBotApi
+from src.utils.dispatcher import ChatOrderedDispatcher, chat_key
+from src.utils.metrics import handler_metrics
+
+LOAD_ID_BASE = 7_000_000_000
+PHONE_BASE = 79_990_000_000
+TOKEN = "123456:LOADTEST"
+STATS_CALLBACKS = ("stats_today", "stats_week", "stats_month", "stats_hours")
+# Разница p99 меньше этой не считается регрессией: шум измерения
+NOISE_MS = 2.0
+
+SEED_USERS_SQL = """
+INSERT INTO users (telegram_id, full_name, role) VALUES ($1, $2, $3)
+ON CONFLICT (telegram_id) DO NOTHING
+"""
+
+SEED_CLIENTS_SQL = """
+INSERT INTO clients (telegram_id, card_number, full_name, phone, balance) VALUES ($1, $2, $3, $4, $5)
+ON CONFLICT (telegram_id) DO NOTHING
+"""
+
+CLEANUP_SQL = (
+    "DELETE FROM point_transactions WHERE client_id IN (SELECT id FROM clients WHERE telegram_id >= $1) "
+    "OR operator_id IN (SELECT id FROM users WHERE telegram_id >= $1)",
+    "DELETE FROM activity_log WHERE user_id IN (SELECT id FROM users WHERE telegram_id >= $1)",
+    "DELETE FROM clients WHERE telegram_id >= $1",
+    "DELETE FROM users WHERE telegram_id >= $1",
+)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class UpdateFactory:
+    """JSON обновлений Telegram от имени синтетических пользователей"""
+
+    def __init__(self):
+        self._update_id = itertools.count(1)
+        self._message_id = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"Load {user_id - LOAD_ID_BASE}"}
+
+    def message(self, user_id: int, text: str) -> dict:
+        message = {
+            "message_id": next(self._message_id), "date": int(time.time()), "text": text,
+            "chat": {"id": user_id, "type": "private"}, "from": self._user(user_id),
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": next(self._update_id), "message": message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id = next(self._update_id)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id), "from": self._user(user_id), "chat_instance": str(user_id), "data": data,
+                "message": {
+                    "message_id": next(self._message_id), "date": int(time.time()), "text": "…",
+                    "chat": {"id": user_id, "type": "private"}, "from": BOT_USER,
+                },
+            },
+        }
+
+
+class LoadTest:
+    """Бот в этом процессе, виртуальные пользователи и сбор задержек"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.factory = UpdateFactory()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.processed = 0
+        self.stopping = asyncio.Event()
+        self.api = FakeBotApi(latency=args.telegram_latency / 1000)
+        self.bot = None
+        self.clients: List[Tuple[int, str]] = []
+        self._registration_ids = itertools.count(LOAD_ID_BASE + 500_000)
+
+    # --- окружение ---
+
+    async def start(self):
+        await self.api.start()
+        os.environ.update(
+            TELEGRAM_BOT_TOKEN=os.getenv("TELEGRAM_BOT_TOKEN", TOKEN),
+            TELEGRAM_API_URL=self.api.url,
+            # Конкурентная обработка, как в режиме webhook
+            WEBHOOK_URL="https://load-test.invalid",
+            UPDATE_WORKERS=str(self.args.workers),
+            METRICS_ENABLED="true",
+            FAST_STARTUP="false",
+        )
+        # main читает переменные окружения при импорте
+        import main
+
+        self.main = main
+        self.bot = main.LoyaltyBot()
+        await self.bot._initialize_bot()
+        await self.seed()
+        await self.bot.application.start()
+        self.bot.dispatcher = ChatOrderedDispatcher(workers=self.args.workers, max_pending=self.args.max_pending)
+        await self.bot.dispatcher.start()
+
+    async def stop(self):
+        await self.bot.dispatcher.stop(drain=True)
+        await self.bot.application.stop()
+        if not self.args.keep:
+            await self.cleanup()
+        await self.bot.application.shutdown()
+        await self.main.database.close()
+        await self.api.stop()
+
+    async def seed(self):
+        database = self.main.database
+        staff = (
+            [(LOAD_ID_BASE + i, f"Load barista {i}", "barista") for i in range(1, self.args.baristas + 1)]
+            + [(LOAD_ID_BASE + 1000 + i, f"Load manager {i}", "manager") for i in range(1, self.args.managers + 1)]
+        )
+        self.clients = [
+            (LOAD_ID_BASE + 100_000 + i, f"+{PHONE_BASE + i}") for i in range(1, self.args.clients + 1)
+        ]
+        async with database.acquire() as connection:
+            await connection.executemany(SEED_USERS_SQL, staff)
+            await connection.executemany(
+                SEED_CLIENTS_SQL,
+                [(telegram_id, f"LT{telegram_id - LOAD_ID_BASE:08d}", f"Load client {i}", phone, 500)
+                 for i, (telegram_id, phone) in enumerate(self.clients, 1)]
+            )
+
+    async def cleanup(self):
+        async with self.main.database.acquire() as connection:
+            for sql in CLEANUP_SQL:
+                await connection.execute(sql, LOAD_ID_BASE)
+
+    # --- обработка ---
+
+    async def send(self, label: str, payload: dict) -> float:
+        """Обновление через диспетчер; ждёт окончания обработки"""
+        application = self.bot.application
+        update = Update.de_json(payload, application.bot)
+        done = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+
+        async def job():
+            try:
+                await application.process_update(update)
+            finally:
+                if not done.done():
+                    done.set_result(time.perf_counter() - started)
+
+        await self.bot.dispatcher.submit(chat_key(update), job)
+        elapsed = await done
+        self.latencies[label].append(elapsed * 1000)
+        self.processed += 1
+        return elapsed
+
+    async def think(self):
+        await asyncio.sleep(self.rng.expovariate(1000 / self.args.think) if self.args.think else 0)
+
+    # --- сценарии ---
+
+    async def barista(self, user_id: int):
+        while not self.stopping.is_set():
+            _, phone = self.rng.choice(self.clients)
+            amount = self.rng.randrange(150, 900, 10)
+            steps = [
+                ("purchase: /purchase", self.factory.message(user_id, "/purchase")),
+                ("purchase: client", self.factory.message(user_id, phone)),
+                ("purchase: amount", self.factory.message(user_id, str(amount))),
+                ("purchase: points", self.factory.message(user_id, "0")),
+                ("purchase: confirm", self.factory.message(user_id, "да")),
+            ]
+            for label, payload in steps:
+                await self.send(label, payload)
+                await self.think()
+
+    async def client(self, user_id: int):
+        while not self.stopping.is_set():
+            command = "/balance" if self.rng.random() < 0.7 else "/start"
+            await self.send(f"client: {command}", self.factory.message(user_id, command))
+            await self.think()
+
+    async def manager(self, user_id: int):
+        while not self.stopping.is_set():
+            data = self.rng.choice(STATS_CALLBACKS)
+            await self.send(f"stats: {data}", self.factory.callback(user_id, data))
+            await self.think()
+
+    async def register(self, user_id: int):
+        number = user_id - LOAD_ID_BASE
+        steps = [
+            ("register: /start", self.factory.message(user_id, "/start")),
+            ("register: register_self", self.factory.callback(user_id, "register_self")),
+            ("register: name", self.factory.message(user_id, f"Load Guest {number}")),
+            ("register: phone", self.factory.message(user_id, f"+{PHONE_BASE + number}")),
+            ("register: birth date", self.factory.message(user_id, f"{number % 28 + 1:02d}.0{number % 9 + 1}.1990")),
+            ("register: confirm", self.factory.callback(user_id, "confirm_self_registration")),
+        ]
+        for label, payload in steps:
+            await self.send(label, payload)
+            await self.think()
+
+    async def registration_bursts(self):
+        while not self.stopping.is_set():
+            await asyncio.gather(*(
+                self.register(next(self._registration_ids)) for _ in range(self.args.burst_size)
+            ))
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.args.burst_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self) -> dict:
+        await self.start()
+        try:
+            users = (
+                [self.barista(LOAD_ID_BASE + i) for i in range(1, self.args.baristas + 1)]
+                + [self.client(telegram_id) for telegram_id, _ in self.clients[:self.args.active_clients]]
+                + [self.manager(LOAD_ID_BASE + 1000 + i) for i in range(1, self.args.managers + 1)]
+            )
+            if self.args.burst_size:
+                users.append(self.registration_bursts())
+            tasks = [asyncio.create_task(user) for user in users]
+            started = time.perf_counter()
+            await asyncio.sleep(self.args.duration)
+            self.stopping.set()
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            return self.report(elapsed, handler_metrics, self.bot.dispatcher.stats())
+        finally:
+            await self.stop()
+
+    # --- отчёт ---
+
+    def report(self, elapsed: float, metrics, dispatcher) -> dict:
+        samples = [value for values in self.latencies.values() for value in values]
+        handlers = {}
+        for name, stats in metrics.top(limit=1000):
+            calls = stats.latency.count
+            handlers[name] = {
+                "calls": calls,
+                "p50_ms": stats.latency.quantile(0.5) * 1000,
+                "p99_ms": stats.latency.quantile(0.99) * 1000,
+                "db_queries_per_call": stats.db_queries / calls,
+                "db_ms_per_call": stats.db_seconds / calls * 1000,
+                "telegram_calls_per_call": stats.telegram_calls / calls,
+                "errors": stats.errors,
+            }
+        return {
+            "config": {key: value for key, value in vars(self.args).items() if key not in ("output", "baseline")},
+            "updates": self.processed,
+            "seconds": elapsed,
+            "throughput": self.processed / elapsed,
+            "p50_ms": percentile(samples, 0.5),
+            "p99_ms": percentile(samples, 0.99),
+            "queue_wait_p99_ms": dispatcher.wait_p99_ms,
+            "db_queries": sum(stats["db_queries_per_call"] * stats["calls"] for stats in handlers.values()),
+            "telegram_calls": dict(self.api.calls),
+            "steps": {
+                label: {"count": len(values), "p50_ms": percentile(values, 0.5), "p99_ms": percentile(values, 0.99)}
+                for label, values in sorted(self.latencies.items())
+            },
+            "handlers": handlers,
+        }
+
+
+def print_report(result: dict):
+    print(f"Updates:     {result['updates']} in {result['seconds']:.1f} s — {result['throughput']:.1f} updates/s")
+    print(f"Latency:     p50 {result['p50_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms "
+          f"(queue wait p99 {result['queue_wait_p99_ms']:.1f} ms)")
+    print(f"DB queries:  {result['db_queries']:.0f} ({result['db_queries'] / max(result['updates'], 1):.1f} per update)")
+    print()
+    print(f"{'Scenario step':32s} {'count':>7s} {'p50 ms':>8s} {'p99 ms':>8s}")
+    for label, step in result["steps"].items():
+        print(f"{label:32s} {step['count']:7d} {step['p50_ms']:8.1f} {step['p99_ms']:8.1f}")
+    print()
+    print(f"{'Handler':40s} {'calls':>7s} {'p50 ms':>8s} {'p99 ms':>8s} {'queries':>8s} {'errors':>7s}")
+    for name, stats in result["handlers"].items():
+        print(f"{name[:40]:40s} {stats['calls']:7d} {stats['p50_ms']:8.1f} {stats['p99_ms']:8.1f} "
+              f"{stats['db_queries_per_call']:8.1f} {stats['errors']:7d}")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Регрессии относительно прошлого запуска: пропускная способность, p99 и запросы на вызов"""
+    regressions = []
+    if result["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"throughput {baseline['throughput']:.1f} -> {result['throughput']:.1f} updates/s")
+    for section in ("steps", "handlers"):
+        for name, current in result[section].items():
+            previous = baseline.get(section, {}).get(name)
+            if previous is None:
+                continue
+            if (current["p99_ms"] > previous["p99_ms"] * (1 + tolerance)
+                    and current["p99_ms"] - previous["p99_ms"] > NOISE_MS):
+                regressions.append(f"{name}: p99 {previous['p99_ms']:.1f} -> {current['p99_ms']:.1f} ms")
+            queries = current.get("db_queries_per_call")
+            if queries is not None and queries > previous["db_queries_per_call"] + 0.5:
+                regressions.append(
+                    f"{name}: DB queries per call {previous['db_queries_per_call']:.1f} -> {queries:.1f}"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=60, help="секунды нагрузки")
+    parser.add_argument("--baristas", type=int, default=20)
+    parser.add_argument("--managers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=2000, help="синтетических клиентов в базе")
+    parser.add_argument("--active-clients", type=int, default=200, help="клиентов, одновременно пишущих боту")
+    parser.add_argument("--burst-size", type=int, default=50, help="регистраций в одной волне")
+    parser.add_argument("--burst-interval", type=float, default=15)
+    parser.add_argument("--think", type=float, default=500, help="средняя пауза пользователя, мс")
+    parser.add_argument("--telegram-latency", type=float, default=30, help="задержка ответа Bot API, мс")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("UPDATE_WORKERS", "8")))
+    parser.add_argument("--max-pending", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="не удалять синтетические данные")
+    parser.add_argument("--output", help="сохранить результат в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого запуска для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="допустимое ухудшение, доля")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(LoadTest(args).run())
+    print_report(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(result, output, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            regressions = compare(result, json.load(baseline), args.tolerance)
+        print()
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Ручной запуск начисления бонусов именинникам из меню статистики и админ-панели
+"""
+
+import logging
+
+from src.config import config
+from src.utils.birthday import BirthdayBonusJob
+from src.utils.database import connect, database, has_role
+
+logger = logging.getLogger(__name__)
+
+BIRTHDAY_ROLES = ("admin", "manager")
+
+
+class BirthdayHandlers:
+    """Кнопки send_birthday_bonuses и force_birthday_check"""
+
+    @staticmethod
+    async def run_birthday_bonuses(update, context):
+        query = update.callback_query
+        await query.answer()
+        user_id = update.effective_user.id
+
+        try:
+            async with connect() as connection:
+                allowed = user_id == config.admin_id or await has_role(connection, user_id, BIRTHDAY_ROLES)
+            if not allowed:
+                await query.edit_message_text("❌ Недостаточно прав")
+                return
+
+            await query.edit_message_text("⏳ Начисляем бонусы именинникам...")
+            job = BirthdayBonusJob(
+                database, context.bot, config.birthday_bonus, config.timezone,
+                limiter=context.bot_data.get("rate_limiter")
+            )
+            result = await job.run()
+        except Exception as e:
+            logger.error(f"Ошибка начисления бонусов на день рождения: {e}", exc_info=True)
+            await query.edit_message_text("❌ Ошибка при начислении бонусов. Попробуйте позже.")
+            return
+
+        await query.edit_message_text(result.summary)
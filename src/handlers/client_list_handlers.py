@@ -0,0 +1,91 @@
+"""
+Постраничный список клиентов (кнопка list_all_clients и курсоры «cl:»)
+"""
+
+import logging
+import time
+from collections import OrderedDict
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from src.config import config
+from src.utils.client_listing import SORTS, ClientPage, Cursor, client_listing, decode_cursor
+from src.utils.database import connect, has_role
+
+logger = logging.getLogger(__name__)
+
+LIST_ROLES = ("admin", "manager", "barista")
+ACCESS_TTL = 60.0
+ACCESS_CACHE_SIZE = 256
+
+# Результат проверки роли на время листания: user_id -> срок действия (LRU)
+_access_checked: "OrderedDict[int, float]" = OrderedDict()
+
+
+def render_page(page: ClientPage):
+    sort = SORTS[page.sort]
+    lines = [f"👥 *Клиенты* ({sort.title}), стр. {page.page}", ""]
+    if not page.clients:
+        lines.append("Клиентов пока нет")
+    for client in page.clients:
+        visit = f" · {client['last_visit']:%d.%m.%Y}" if client["last_visit"] else ""
+        name = escape_markdown(client["full_name"])
+        lines.append(f"• {name} — {client['balance']} б. · `{client['card_number']}`{visit}")
+
+    keyboard = [
+        [InlineKeyboardButton(f"👤 {client['full_name']}", callback_data=f"manage_client_{client['id']}")]
+        for client in page.clients
+    ]
+    navigation = []
+    if page.prev_cursor():
+        navigation.append(InlineKeyboardButton("◀️", callback_data=page.prev_cursor().encode()))
+    if page.next_cursor():
+        navigation.append(InlineKeyboardButton("▶️", callback_data=page.next_cursor().encode()))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([
+        InlineKeyboardButton(("• " if key == page.sort else "") + option.title, callback_data=Cursor(key).encode())
+        for key, option in SORTS.items()
+    ])
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="manage_clients")])
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+class ClientListHandlers:
+    """Листание списка клиентов вперёд/назад с выбором сортировки"""
+
+    @staticmethod
+    async def _has_access(connection, user_id: int) -> bool:
+        if user_id == config.admin_id:
+            return True
+        expires = _access_checked.get(user_id)
+        if expires is not None and expires > time.monotonic():
+            _access_checked.move_to_end(user_id)
+            return True
+        _access_checked.pop(user_id, None)
+        if not await has_role(connection, user_id, LIST_ROLES):
+            return False
+        _access_checked[user_id] = time.monotonic() + ACCESS_TTL
+        if len(_access_checked) > ACCESS_CACHE_SIZE:
+            _access_checked.popitem(last=False)
+        return True
+
+    @staticmethod
+    async def list_clients(update, context):
+        query = update.callback_query
+        cursor = decode_cursor(query.data) if query.data.startswith("cl:") else Cursor()
+
+        try:
+            async with connect() as connection:
+                if not await ClientListHandlers._has_access(connection, update.effective_user.id):
+                    await query.edit_message_text("❌ Недостаточно прав")
+                    return
+                page = await client_listing.page(connection, cursor)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки списка клиентов: {e}", exc_info=True)
+            await query.edit_message_text("❌ Ошибка при загрузке списка клиентов")
+            return
+
+        text, reply_markup = render_page(page)
+        await query.edit_message_text(text, parse_mode="Markdown", reply_markup=reply_markup)
@@ -0,0 +1,93 @@
+"""
+Карточка клиента и баланс (/balance, кнопки manage_client_<id>) через кэш клиентов
+"""
+
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from src.config import config
+from src.utils.client_cache import load_client
+from src.utils.database import connect, database, has_role
+
+logger = logging.getLogger(__name__)
+
+MANAGE_ROLES = ("admin", "manager", "barista")
+
+
+def render_client(client) -> str:
+    lines = [
+        f"👤 *{escape_markdown(client['full_name'] or 'Без имени')}*",
+        f"💳 Карта: `{client['card_number']}`",
+    ]
+    if client["phone"]:
+        lines.append(f"📱 {escape_markdown(client['phone'])}")
+    lines.append(f"💰 Баланс: *{client['balance']}* баллов")
+    lines.append(f"☕ Визитов: {client['visit_count'] or 0}")
+    if client["last_visit"]:
+        lines.append(f"📅 Последний визит: {client['last_visit']:%d.%m.%Y}")
+    return "\n".join(lines)
+
+
+def client_keyboard(client_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("➕ Начислить", callback_data=f"add_points_{client_id}"),
+            InlineKeyboardButton("➖ Списать", callback_data=f"spend_points_{client_id}"),
+        ],
+        [InlineKeyboardButton("◀️ К списку", callback_data="list_all_clients")],
+    ])
+
+
+async def is_staff(user_id: int) -> bool:
+    if user_id == config.admin_id:
+        return True
+    async with connect() as connection:
+        return await has_role(connection, user_id, MANAGE_ROLES)
+
+
+class ClientLookupHandlers:
+    """Чтение клиента из кэша: баланс для клиента, карточка для сотрудника"""
+
+    @staticmethod
+    async def balance_command(update, context):
+        try:
+            client = await load_client(database, "telegram_id", update.effective_user.id)
+        except Exception as e:
+            logger.error(f"Ошибка получения баланса: {e}", exc_info=True)
+            await update.message.reply_text("❌ Ошибка при получении баланса")
+            return
+
+        if client is None or not client["is_active"]:
+            await update.message.reply_text(
+                "❌ Вы ещё не зарегистрированы в программе лояльности.\n"
+                "Нажмите /start для регистрации"
+            )
+            return
+        await update.message.reply_text(
+            f"💳 Ваша карта: `{client['card_number']}`\n"
+            f"💰 Баланс: *{client['balance']} баллов*\n"
+            f"☕ Визитов: {client['visit_count'] or 0}",
+            parse_mode="Markdown"
+        )
+
+    @staticmethod
+    async def manage_single_client(update, context, client_id):
+        query = update.callback_query
+        try:
+            if not await is_staff(update.effective_user.id):
+                await query.edit_message_text("❌ Недостаточно прав")
+                return
+            client = await load_client(database, "id", client_id)
+        except Exception as e:
+            logger.error(f"Ошибка загрузки клиента {client_id}: {e}", exc_info=True)
+            await query.edit_message_text("❌ Ошибка при загрузке клиента")
+            return
+
+        if client is None or not client["is_active"]:
+            await query.edit_message_text("❌ Клиент не найден")
+            return
+        await query.edit_message_text(
+            render_client(client), parse_mode="Markdown", reply_markup=client_keyboard(client["id"])
+        )
@@ -0,0 +1,99 @@
+"""
+Обработчики выгрузки данных (/export и кнопка резервной копии)
+
+Экспорт выполняется в фоновой задаче: обработчик сразу отвечает, а
+прогресс показывается редактированием одного сообщения.
+"""
+
+import logging
+
+from src.config import config
+from src.utils.database import connect, database, has_role
+from src.utils.export import EXPORT_TABLES, StreamingExporter
+
+logger = logging.getLogger(__name__)
+
+EXPORT_ROLES = ("admin", "manager")
+RUNNING_KEY = "export_running"
+
+USAGE = (
+    "📤 Экспорт данных\n\n"
+    "/export [csv|jsonl] [gz] [changes]\n"
+    "• csv / jsonl — формат файла (по умолчанию csv)\n"
+    "• gz — сжать файлы\n"
+    "• changes — только строки, изменённые с прошлого экспорта"
+)
+
+
+class ExportHandlers:
+    """Потоковая выгрузка таблиц в Telegram"""
+
+    @staticmethod
+    async def _has_access(connection, telegram_id: int) -> bool:
+        return telegram_id == config.admin_id or await has_role(connection, telegram_id, EXPORT_ROLES)
+
+    @staticmethod
+    async def export_data_command(update, context):
+        """/export [csv|jsonl] [gz] [changes]"""
+        args = [arg.lower() for arg in (context.args or [])]
+        unknown = [arg for arg in args if arg not in ("csv", "jsonl", "gz", "changes")]
+        if unknown:
+            await update.message.reply_text(USAGE)
+            return
+
+        await ExportHandlers._start_export(
+            update, context,
+            fmt="jsonl" if "jsonl" in args else "csv",
+            compress="gz" in args,
+            incremental="changes" in args
+        )
+
+    @staticmethod
+    async def backup_data_callback(update, context):
+        """Резервная копия из админ-панели: полный JSONL в gzip"""
+        await update.callback_query.answer()
+        await ExportHandlers._start_export(update, context, fmt="jsonl", compress=True, incremental=False)
+
+    @staticmethod
+    async def _start_export(update, context, fmt: str, compress: bool, incremental: bool):
+        chat_id = update.effective_chat.id
+        user_id = update.effective_user.id
+
+        async with connect() as connection:
+            if not await ExportHandlers._has_access(connection, user_id):
+                await context.bot.send_message(chat_id, "❌ У вас нет прав для экспорта данных")
+                return
+
+        if context.bot_data.get(RUNNING_KEY):
+            await context.bot.send_message(chat_id, "⏳ Экспорт уже выполняется, дождитесь завершения")
+            return
+
+        status = await context.bot.send_message(chat_id, "⏳ Экспорт запущен...")
+        context.bot_data[RUNNING_KEY] = True
+        context.application.create_task(
+            ExportHandlers._run_export(context, chat_id, status, fmt, compress, incremental)
+        )
+
+    @staticmethod
+    async def _run_export(context, chat_id: int, status, fmt: str, compress: bool, incremental: bool):
+        bot = context.bot
+
+        async def upload(fileobj, filename: str, caption: str):
+            await bot.send_document(chat_id, document=fileobj, filename=filename, caption=caption)
+
+        async def progress(table: str, rows: int):
+            await status.edit_text(f"⏳ Экспорт: {table} — {rows:,} строк".replace(",", " "))
+
+        try:
+            # Пул, а не одно соединение: во время отправки частей соединение возвращено в пул
+            exporter = StreamingExporter(database, upload, progress, fmt=fmt, compress=compress)
+            results = await exporter.export(list(EXPORT_TABLES), incremental=incremental)
+
+            lines = [f"• {result.table}: {result.rows} строк" for result in results]
+            title = "✅ Экспорт изменений завершён" if incremental else "✅ Экспорт завершён"
+            await status.edit_text(title + "\n\n" + "\n".join(lines))
+        except Exception as e:
+            logger.error(f"Ошибка экспорта: {e}", exc_info=True)
+            await status.edit_text("❌ Ошибка при экспорте данных. Попробуйте позже.")
+        finally:
+            context.bot_data[RUNNING_KEY] = False
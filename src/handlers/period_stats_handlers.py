@@ -0,0 +1,103 @@
+"""
+Статистика за день / неделю / месяц из предрасчитанных сводок
+
+Сводки пополняет догоняющее задание ведущего процесса (раз в
+STATS_ROLLUP_INTERVAL), экран только читает их и не сканирует
+point_transactions.
+"""
+
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from src.config import config
+from src.utils.birthday import local_today
+from src.utils.database import connect, has_role
+from src.utils.stats_rollups import PeriodSummary
+
+logger = logging.getLogger(__name__)
+
+STATS_ROLES = ("admin", "manager")
+ROLLUPS_KEY = "stats_rollups"
+
+PERIODS = {
+    "stats_today": ("day", "за сегодня"),
+    "stats_week": ("week", "за неделю"),
+    "stats_month": ("month", "за месяц"),
+    "stats_hours": ("day", "по часам за сегодня"),
+}
+
+
+def _number(value) -> str:
+    return f"{value:,.0f}".replace(",", " ")
+
+
+def render_summary(summary: PeriodSummary, title: str, by_hours: bool = False) -> str:
+    period = (
+        f"{summary.start:%d.%m.%Y}" if summary.start == summary.end
+        else f"{summary.start:%d.%m.%Y} — {summary.end:%d.%m.%Y}"
+    )
+    lines = [
+        f"📊 *Статистика {title}*",
+        "",
+        f"👥 Активных клиентов: *{_number(summary.active_clients)}*",
+        f"🆕 Новых регистраций: *{_number(summary.new_clients)}*",
+        f"📝 Операций: *{_number(summary.transactions)}*",
+        f"⭐ Начислено баллов: *{_number(summary.points_earned)}*",
+        f"💸 Списано баллов: *{_number(summary.points_spent)}*",
+        f"💰 Выручка: *{_number(summary.revenue)} ₽*",
+    ]
+    if by_hours:
+        lines.append("")
+        if summary.hours:
+            lines.extend(
+                f"`{hour['hour']:%H}:00` — {hour['transactions']} опер., "
+                f"+{hour['points_earned']} / −{hour['points_spent']}, {hour['active_clients']} кл."
+                for hour in summary.hours
+            )
+        else:
+            lines.append("Операций пока не было")
+    lines.extend(["", f"🕐 Период: {period}"])
+    return "\n".join(lines)
+
+
+class PeriodStatsHandlers:
+    """Кнопки stats_today / stats_week / stats_month / stats_hours"""
+
+    @staticmethod
+    async def period_stats(update, context):
+        query = update.callback_query
+        await query.answer()
+        user_id = update.effective_user.id
+
+        if user_id != config.admin_id:
+            async with connect() as connection:
+                if not await has_role(connection, user_id, STATS_ROLES):
+                    await query.edit_message_text("❌ Недостаточно прав")
+                    return
+
+        period, title = PERIODS[query.data]
+        rollups = context.bot_data[ROLLUPS_KEY]
+        try:
+            summary = await rollups.summary(period, local_today(config.timezone))
+        except Exception as e:
+            logger.error(f"Ошибка загрузки статистики: {e}", exc_info=True)
+            await query.edit_message_text("❌ Ошибка при загрузке статистики")
+            return
+
+        keyboard = InlineKeyboardMarkup([
+            [
+                InlineKeyboardButton("📅 Сегодня", callback_data="stats_today"),
+                InlineKeyboardButton("🕐 По часам", callback_data="stats_hours"),
+            ],
+            [
+                InlineKeyboardButton("📅 За неделю", callback_data="stats_week"),
+                InlineKeyboardButton("📅 За месяц", callback_data="stats_month"),
+            ],
+            [InlineKeyboardButton("◀️ Назад", callback_data="statistics")],
+        ])
+        await query.edit_message_text(
+            render_summary(summary, title, by_hours=query.data == "stats_hours"),
+            parse_mode="Markdown",
+            reply_markup=keyboard
+        )
@@ -0,0 +1,133 @@
+"""
+Подтверждение операций с баллами (начисление, списание, покупка) через PointLedger
+
+Предыдущие шаги диалогов (BonusHandlers) оставляют в user_data клиента
+(client_id или client), число баллов (points) и для покупки сумму
+(amount) и баллы к списанию (spend_points). Операция выполняется одним
+выражением журнала с ключом идемпотентности обновления, поэтому
+повторная доставка подтверждения не начислит и не спишет баллы дважды.
+"""
+
+import logging
+from collections.abc import Mapping
+
+from telegram import ReplyKeyboardRemove
+from telegram.ext import ConversationHandler
+
+from src.config import config
+from src.utils.birthday import OPERATOR_SQL
+from src.utils.database import connect, database
+from src.utils.ledger import InsufficientPoints, LedgerError, PointLedger, idempotency_key
+
+logger = logging.getLogger(__name__)
+
+CONFIRM_ANSWERS = ("✅", "да", "подтвердить", "yes")
+DIALOG_KEYS = ("client_id", "client", "points", "amount", "spend_points")
+
+
+def _confirmed(text: str) -> bool:
+    return (text or "").strip().lower().startswith(CONFIRM_ANSWERS)
+
+
+def _client_id(user_data):
+    client = user_data.get("client")
+    if user_data.get("client_id") is not None:
+        return int(user_data["client_id"])
+    if isinstance(client, Mapping) and client.get("id") is not None:
+        return int(client["id"])
+    return None
+
+
+def _ledger(context) -> PointLedger:
+    return context.bot_data.get("ledger") or PointLedger(database)
+
+
+async def _operator_id(telegram_id: int):
+    """users.id сотрудника; администратор из конфига без строки в users — как у автоматических операций"""
+    async with connect() as connection:
+        operator_id = await connection.fetchval(
+            "SELECT id FROM users WHERE telegram_id = $1 AND is_active = true", telegram_id
+        )
+        if operator_id is None and telegram_id == config.admin_id:
+            operator_id = await connection.fetchval(OPERATOR_SQL)
+    return operator_id
+
+
+async def _finish(update, context, text: str):
+    for key in DIALOG_KEYS:
+        context.user_data.pop(key, None)
+    await update.message.reply_text(text, reply_markup=ReplyKeyboardRemove())
+    return ConversationHandler.END
+
+
+class PointsHandlers:
+    """Последний шаг диалогов /add_points, /spend_points и /purchase"""
+
+    @staticmethod
+    async def _confirm(update, context, operation: str, apply):
+        if not _confirmed(update.message.text):
+            return await _finish(update, context, "❌ Операция отменена")
+
+        client_id = _client_id(context.user_data)
+        if client_id is None:
+            return await _finish(update, context, "❌ Клиент не выбран, начните операцию заново")
+
+        try:
+            operator_id = await _operator_id(update.effective_user.id)
+            if operator_id is None:
+                return await _finish(update, context, "❌ Недостаточно прав")
+            text = await apply(_ledger(context), client_id, operator_id, idempotency_key(update, operation))
+        except InsufficientPoints as e:
+            text = f"❌ Недостаточно баллов. Доступно: {e.available}, запрошено: {e.requested}"
+        except (LedgerError, ValueError) as e:
+            logger.warning(f"Операция {operation} для клиента {client_id} отклонена: {e}")
+            text = "❌ Клиент не найден или операция невозможна"
+        except Exception as e:
+            logger.error(f"Ошибка операции {operation} для клиента {client_id}: {e}", exc_info=True)
+            text = "❌ Ошибка при выполнении операции. Попробуйте позже."
+        return await _finish(update, context, text)
+
+    @staticmethod
+    async def add_points_confirm(update, context):
+        points = int(context.user_data.get("points") or 0)
+
+        async def apply(ledger, client_id, operator_id, key):
+            result = await ledger.earn(client_id, operator_id, points, key=key)
+            return f"✅ Начислено {points} баллов\n💰 Баланс: {result.balance}"
+
+        return await PointsHandlers._confirm(update, context, "add_points", apply)
+
+    @staticmethod
+    async def spend_points_confirm(update, context):
+        points = int(context.user_data.get("points") or 0)
+
+        async def apply(ledger, client_id, operator_id, key):
+            result = await ledger.spend(client_id, operator_id, points, key=key)
+            return f"✅ Списано {points} баллов\n💰 Баланс: {result.balance}"
+
+        return await PointsHandlers._confirm(update, context, "spend_points", apply)
+
+    @staticmethod
+    async def purchase_confirm(update, context):
+        amount = context.user_data.get("amount")
+        points = int(context.user_data.get("points") or 0)
+        spend_points = int(context.user_data.get("spend_points") or 0)
+
+        async def apply(ledger, client_id, operator_id, key):
+            # Свой ключ у каждой части: повтор подтверждения не выполнит ни одну из них второй раз
+            lines = [f"✅ Покупка на {amount} ₽ оформлена"]
+            result = None
+            if spend_points > 0:
+                result = await ledger.spend(
+                    client_id, operator_id, spend_points,
+                    description=f"Оплата покупки на {amount} ₽", key=key and f"{key}:spend"
+                )
+                lines.append(f"➖ Списано {spend_points} баллов")
+            if points > 0:
+                result = await ledger.earn(client_id, operator_id, points, amount=amount, key=key and f"{key}:earn")
+                lines.append(f"➕ Начислено {points} баллов")
+            if result is not None:
+                lines.append(f"💰 Баланс: {result.balance}")
+            return "\n".join(lines)
+
+        return await PointsHandlers._confirm(update, context, "purchase", apply)
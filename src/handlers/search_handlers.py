@@ -0,0 +1,70 @@
+"""
+Поиск клиентов (/search) по индексу в памяти, строки клиентов — из кэша
+"""
+
+import logging
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.helpers import escape_markdown
+
+from src.handlers.client_lookup_handlers import client_keyboard, is_staff, render_client
+from src.utils.client_cache import load_client
+from src.utils.database import database
+from src.utils.search_index import client_search_index
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 10
+
+
+class SearchHandlers:
+    """/search <телефон/карта/имя>: id из индекса, данные клиентов через load_client"""
+
+    @staticmethod
+    async def search_client_command(update, context):
+        if not await is_staff(update.effective_user.id):
+            await update.message.reply_text("❌ Недостаточно прав")
+            return
+
+        text = " ".join(context.args or [])
+        if not text:
+            await update.message.reply_text("🔍 Использование: /search <телефон/карта/имя>")
+            return
+        if not client_search_index.loaded:
+            await update.message.reply_text("⏳ Индекс поиска ещё загружается, попробуйте через минуту")
+            return
+
+        clients = []
+        try:
+            for hit in client_search_index.search(text, limit=SEARCH_LIMIT):
+                client = await load_client(database, "id", hit.client_id)
+                if client is not None and client["is_active"]:
+                    clients.append(client)
+        except Exception as e:
+            logger.error(f"Ошибка поиска клиента: {e}", exc_info=True)
+            await update.message.reply_text("❌ Ошибка при поиске клиента")
+            return
+
+        if not clients:
+            await update.message.reply_text("❌ Клиенты не найдены")
+            return
+        if len(clients) == 1:
+            client = clients[0]
+            await update.message.reply_text(
+                render_client(client), parse_mode="Markdown", reply_markup=client_keyboard(client["id"])
+            )
+            return
+
+        lines = [f"🔍 Найдено: {len(clients)}", ""]
+        for client in clients:
+            lines.append(
+                f"• {escape_markdown(client['full_name'] or 'Без имени')} — {client['balance']} б. · "
+                f"`{client['card_number']}`"
+            )
+        keyboard = [
+            [InlineKeyboardButton(f"👤 {client['full_name']}", callback_data=f"manage_client_{client['id']}")]
+            for client in clients
+        ]
+        await update.message.reply_text(
+            "\n".join(lines), parse_mode="Markdown", reply_markup=InlineKeyboardMarkup(keyboard)
+        )
@@ -0,0 +1,62 @@
+"""
+Размер сегментов рассылок (/segments) из материализованного индекса
+"""
+
+import logging
+
+from src.config import config
+from src.utils.database import connect, has_role
+from src.utils.segments import BUILTIN_RULES, RULE_FIELDS, RuleError, segment_index
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_ROLES = ("admin", "manager")
+
+SEGMENT_TITLES = {
+    "all": "Все клиенты",
+    "active": "Активные (визит за 30 дней)",
+    "vip": "VIP (от 10 000 ₽)",
+    "birthday": "Именинники сегодня",
+}
+
+
+class SegmentHandlers:
+    """/segments — число получателей по сегментам; /segments <правило> — по своему правилу"""
+
+    @staticmethod
+    async def segments_command(update, context):
+        user_id = update.effective_user.id
+        if user_id != config.admin_id:
+            async with connect() as connection:
+                if not await has_role(connection, user_id, SEGMENT_ROLES):
+                    await update.message.reply_text("❌ Недостаточно прав")
+                    return
+
+        if not segment_index.loaded:
+            await update.message.reply_text("⏳ Сегменты ещё загружаются, попробуйте через минуту")
+            return
+
+        rule = " ".join(context.args or [])
+        if rule:
+            try:
+                await segment_index.prepare(rule)
+                count = segment_index.count("custom", rule)
+            except RuleError as e:
+                await update.message.reply_text(
+                    f"❌ {e}\n\nДоступные поля: {', '.join(RULE_FIELDS)}\n"
+                    "Пример: /segments visit_count >= 5 and days_since_visit > 60"
+                )
+                return
+            sample = segment_index.members("custom", rule, limit=5)
+            await update.message.reply_text(
+                f"🎯 Правило: {rule}\n👥 Получателей: {count}"
+                + (f"\nПервые id: {', '.join(map(str, sample))}" if sample else "")
+            )
+            return
+
+        lines = ["🎯 Сегменты рассылок", ""]
+        lines.extend(
+            f"• {SEGMENT_TITLES[name]}: {segment_index.count(name)}" for name in BUILTIN_RULES
+        )
+        lines.extend(["", "Своё правило: /segments visit_count >= 5 and total_spent < 3000"])
+        await update.message.reply_text("\n".join(lines))
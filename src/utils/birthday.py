@@ -0,0 +1,206 @@
+"""
+Пакетное начисление бонусов на день рождения
+
+Именинники выбираются одним запросом по индексу на месяц/день
+birth_date, баллы начисляются всем сразу одной командой (вставка в
+birthday_bonus_awards, UPDATE баланса и INSERT в point_transactions), а
+поздравления отправляются после фиксации через общий лимитер —
+соединение к этому моменту уже возвращено в пул. Повторный запуск в тот
+же год ничего не начисляет.
+
+Строки начисленных клиентов сбрасываются в кэше клиентов и списке
+(а через их обработчики — и в остальных процессах).
+"""
+
+import asyncio
+import calendar
+import logging
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from src.utils.client_cache import client_cache
+from src.utils.client_listing import client_listing
+from src.utils.rate_limiter import TelegramRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Совпадает с описанием в BirthdayService, чтобы бонусы не начислялись дважды
+BONUS_DESCRIPTION = "Birthday bonus (auto)"
+NOTIFY_CONCURRENCY = 20
+
+AWARD_SQL = """
+WITH candidates AS (
+    SELECT c.id
+    FROM clients c
+    WHERE c.is_active = true
+      AND c.birth_date IS NOT NULL
+      AND EXTRACT(MONTH FROM c.birth_date) = $1
+      AND EXTRACT(DAY FROM c.birth_date) = ANY($2::int[])
+      AND NOT EXISTS (
+          SELECT 1 FROM point_transactions t
+          WHERE t.client_id = c.id
+            AND t.operation_type = 'bonus'
+            AND t.description = $6
+            AND t.created_at >= make_date($3, 1, 1)
+      )
+), awarded AS (
+    INSERT INTO birthday_bonus_awards (client_id, year, points)
+    SELECT id, $3, $4 FROM candidates
+    ON CONFLICT (client_id, year) DO NOTHING
+    RETURNING client_id
+), credited AS (
+    UPDATE clients c
+    SET balance = c.balance + $4, updated_at = NOW()
+    FROM awarded a
+    WHERE c.id = a.client_id
+    RETURNING c.id, c.telegram_id, c.full_name, c.balance
+), logged AS (
+    INSERT INTO point_transactions (client_id, operator_id, operation_type, points, amount, description)
+    SELECT id, $5, 'bonus', $4, 0, $6 FROM credited
+)
+SELECT id, telegram_id, full_name, balance FROM credited ORDER BY id
+"""
+
+OPERATOR_SQL = """
+SELECT id FROM users
+WHERE role IN ('admin', 'manager') AND is_active = true
+ORDER BY CASE WHEN role = 'admin' THEN 0 ELSE 1 END, id
+LIMIT 1
+"""
+
+# Шаги AWARD_SQL для SQLite-замены, где нет изменяющих CTE
+CANDIDATES_SQL = """
+SELECT c.id, CAST(strftime('%d', c.birth_date) AS INTEGER) AS day
+FROM clients c
+WHERE c.is_active = 1 AND c.birth_date IS NOT NULL
+  AND CAST(strftime('%m', c.birth_date) AS INTEGER) = $1
+  AND NOT EXISTS (
+      SELECT 1 FROM point_transactions t
+      WHERE t.client_id = c.id AND t.operation_type = 'bonus' AND t.description = $3 AND t.created_at >= $2
+  )
+ORDER BY c.id
+"""
+
+
+def birthday_days(today: date) -> Tuple[int, List[int]]:
+    """Месяц и дни рождения, которые празднуются сегодня (29.02 — 28.02 в невисокосный год)"""
+    days = [today.day]
+    if today.month == 2 and today.day == 28 and not calendar.isleap(today.year):
+        days.append(29)
+    return today.month, days
+
+
+def local_today(timezone: str) -> date:
+    return datetime.now(ZoneInfo(timezone)).date()
+
+
+@dataclass
+class BirthdayRunResult:
+    day: date
+    awarded: List[Dict[str, Any]] = field(default_factory=list)
+    notified: int = 0
+    notify_failed: int = 0
+
+    @property
+    def summary(self) -> str:
+        return (
+            f"🎂 Дни рождения {self.day:%d.%m.%Y}: начислено {len(self.awarded)}, "
+            f"поздравлений отправлено {self.notified}, ошибок {self.notify_failed}"
+        )
+
+
+class BirthdayBonusJob:
+    """Начисление бонусов всем именинникам дня одной транзакцией"""
+
+    def __init__(self, db, bot, points: int, timezone: str,
+                 limiter: Optional[TelegramRateLimiter] = None):
+        self.db = db
+        self.bot = bot
+        self.points = points
+        self.timezone = timezone
+        self.limiter = limiter or TelegramRateLimiter()
+
+    async def run(self, today: Optional[date] = None) -> BirthdayRunResult:
+        today = today or local_today(self.timezone)
+        result = BirthdayRunResult(today)
+        month, days = birthday_days(today)
+
+        # Соединение нужно только на начисление: поздравления идут через лимитер минутами
+        async with self.db.acquire() as connection:
+            operator_id = await connection.fetchval(OPERATOR_SQL)
+            if operator_id is None:
+                raise RuntimeError("No staff user available to log birthday bonus transactions")
+            if getattr(connection, "dialect", "postgresql") == "postgresql":
+                rows = await connection.fetch(
+                    AWARD_SQL, month, days, today.year, self.points, operator_id, BONUS_DESCRIPTION
+                )
+            else:
+                rows = await self._award_stepwise(connection, month, days, today.year, operator_id)
+        result.awarded = [dict(row) for row in rows]
+        logger.info(f"Birthday bonuses for {today}: {len(result.awarded)} clients credited")
+        for client in result.awarded:
+            client_cache.invalidate_client(client["id"])
+        if result.awarded:
+            client_listing.invalidate()
+
+        await self._notify(result)
+        return result
+
+    async def _award_stepwise(self, connection, month: int, days: List[int], year: int,
+                              operator_id: int) -> List[Dict[str, Any]]:
+        """SQLite-замена: те же шаги, что в AWARD_SQL, в одной транзакции"""
+        credited = []
+        async with connection.transaction():
+            for row in await connection.fetch(CANDIDATES_SQL, month, f"{year}-01-01", BONUS_DESCRIPTION):
+                if row["day"] not in days:
+                    continue
+                status = await connection.execute(
+                    "INSERT INTO birthday_bonus_awards (client_id, year, points) VALUES ($1, $2, $3) "
+                    "ON CONFLICT (client_id, year) DO NOTHING",
+                    row["id"], year, self.points
+                )
+                if status.split()[-1] != "1":
+                    continue
+                client = await connection.fetchrow(
+                    "UPDATE clients SET balance = balance + $2, updated_at = NOW() WHERE id = $1 "
+                    "RETURNING id, telegram_id, full_name, balance",
+                    row["id"], self.points
+                )
+                await connection.execute(
+                    "INSERT INTO point_transactions (client_id, operator_id, operation_type, points, amount, "
+                    "description) VALUES ($1, $2, 'bonus', $3, 0, $4)",
+                    client["id"], operator_id, self.points, BONUS_DESCRIPTION
+                )
+                credited.append(client)
+        return credited
+
+    async def _notify(self, result: BirthdayRunResult):
+        semaphore = asyncio.Semaphore(NOTIFY_CONCURRENCY)
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("🎁 Спасибо!", callback_data="client_main_menu")],
+            [InlineKeyboardButton("🍰 Меню программы", callback_data="about_program")]
+        ])
+        text = (
+            "🎉 *Хей, Друг!* Команда Rock Coffee поздравляет тебя с днём рождения!\n\n"
+            f"🎁 Мы начислили тебе *{self.points} баллов* на твой праздничный напиток, приходи за ним скорее!"
+        )
+
+        async def send(client) -> bool:
+            async with semaphore:
+                await self.limiter.acquire(client["telegram_id"])
+                try:
+                    await self.bot.send_message(client["telegram_id"], text, parse_mode="Markdown",
+                                                reply_markup=reply_markup)
+                    return True
+                except Exception as e:
+                    logger.warning(f"Birthday greeting to client {client['id']} failed: {e}")
+                    return False
+
+        recipients = [client for client in result.awarded if client["telegram_id"]]
+        outcomes = await asyncio.gather(*(send(client) for client in recipients))
+        result.notified = sum(outcomes)
+        result.notify_failed = len(outcomes) - result.notified
@@ -0,0 +1,399 @@
+"""
+Движок массовых рассылок с возобновлением после сбоя
+
+Получатели сегмента материализуются в broadcast_recipients пакетами
+(id берутся из SegmentIndex, если он загружен, иначе фильтром по clients),
+затем отправляются через TelegramRateLimiter. Статусы пишутся пакетными
+UPDATE, поэтому после перезапуска рассылка продолжается с первого
+получателя в статусе pending (повторно может уйти не больше одного
+незаписанного пакета).
+
+Рассылка захватывается арендой (lease_owner / lease_until), которая
+продлевается после каждого пакета. Возобновляются только рассылки с
+истёкшей арендой: рассылку, которую ещё отправляет админ-панель (статус
+sending без аренды), движок не трогает, а потерявший аренду процесс
+останавливается.
+
+Таймаут отправки не повторяется: Telegram мог уже доставить сообщение,
+поэтому получатель помечается failed с ошибкой UNCERTAIN_ERROR вместо
+второй отправки (CHECK в broadcast_recipients допускает только статусы
+pending / sent / delivered / failed).
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+from src.utils.rate_limiter import TelegramRateLimiter
+from src.utils.segments import SegmentIndex
+
+logger = logging.getLogger(__name__)
+
+MATERIALIZE_BATCH = 1000
+SEND_BATCH = 200
+CONCURRENCY = 25
+MAX_ATTEMPTS = 3
+UNCERTAIN_ERROR = "Delivery uncertain (timed out)"
+BROADCAST_LEASE = 300
+
+# Следующая рассылка к отправке: запланированная или брошенная этим движком
+CLAIM_SQL = """
+UPDATE broadcasts
+SET status = 'sending', lease_owner = $1, lease_until = NOW() + make_interval(secs => $2), updated_at = NOW()
+WHERE id = (
+    SELECT id FROM broadcasts
+    WHERE (status = 'scheduled' AND scheduled_at <= NOW())
+       OR (status = 'sending' AND lease_owner IS NOT NULL AND lease_until < NOW())
+    ORDER BY id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id
+"""
+
+# $4 — сегодняшняя дата в часовом поясе кофейни, а не CURRENT_DATE сервера базы
+SEGMENT_FILTERS = {
+    "all": "",
+    "active": "AND last_visit >= $4::date - INTERVAL '30 days'",
+    "vip": "AND total_spent >= 10000",
+    "birthday": (
+        "AND EXTRACT(MONTH FROM birth_date) = EXTRACT(MONTH FROM $4::date) "
+        "AND EXTRACT(DAY FROM birth_date) = EXTRACT(DAY FROM $4::date)"
+    ),
+}
+
+PLACEHOLDERS = ("{card}", "{карта}", "{name}", "{имя}")
+
+# (id получателя, статус, текст ошибки)
+Outcome = Tuple[int, str, Optional[str]]
+
+
+def personalize(message: str, card_number: Any) -> str:
+    """Подстановка номера карты вместо плейсхолдеров, как в рассылках админ-панели"""
+    for placeholder in PLACEHOLDERS:
+        message = message.replace(placeholder, str(card_number))
+    return message
+
+
+def retry_seconds(error: RetryAfter) -> float:
+    retry_after = error.retry_after
+    return retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else float(retry_after)
+
+
+class BroadcastStore:
+    """Доступ к broadcasts / broadcast_recipients"""
+
+    def __init__(self, connection, segments: Optional[SegmentIndex] = None, today: Optional[date] = None,
+                 lease: float = BROADCAST_LEASE):
+        self.connection = connection
+        self.segments = segments
+        self.today = today or date.today()
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+
+    async def get_broadcast(self, broadcast_id: int) -> Optional[Dict[str, Any]]:
+        row = await self.connection.fetchrow(
+            "SELECT id, message, image_url, segment, segment_rule, status FROM broadcasts WHERE id = $1",
+            broadcast_id
+        )
+        return dict(row) if row else None
+
+    async def claim_next(self) -> Optional[int]:
+        """Захват следующей запланированной или брошенной рассылки"""
+        return await self.connection.fetchval(CLAIM_SQL, self.owner, float(self.lease))
+
+    async def renew(self, broadcast_id: int) -> bool:
+        """Продление аренды; False — рассылку уже захватил другой процесс"""
+        status = await self.connection.execute(
+            """
+            UPDATE broadcasts SET lease_until = NOW() + make_interval(secs => $3)
+            WHERE id = $1 AND lease_owner = $2 AND status = 'sending'
+            """,
+            broadcast_id, self.owner, float(self.lease)
+        )
+        return status.split()[-1] == "1"
+
+    async def set_status(self, broadcast_id: int, status: str):
+        await self.connection.execute(
+            """
+            UPDATE broadcasts
+            SET status = $2, updated_at = NOW(),
+                completed_at = CASE WHEN $2 IN ('completed', 'failed') THEN NOW() ELSE completed_at END
+            WHERE id = $1
+            """,
+            broadcast_id, status
+        )
+
+    async def last_materialized(self, broadcast_id: int) -> int:
+        value = await self.connection.fetchval(
+            "SELECT COALESCE(MAX(client_id), 0) FROM broadcast_recipients WHERE broadcast_id = $1", broadcast_id
+        )
+        return value or 0
+
+    async def materialize_batch(self, broadcast_id: int, segment: str, after_client_id: int,
+                                limit: int, rule: Optional[str] = None) -> Optional[int]:
+        """Добавить следующий пакет получателей; возвращает последний client_id или None"""
+        if self.segments is not None and self.segments.loaded:
+            if segment == "custom" and rule:
+                await self.segments.prepare(rule)
+            ids = self.segments.members(segment, rule, after=after_client_id, limit=limit)
+            if not ids:
+                return None
+            await self.connection.execute(
+                """
+                INSERT INTO broadcast_recipients (broadcast_id, client_id, telegram_id)
+                SELECT $1, id, telegram_id FROM clients
+                WHERE id = ANY($2::int[]) AND is_active = true AND telegram_id IS NOT NULL
+                ON CONFLICT (broadcast_id, client_id) DO NOTHING
+                """,
+                broadcast_id, ids
+            )
+            return ids[-1]
+
+        if segment not in SEGMENT_FILTERS:
+            raise ValueError(f"Unsupported broadcast segment: {segment}")
+        args = [broadcast_id, after_client_id, limit]
+        if "$4" in SEGMENT_FILTERS[segment]:
+            args.append(self.today)
+        rows = await self.connection.fetch(
+            f"""
+            WITH batch AS (
+                SELECT id, telegram_id FROM clients
+                WHERE is_active = true AND telegram_id IS NOT NULL
+                  AND id > $2 {SEGMENT_FILTERS[segment]}
+                ORDER BY id
+                LIMIT $3
+            ), inserted AS (
+                INSERT INTO broadcast_recipients (broadcast_id, client_id, telegram_id)
+                SELECT $1, id, telegram_id FROM batch
+                ON CONFLICT (broadcast_id, client_id) DO NOTHING
+            )
+            SELECT MAX(id) AS last_id, COUNT(*) AS selected FROM batch
+            """,
+            *args
+        )
+        row = rows[0]
+        return row["last_id"] if row["selected"] else None
+
+    async def finish_materialization(self, broadcast_id: int):
+        await self.connection.execute(
+            """
+            UPDATE broadcasts
+            SET total_recipients = (SELECT COUNT(*) FROM broadcast_recipients WHERE broadcast_id = $1),
+                updated_at = NOW()
+            WHERE id = $1
+            """,
+            broadcast_id
+        )
+
+    async def pending_batch(self, broadcast_id: int, after_id: int, limit: int) -> List[Dict[str, Any]]:
+        rows = await self.connection.fetch(
+            """
+            SELECT r.id, r.telegram_id, c.card_number
+            FROM broadcast_recipients r
+            JOIN clients c ON c.id = r.client_id
+            WHERE r.broadcast_id = $1 AND r.status = 'pending' AND r.id > $2
+            ORDER BY r.id
+            LIMIT $3
+            """,
+            broadcast_id, after_id, limit
+        )
+        return [dict(row) for row in rows]
+
+    async def record(self, broadcast_id: int, outcomes: Sequence[Outcome]):
+        """Статусы пакета одним UPDATE и счётчики рассылки в той же транзакции"""
+        ids = [outcome[0] for outcome in outcomes]
+        statuses = [outcome[1] for outcome in outcomes]
+        errors = [outcome[2] for outcome in outcomes]
+        sent = statuses.count("sent")
+        failed = statuses.count("failed")
+
+        async with self.connection.transaction():
+            if getattr(self.connection, "dialect", "postgresql") == "postgresql":
+                await self.connection.execute(
+                    """
+                    UPDATE broadcast_recipients AS r
+                    SET status = v.status,
+                        error_message = v.error_message,
+                        sent_at = CASE WHEN v.status = 'sent' THEN NOW() ELSE r.sent_at END
+                    FROM unnest($1::int[], $2::text[], $3::text[]) AS v(id, status, error_message)
+                    WHERE r.id = v.id AND r.status = 'pending'
+                    """,
+                    ids, statuses, errors
+                )
+            else:
+                # SQLite-замена без unnest: те же условия построчно
+                await self.connection.executemany(
+                    """
+                    UPDATE broadcast_recipients
+                    SET status = $2, error_message = $3,
+                        sent_at = CASE WHEN $2 = 'sent' THEN NOW() ELSE sent_at END
+                    WHERE id = $1 AND status = 'pending'
+                    """,
+                    list(outcomes)
+                )
+            await self.connection.execute(
+                """
+                UPDATE broadcasts
+                SET sent_count = sent_count + $2, delivered_count = delivered_count + $2,
+                    failed_count = failed_count + $3, updated_at = NOW()
+                WHERE id = $1
+                """,
+                broadcast_id, sent, failed
+            )
+
+
+class LeaseLost(RuntimeError):
+    """Аренду рассылки перехватил другой процесс"""
+
+
+@dataclass
+class BroadcastResult:
+    broadcast_id: int
+    sent: int = 0
+    failed: int = 0
+    retries: int = 0
+    # Таймаут: доставка неизвестна, повторно не отправляется
+    uncertain: int = 0
+
+
+class BroadcastEngine:
+    """Материализация получателей и отправка с учётом лимитов Telegram"""
+
+    def __init__(self, store: BroadcastStore, bot, limiter: Optional[TelegramRateLimiter] = None,
+                 concurrency: int = CONCURRENCY, send_batch: int = SEND_BATCH,
+                 materialize_batch: int = MATERIALIZE_BATCH):
+        self.store = store
+        self.bot = bot
+        self.limiter = limiter or TelegramRateLimiter()
+        self.concurrency = concurrency
+        self.send_batch = send_batch
+        self.materialize_batch_size = materialize_batch
+
+    async def run(self, broadcast_id: int) -> BroadcastResult:
+        """Отправить рассылку (или продолжить прерванную)"""
+        broadcast = await self.store.get_broadcast(broadcast_id)
+        if broadcast is None:
+            raise ValueError(f"Broadcast {broadcast_id} not found")
+        if broadcast["status"] in ("completed", "failed"):
+            return BroadcastResult(broadcast_id)
+
+        await self.store.set_status(broadcast_id, "sending")
+        try:
+            await self._materialize(broadcast)
+            result = await self._send(broadcast)
+        except Exception:
+            logger.exception(f"Broadcast {broadcast_id} interrupted")
+            raise
+
+        await self.store.set_status(broadcast_id, "completed")
+        logger.info(
+            f"Broadcast {broadcast_id} completed: {result.sent} sent, {result.failed} failed, "
+            f"{result.uncertain} uncertain"
+        )
+        return result
+
+    async def _materialize(self, broadcast: Dict[str, Any]):
+        after = await self.store.last_materialized(broadcast["id"])
+        while after is not None:
+            after = await self.store.materialize_batch(
+                broadcast["id"], broadcast["segment"], after, self.materialize_batch_size,
+                rule=broadcast.get("segment_rule")
+            )
+            await self._renew(broadcast["id"])
+        await self.store.finish_materialization(broadcast["id"])
+
+    async def _send(self, broadcast: Dict[str, Any]) -> BroadcastResult:
+        result = BroadcastResult(broadcast["id"])
+        semaphore = asyncio.Semaphore(self.concurrency)
+        after = 0
+
+        async def deliver(recipient) -> Outcome:
+            async with semaphore:
+                return await self._deliver(broadcast, recipient, result)
+
+        while True:
+            batch = await self.store.pending_batch(broadcast["id"], after, self.send_batch)
+            if not batch:
+                return result
+            outcomes = await asyncio.gather(*(deliver(recipient) for recipient in batch))
+            await self.store.record(broadcast["id"], outcomes)
+            await self._renew(broadcast["id"])
+            for _, status, error in outcomes:
+                if status == "sent":
+                    result.sent += 1
+                elif (error or "").startswith(UNCERTAIN_ERROR):
+                    result.uncertain += 1
+                else:
+                    result.failed += 1
+            after = batch[-1]["id"]
+
+    async def _renew(self, broadcast_id: int):
+        if not await self.store.renew(broadcast_id):
+            raise LeaseLost(f"Broadcast {broadcast_id} was claimed by another process")
+
+    async def _deliver(self, broadcast: Dict[str, Any], recipient: Dict[str, Any],
+                       result: BroadcastResult) -> Outcome:
+        chat_id = recipient["telegram_id"]
+        text = personalize(broadcast["message"], recipient["card_number"])
+        attempts = 0
+        while True:
+            await self.limiter.acquire(chat_id)
+            try:
+                await self._send_one(broadcast, chat_id, text)
+                return recipient["id"], "sent", None
+            except RetryAfter as e:
+                # Флуд-контроль не считается попыткой: ждём и повторяем
+                result.retries += 1
+                self.limiter.pause(retry_seconds(e))
+            except (Forbidden, BadRequest) as e:
+                return recipient["id"], "failed", str(e)[:500]
+            except TimedOut as e:
+                # Запрос мог дойти до Telegram: повтор рискует отправить сообщение дважды
+                logger.warning(f"Broadcast {broadcast['id']}: delivery to {chat_id} is uncertain: {e}")
+                return recipient["id"], "failed", f"{UNCERTAIN_ERROR}: {e}"[:500]
+            except NetworkError as e:
+                attempts += 1
+                result.retries += 1
+                if attempts >= MAX_ATTEMPTS:
+                    return recipient["id"], "failed", str(e)[:500]
+                await asyncio.sleep(2 ** attempts)
+            except Exception as e:
+                logger.warning(f"Broadcast {broadcast['id']}: failed to send to {chat_id}: {e}")
+                return recipient["id"], "failed", str(e)[:500]
+
+    async def _send_one(self, broadcast: Dict[str, Any], chat_id: int, text: str):
+        reply_markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton("💳 Моя карта", callback_data="my_card")],
+            [InlineKeyboardButton("🏠 Главное меню", callback_data="client_main_menu")]
+        ])
+        if broadcast.get("image_url"):
+            await self.bot.send_photo(chat_id, broadcast["image_url"], caption=text,
+                                      parse_mode="Markdown", reply_markup=reply_markup)
+        else:
+            await self.bot.send_message(chat_id, text, parse_mode="Markdown", reply_markup=reply_markup)
+
+
+async def run_due_broadcasts(connection, bot, limiter: Optional[TelegramRateLimiter] = None,
+                             segments: Optional[SegmentIndex] = None,
+                             today: Optional[date] = None) -> List[BroadcastResult]:
+    """Отправить все запланированные и возобновить прерванные рассылки
+
+    today — дата в часовом поясе кофейни для сегментов active и birthday.
+    """
+    store = BroadcastStore(connection, segments, today)
+    engine = BroadcastEngine(store, bot, limiter)
+    results = []
+    # По одной: аренда следующей не истекает, пока отправляется предыдущая
+    while (broadcast_id := await store.claim_next()) is not None:
+        try:
+            results.append(await engine.run(broadcast_id))
+        except Exception as e:
+            logger.error(f"Рассылка {broadcast_id} прервана: {e}")
+    return results
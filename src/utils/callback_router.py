@@ -0,0 +1,163 @@
+"""
+Декларативная маршрутизация callback_data
+
+Точные значения ищутся одним обращением к словарю, параметризованные
+(`manage_client_<id>`, `confirm_delete_<id>`, `stats_*`) — по префиксному
+дереву за время, пропорциональное длине callback_data, а не числу маршрутов.
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[..., Awaitable[Any]]
+
+CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    "str": str,
+    "int": int,
+}
+
+_PLACEHOLDER = re.compile(r"\{(\w+)(?::(\w+))?\}")
+
+
+@dataclass
+class Route:
+    """Зарегистрированный маршрут"""
+    handler: Handler
+    answer: bool = False
+    param: Optional[str] = None
+    converter: Callable[[str], Any] = str
+    allow_empty: bool = True
+
+    def extract(self, rest: str) -> Optional[Dict[str, Any]]:
+        """Аргументы для обработчика или None, если хвост не подходит"""
+        if self.param is None:
+            return {}
+        if not rest and not self.allow_empty:
+            return None
+        try:
+            return {self.param: self.converter(rest)}
+        except ValueError:
+            return None
+
+
+@dataclass
+class _TrieNode:
+    children: Dict[str, "_TrieNode"] = field(default_factory=dict)
+    route: Optional[Route] = None
+
+
+class CallbackRouter:
+    """Маршрутизатор callback-запросов: словарь + префиксное дерево"""
+
+    def __init__(self):
+        self._exact: Dict[str, Route] = {}
+        self._root = _TrieNode()
+        self._fallback: Optional[Route] = None
+
+    def exact(self, data: str, handler: Handler, answer: bool = False):
+        """Маршрут для точного значения callback_data"""
+        if data in self._exact:
+            raise ValueError(f"Duplicate callback route: {data!r}")
+        self._exact[data] = Route(handler, answer=answer)
+
+    def prefix(self, prefix: str, handler: Handler, answer: bool = False):
+        """Маршрут для всех значений с префиксом; обработчик сам разбирает data"""
+        self._insert(prefix, Route(handler, answer=answer))
+
+    def pattern(self, pattern: str, handler: Handler, answer: bool = False):
+        """Маршрут вида `prefix_{name:type}`; аргумент передаётся обработчику по имени"""
+        matches = list(_PLACEHOLDER.finditer(pattern))
+        if len(matches) != 1 or matches[0].end() != len(pattern):
+            raise ValueError(f"Pattern must end with exactly one placeholder: {pattern!r}")
+        placeholder = matches[0]
+        type_name = placeholder.group(2) or "str"
+        if type_name not in CONVERTERS:
+            raise ValueError(f"Unknown converter {type_name!r} in {pattern!r}")
+
+        route = Route(
+            handler,
+            answer=answer,
+            param=placeholder.group(1),
+            converter=CONVERTERS[type_name],
+            allow_empty=type_name == "str",
+        )
+        self._insert(pattern[:placeholder.start()], route)
+
+    def fallback(self, handler: Handler, answer: bool = False):
+        """Обработчик для callback_data без маршрута"""
+        self._fallback = Route(handler, answer=answer)
+
+    def _insert(self, prefix: str, route: Route):
+        node = self._root
+        for char in prefix:
+            node = node.children.setdefault(char, _TrieNode())
+        if node.route is not None:
+            raise ValueError(f"Duplicate callback prefix: {prefix!r}")
+        node.route = route
+
+    def resolve(self, data: str) -> Optional[Tuple[Route, Dict[str, Any]]]:
+        """Поиск маршрута: точное совпадение, затем самый длинный подходящий префикс"""
+        route = self._exact.get(data)
+        if route is not None:
+            return route, {}
+
+        candidates: List[Tuple[int, Route]] = []
+        node = self._root
+        if node.route is not None:
+            candidates.append((0, node.route))
+        for index, char in enumerate(data):
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.route is not None:
+                candidates.append((index + 1, node.route))
+
+        for depth, route in reversed(candidates):
+            kwargs = route.extract(data[depth:])
+            if kwargs is not None:
+                return route, kwargs
+
+        if self._fallback is not None:
+            return self._fallback, {}
+        return None
+
+    async def dispatch(self, update, context):
+        """Вызов обработчика для callback-запроса обновления"""
+        query = update.callback_query
+        resolved = self.resolve(query.data or "")
+        if resolved is None:
+            logger.debug("No callback route for %r", query.data)
+            await query.answer()
+            return None
+
+        route, kwargs = resolved
+        if route.answer:
+            await query.answer()
+        return await route.handler(update, context, **kwargs)
+
+    def wrap_handlers(self, wrap: Callable[[str, Handler], Handler]):
+        """Заменить обработчик каждого маршрута на wrap(имя маршрута, обработчик)"""
+        for data, route in self._exact.items():
+            route.handler = wrap(data, route.handler)
+        stack = [("", self._root)]
+        while stack:
+            prefix, node = stack.pop()
+            if node.route is not None:
+                suffix = f"{{{node.route.param}}}" if node.route.param else "*"
+                node.route.handler = wrap(prefix + suffix, node.route.handler)
+            stack.extend((prefix + char, child) for char, child in node.children.items())
+        if self._fallback is not None:
+            self._fallback.handler = wrap("*", self._fallback.handler)
+
+    def __len__(self) -> int:
+        count = len(self._exact)
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            count += node.route is not None
+            stack.extend(node.children.values())
+        return count
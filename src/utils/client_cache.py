@@ -0,0 +1,230 @@
+"""
+Кэш строк таблицы clients в памяти процесса
+
+LRU с ограничением по времени жизни. Строка клиента хранится один раз
+(по id), а telegram_id, card_number и phone — вторичные индексы на неё.
+Все пути, изменяющие баланс или удаляющие клиента, обязаны вызывать
+invalidate_client(), поэтому кэш не отдаёт устаревший баланс.
+"""
+
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEY_KINDS = ("telegram_id", "card_number", "phone")
+
+Row = Dict[str, Any]
+Loader = Callable[[], Awaitable[Optional[Row]]]
+
+
+def normalize_phone(phone: Any) -> str:
+    """Последние 10 цифр номера: +7 900…, 8 900… и 900… считаются одним ключом"""
+    digits = re.sub(r"\D", "", str(phone))
+    return digits[-10:]
+
+
+def _normalize(kind: str, value: Any) -> Any:
+    if value is None:
+        return None
+    if kind == "phone":
+        return normalize_phone(value) or None
+    if kind in ("id", "telegram_id"):
+        return int(value)
+    return str(value).strip()
+
+
+@dataclass
+class CacheStats:
+    """Счётчики кэша для подбора размера и TTL"""
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    invalidations: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__, hit_rate=round(self.hit_rate, 4))
+
+
+class ClientCache:
+    """LRU/TTL-кэш клиентов с индексами по telegram_id, card_number и phone"""
+
+    def __init__(self, max_size: int = 5000, ttl: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._rows: "OrderedDict[int, Tuple[float, Row]]" = OrderedDict()
+        self._index: Dict[str, Dict[Any, int]] = {kind: {} for kind in KEY_KINDS}
+        self._generation = 0
+        # Вызывается при каждом сбросе: (вид ключа или None для всего кэша, значение)
+        self.on_invalidate: Optional[Callable[[Optional[str], Any], None]] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, kind: str, value: Any) -> Optional[Row]:
+        """Строка клиента из кэша или None"""
+        key = _normalize(kind, value)
+        client_id = key if kind == "id" else self._index[kind].get(key)
+        entry = self._rows.get(client_id) if client_id is not None else None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, row = entry
+        if expires_at <= self._clock():
+            self._remove(client_id)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._rows.move_to_end(client_id)
+        self.hits += 1
+        return row
+
+    def put(self, row: Row):
+        """Сохранение строки клиента (нужен ключ id)"""
+        client_id = row["id"]
+        if client_id in self._rows:
+            self._remove(client_id)
+
+        self._rows[client_id] = (self._clock() + self.ttl, row)
+        for kind in KEY_KINDS:
+            key = _normalize(kind, row.get(kind))
+            if key is not None:
+                self._index[kind][key] = client_id
+
+        while len(self._rows) > self.max_size:
+            oldest_id = next(iter(self._rows))
+            self._remove(oldest_id)
+            self.evictions += 1
+
+    async def get_or_load(self, kind: str, value: Any, loader: Loader) -> Optional[Row]:
+        """Строка из кэша, иначе из loader(); результат кэшируется"""
+        row = self.get(kind, value)
+        if row is not None:
+            return row
+
+        generation = self._generation
+        row = await loader()
+        # Если во время загрузки была инвалидация, строка может быть устаревшей
+        if row is not None and generation == self._generation:
+            self.put(dict(row))
+        return row
+
+    def invalidate_client(self, client_id: Any):
+        """Сброс строки клиента после изменения баланса или удаления"""
+        self._generation += 1
+        if self.on_invalidate is not None:
+            self.on_invalidate("id", client_id)
+        try:
+            client_id = int(client_id)
+        except (TypeError, ValueError):
+            return
+        if client_id in self._rows:
+            self._remove(client_id)
+            self.invalidations += 1
+
+    def invalidate(self, kind: str, value: Any):
+        """Сброс строки клиента по вторичному ключу"""
+        client_id = self._index[kind].get(_normalize(kind, value))
+        if client_id is None:
+            self._generation += 1
+            if self.on_invalidate is not None:
+                self.on_invalidate(kind, value)
+        else:
+            self.invalidate_client(client_id)
+
+    def invalidate_from_user_data(self, user_data: Mapping[str, Any]):
+        """
+        Сброс клиента, с которым работал диалог
+
+        Ищет клиента в user_data по ключам client_id / client; если клиент
+        не найден, очищает кэш целиком, чтобы не отдать устаревший баланс.
+        """
+        client = user_data.get("client")
+        client_id = user_data.get("client_id")
+        if client_id is None and isinstance(client, Mapping):
+            client_id = client.get("id")
+
+        if client_id is not None:
+            self.invalidate_client(client_id)
+        else:
+            self.clear()
+
+    def clear(self):
+        self._generation += 1
+        if self.on_invalidate is not None:
+            self.on_invalidate(None, None)
+        self.invalidations += len(self._rows)
+        self._rows.clear()
+        for index in self._index.values():
+            index.clear()
+
+    def _remove(self, client_id: int):
+        _, row = self._rows.pop(client_id)
+        for kind in KEY_KINDS:
+            key = _normalize(kind, row.get(kind))
+            if key is not None and self._index[kind].get(key) == client_id:
+                del self._index[kind][key]
+
+    def stats(self) -> CacheStats:
+        return CacheStats(
+            size=len(self._rows),
+            max_size=self.max_size,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            expirations=self.expirations,
+            invalidations=self.invalidations,
+        )
+
+
+def invalidating(handler, invalidate: Callable[[Any, Any, Mapping[str, Any]], None]):
+    """
+    Обёртка обработчика, сбрасывающая кэш после его выполнения
+
+    user_data снимается до вызова: подтверждающие шаги диалогов обычно
+    очищают его при завершении.
+    """
+    async def wrapper(update, context, *args, **kwargs):
+        snapshot = dict(context.user_data or {})
+        try:
+            return await handler(update, context, *args, **kwargs)
+        finally:
+            invalidate(update, context, snapshot)
+
+    wrapper.__name__ = getattr(handler, "__name__", "handler")
+    wrapper.__wrapped__ = handler
+    return wrapper
+
+
+client_cache = ClientCache()
+
+
+async def load_client(db, kind: str, value: Any) -> Optional[Row]:
+    """Клиент по id / telegram_id / card_number / phone: из кэша или подготовленным запросом пула"""
+    loaders = {
+        "id": db.client_by_id,
+        "telegram_id": db.client_balance,
+        "card_number": db.client_by_card,
+        "phone": db.client_by_phone,
+    }
+    loader = loaders[kind]
+    return await client_cache.get_or_load(kind, value, lambda: loader(value))
@@ -0,0 +1,177 @@
+"""
+Постраничный список клиентов с keyset-пагинацией
+
+Страница выбирается условием (ключ сортировки, id) > (...) по индексу,
+а не OFFSET, поэтому сотая страница открывается так же быстро, как
+первая. Курсор в callback_data содержит только сортировку, направление,
+номер страницы и id клиента-якоря (в base36), например «cl:n>3:2n9c»;
+значение ключа сортировки якоря берётся из базы.
+
+Недавно открытые страницы хранятся в коротком кэше, чтобы листание
+туда и обратно не обращалось к базе.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+PAGE_SIZE = 10
+PAGE_CACHE_TTL = 20.0
+PAGE_CACHE_SIZE = 500
+CURSOR_PREFIX = "cl:"
+
+LIST_COLUMNS = "id, card_number, full_name, balance, last_visit"
+
+
+@dataclass(frozen=True)
+class SortOption:
+    title: str
+    expression: str
+    ascending: bool
+
+
+# Выражения совпадают с индексами из миграции 013
+SORTS: Dict[str, SortOption] = {
+    "v": SortOption("по визитам", "COALESCE(last_visit, '1970-01-01')", False),
+    "b": SortOption("по балансу", "balance", False),
+    "n": SortOption("по имени", "full_name", True),
+}
+DEFAULT_SORT = "v"
+
+
+@dataclass(frozen=True)
+class Cursor:
+    sort: str = DEFAULT_SORT
+    forward: bool = True
+    page: int = 1
+    anchor: Optional[int] = None
+
+    def encode(self) -> str:
+        anchor = _base36(self.anchor) if self.anchor is not None else ""
+        return f"{CURSOR_PREFIX}{self.sort}{'>' if self.forward else '<'}{self.page}:{anchor}"
+
+
+def _base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        value, rest = divmod(value, 36)
+        result = digits[rest] + result
+        if not value:
+            return result
+
+
+def decode_cursor(data: str) -> Cursor:
+    """Курсор из callback_data; некорректные данные дают первую страницу"""
+    try:
+        head, anchor = data[len(CURSOR_PREFIX):].split(":", 1)
+        sort, direction, page = head[0], head[1], int(head[2:])
+        if sort not in SORTS or direction not in "<>" or page < 1:
+            return Cursor()
+        return Cursor(sort, direction == ">", page, int(anchor, 36) if anchor else None)
+    except (ValueError, IndexError):
+        return Cursor()
+
+
+@dataclass
+class ClientPage:
+    sort: str
+    page: int
+    clients: List[Dict[str, Any]]
+    has_prev: bool
+    has_next: bool
+
+    def next_cursor(self) -> Optional[Cursor]:
+        if not self.has_next:
+            return None
+        return Cursor(self.sort, True, self.page + 1, self.clients[-1]["id"])
+
+    def prev_cursor(self) -> Optional[Cursor]:
+        if not self.has_prev:
+            return None
+        if self.page <= 2:
+            return Cursor(self.sort, True, 1, None)
+        return Cursor(self.sort, False, self.page - 1, self.clients[0]["id"])
+
+
+def page_query(sort: str, forward: bool, anchored: bool) -> str:
+    option = SORTS[sort]
+    expression = option.expression
+    # Направление просмотра совпадает с порядком сортировки только при листании вперёд
+    ascending = option.ascending == forward
+    order = "ASC" if ascending else "DESC"
+    condition = ""
+    if anchored:
+        operator = ">" if ascending else "<"
+        # Отдельная граница по самому ключу даёт поиск по индексу и для
+        # выражений (SQLite не сравнивает кортеж с выражением по индексу)
+        condition = (
+            f" AND {expression} {operator}= (SELECT {expression} FROM clients WHERE id = $1)"
+            f" AND ({expression}, id) {operator} "
+            f"(SELECT {expression}, id FROM clients WHERE id = $1)"
+        )
+    limit = "$2" if anchored else "$1"
+    return (
+        f"SELECT {LIST_COLUMNS} FROM clients WHERE is_active = true{condition} "
+        f"ORDER BY {expression} {order}, id {order} LIMIT {limit}"
+    )
+
+
+class ClientListing:
+    """Страницы списка клиентов с кэшем недавно открытых"""
+
+    def __init__(self, page_size: int = PAGE_SIZE, ttl: float = PAGE_CACHE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.page_size = page_size
+        self.ttl = ttl
+        self._clock = clock
+        self._cache: "OrderedDict[Cursor, Tuple[float, ClientPage]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.on_invalidate: Optional[Callable[[], None]] = None
+
+    async def page(self, connection, cursor: Cursor) -> ClientPage:
+        cached = self._cache.get(cursor)
+        if cached is not None and cached[0] > self._clock():
+            self._cache.move_to_end(cursor)
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        page = await self._load(connection, cursor)
+        self._cache[cursor] = (self._clock() + self.ttl, page)
+        self._cache.move_to_end(cursor)
+        if len(self._cache) > PAGE_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return page
+
+    async def _load(self, connection, cursor: Cursor) -> ClientPage:
+        if cursor.anchor is None:
+            rows = await connection.fetch(page_query(cursor.sort, True, False), self.page_size + 1)
+            rows = [dict(row) for row in rows]
+            return ClientPage(cursor.sort, 1, rows[:self.page_size], False, len(rows) > self.page_size)
+
+        rows = await connection.fetch(
+            page_query(cursor.sort, cursor.forward, True), cursor.anchor, self.page_size + 1
+        )
+        rows = [dict(row) for row in rows]
+        more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if not rows:
+            # Клиент-якорь удалён или страниц больше нет: начинаем сначала
+            return await self._load(connection, Cursor(cursor.sort))
+        if cursor.forward:
+            return ClientPage(cursor.sort, cursor.page, rows, True, more)
+        rows.reverse()
+        # Перед страницей ничего нет — значит, это первая страница
+        return ClientPage(cursor.sort, cursor.page if more else 1, rows, more, True)
+
+    def invalidate(self):
+        """Сбросить кэш после изменения клиентов"""
+        self._cache.clear()
+        if self.on_invalidate is not None:
+            self.on_invalidate()
+
+
+client_listing = ClientListing()
@@ -0,0 +1,73 @@
+"""
+Граница зафиксированных строк для инкрементальных проходов
+
+NOW() и id из последовательности строка получает в начале своей
+транзакции, а видна становится только после фиксации. Поэтому строка
+с более ранним updated_at или меньшим id может появиться уже после
+того, как проход сохранил позицию дальше неё, и водяной знак по одному
+ключу её пропустит.
+
+Граница по времени — начало самой старой открытой транзакции других
+сессий той же базы (pg_stat_activity.xact_start; транзакции других баз
+сервера строк этой базы не пишут и границу не держат): все строки с отметкой раньше неё
+уже зафиксированы или откатились, новых задним числом не появится.
+Роли бота нужен доступ к xact_start чужих сессий: та же роль, что у
+остальных сервисов, или pg_read_all_stats.
+
+Граница по id — значение последовательности, прочитанное в момент T:
+все id до него выданы транзакциям, начавшимся раньше T. Когда ни одной
+транзакции старше T не осталось открытой, строки с этими id уже видны
+или не появятся никогда. Если при чтении такие транзакции есть,
+отметка (id, T) сохраняется и проверяется следующим проходом.
+
+SQLite-замена работает в одном соединении, и граница для неё — текущее
+время или последний id.
+"""
+
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+SEQUENCE_SQL = """
+SELECT COALESCE(pg_sequence_last_value(pg_get_serial_sequence($1, 'id')::regclass), 0) AS last_id,
+       clock_timestamp()::timestamp AS read_at
+"""
+
+OLDEST_TRANSACTION_SQL = """
+SELECT MIN(xact_start)::timestamp FROM pg_stat_activity
+WHERE xact_start IS NOT NULL AND pid <> pg_backend_pid() AND backend_type = 'client backend'
+  AND datname = current_database()
+"""
+
+
+def _is_postgresql(connection) -> bool:
+    return getattr(connection, "dialect", "postgresql") == "postgresql"
+
+
+async def time_horizon(connection) -> Any:
+    """Момент, раньше которого строк с NOW() в колонке времени больше не появится"""
+    if not _is_postgresql(connection):
+        return await connection.fetchval("SELECT NOW()")
+    # Время читается до списка транзакций: начавшиеся позже него в границу не попадут
+    now: datetime = await connection.fetchval("SELECT clock_timestamp()::timestamp")
+    oldest = await connection.fetchval(OLDEST_TRANSACTION_SQL)
+    return now if oldest is None else min(now, oldest)
+
+
+async def id_horizon(connection, table: str, pending_id: Optional[int],
+                     pending_at: Optional[datetime]) -> Tuple[Optional[int], Optional[int], Optional[datetime]]:
+    """Граница по id таблицы: (безопасный id или None, новая отметка id, её время)
+
+    pending_id / pending_at — отметка, сохранённая прошлым проходом.
+    """
+    if not _is_postgresql(connection):
+        return await connection.fetchval(f"SELECT COALESCE(MAX(id), 0) FROM {table}"), None, None
+    current = await connection.fetchrow(SEQUENCE_SQL, table)
+    # Список транзакций — после чтения последовательности
+    oldest = await connection.fetchval(OLDEST_TRANSACTION_SQL)
+    if oldest is None or oldest > current["read_at"]:
+        return current["last_id"], None, None
+    if pending_at is not None and oldest > pending_at:
+        return pending_id, current["last_id"], current["read_at"]
+    if pending_at is not None:
+        return None, pending_id, pending_at
+    return None, current["last_id"], current["read_at"]
@@ -0,0 +1,426 @@
+"""
+Доступ к PostgreSQL для обработчиков и фоновых задач бота
+
+Приложение владеет одним пулом соединений asyncpg (Database): он
+открывается при инициализации бота и закрывается при остановке.
+Частые запросы (баланс, поиск клиента по id, телефону и карте)
+подготавливаются на каждом новом соединении пула и выполняются через
+эти подготовленные выражения. Запрос, которому не хватает колонки или
+таблицы (миграция ещё не применена), не мешает открыть пул: он просто
+выполняется без подготовки.
+
+Параметры берутся из тех же переменных окружения, что и у основной
+базы: DATABASE_URL либо DB_HOST / DB_PORT / DB_NAME / DB_USER / DB_PASSWORD.
+Для тестов и локальной разработки есть SQLiteDatabase с тем же интерфейсом.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from src.utils.client_cache import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+CLIENT_COLUMNS = "id, telegram_id, card_number, full_name, phone, balance, total_spent, visit_count, last_visit, is_active"
+
+# Частые запросы обработчиков: подготавливаются на каждом соединении пула
+HOT_QUERIES: Dict[str, str] = {
+    "client_balance": f"SELECT {CLIENT_COLUMNS} FROM clients WHERE telegram_id = $1 AND is_active = true",
+    "client_by_id": f"SELECT {CLIENT_COLUMNS} FROM clients WHERE id = $1",
+    # Номер мог быть сохранён в любой из записей: +7…, 7…, 8… или 10 цифр
+    "client_by_phone": f"SELECT {CLIENT_COLUMNS} FROM clients WHERE phone IN ($1, $2, $3, $4) LIMIT 1",
+    "client_by_card": f"SELECT {CLIENT_COLUMNS} FROM clients WHERE card_number = $1",
+}
+
+
+def database_dsn() -> str:
+    """DSN базы данных из переменных окружения"""
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    return "postgresql://{user}:{password}@{host}:{port}/{name}".format(
+        user=os.getenv("DB_USER", "postgres"),
+        password=os.getenv("DB_PASSWORD", ""),
+        host=os.getenv("DB_HOST", "localhost"),
+        port=os.getenv("DB_PORT", "5432"),
+        name=os.getenv("DB_NAME", "rock_coffee"),
+    )
+
+
+@dataclass
+class PoolStats:
+    """Состояние пула для /test_db"""
+    backend: str
+    size: int
+    idle: int
+    min_size: int
+    max_size: int
+    in_use: int
+    acquires: int
+    acquire_wait_avg_ms: float
+    acquire_wait_max_ms: float
+    healthy: bool
+    last_check_ms: Optional[float]
+    last_check_age_s: Optional[float]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class _PoolMetrics:
+    def __init__(self):
+        self.in_use = 0
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.healthy = True
+        self.last_check_ms: Optional[float] = None
+        self.last_check_at: Optional[float] = None
+
+    def acquired(self, wait: float):
+        self.in_use += 1
+        self.acquires += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def checked(self, healthy: bool, latency: Optional[float]):
+        self.healthy = healthy
+        self.last_check_ms = latency * 1000 if latency is not None else None
+        self.last_check_at = time.monotonic()
+
+    def stats(self, backend: str, size: int, idle: int, min_size: int, max_size: int) -> PoolStats:
+        age = time.monotonic() - self.last_check_at if self.last_check_at is not None else None
+        return PoolStats(
+            backend=backend,
+            size=size,
+            idle=idle,
+            min_size=min_size,
+            max_size=max_size,
+            in_use=self.in_use,
+            acquires=self.acquires,
+            acquire_wait_avg_ms=self.wait_total / self.acquires * 1000 if self.acquires else 0.0,
+            acquire_wait_max_ms=self.wait_max * 1000,
+            healthy=self.healthy,
+            last_check_ms=self.last_check_ms,
+            last_check_age_s=age,
+        )
+
+
+class Database:
+    """Общий пул соединений asyncpg с проверкой здоровья"""
+
+    backend = "postgresql"
+
+    def __init__(self, dsn: Optional[str] = None, min_size: int = 2, max_size: int = 10,
+                 command_timeout: float = 10.0, health_interval: float = 30.0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.command_timeout = command_timeout
+        self.health_interval = health_interval
+        self._pool = None
+        self._health_task: Optional[asyncio.Task] = None
+        self._metrics = _PoolMetrics()
+        # Получает длительность каждого запроса (метрики обработчиков); задаётся до open()
+        self.query_observer: Optional[Callable[[float], None]] = None
+        # Подготовленные частые запросы по pid серверного процесса соединения
+        self._prepared: Dict[int, Dict[str, Any]] = {}
+
+    @property
+    def is_open(self) -> bool:
+        return self._pool is not None
+
+    async def open(self):
+        """Создать пул и запустить периодическую проверку"""
+        if self.is_open:
+            return
+        import asyncpg
+
+        self._pool = await asyncpg.create_pool(
+            self.dsn or database_dsn(),
+            min_size=self.min_size,
+            max_size=self.max_size,
+            command_timeout=self.command_timeout,
+            max_inactive_connection_lifetime=300,
+            init=self._init_connection,
+        )
+        self._health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"Database pool opened: {self.min_size}..{self.max_size} connections")
+
+    async def close(self):
+        if not self.is_open:
+            return
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await self._pool.close()
+        self._pool = None
+        self._prepared.clear()
+        logger.info("Database pool closed")
+
+    async def _init_connection(self, connection):
+        if self.query_observer is not None:
+            observer = self.query_observer
+            connection.add_query_logger(lambda record: observer(record.elapsed))
+        import asyncpg
+
+        # Частые запросы не тратят время на разбор и план даже при первом обращении
+        prepared = {}
+        for name, sql in HOT_QUERIES.items():
+            try:
+                prepared[name] = await connection.prepare(sql)
+            except (asyncpg.UndefinedColumnError, asyncpg.UndefinedTableError) as e:
+                logger.warning(f"Hot query {name} is not prepared: {e}")
+        pid = connection.get_server_pid()
+        self._prepared[pid] = prepared
+        connection.add_termination_listener(lambda closed: self._prepared.pop(pid, None))
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Соединение из пула на время блока"""
+        started = time.perf_counter()
+        async with self._pool.acquire() as connection:
+            self._metrics.acquired(time.perf_counter() - started)
+            try:
+                yield connection
+            finally:
+                self._metrics.in_use -= 1
+
+    async def fetch(self, sql: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetch(sql, *args)
+
+    async def fetchrow(self, sql: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetchrow(sql, *args)
+
+    async def fetchval(self, sql: str, *args):
+        async with self.acquire() as connection:
+            return await connection.fetchval(sql, *args)
+
+    async def execute(self, sql: str, *args):
+        async with self.acquire() as connection:
+            return await connection.execute(sql, *args)
+
+    async def _hot(self, name: str, *args):
+        """Частый запрос через выражение, подготовленное на этом соединении"""
+        async with self.acquire() as connection:
+            statement = self._prepared.get(connection.get_server_pid(), {}).get(name)
+            if statement is None:
+                return await connection.fetchrow(HOT_QUERIES[name], *args)
+            return await statement.fetchrow(*args)
+
+    async def client_balance(self, telegram_id: int):
+        return await self._hot("client_balance", telegram_id)
+
+    async def client_by_id(self, client_id: int):
+        return await self._hot("client_by_id", int(client_id))
+
+    async def client_by_phone(self, phone: str):
+        """Клиент по номеру в любой записи: сравниваются последние 10 цифр, как в кэше"""
+        digits = normalize_phone(phone)
+        if len(digits) < 10:
+            return await self._hot("client_by_phone", phone, phone, phone, phone)
+        return await self._hot("client_by_phone", f"+7{digits}", f"7{digits}", f"8{digits}", digits)
+
+    async def client_by_card(self, card_number: str):
+        return await self._hot("client_by_card", card_number)
+
+    async def health_check(self) -> bool:
+        started = time.perf_counter()
+        try:
+            async with self.acquire() as connection:
+                await connection.fetchval("SELECT 1", timeout=5)
+        except Exception as e:
+            logger.warning(f"Database health check failed: {e}")
+            self._metrics.checked(False, None)
+            return False
+        self._metrics.checked(True, time.perf_counter() - started)
+        return True
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            healthy = await self.health_check()
+            if not healthy:
+                # Сбрасываем соединения: пул пересоздаст их при следующем запросе
+                await self._pool.expire_connections()
+
+    def stats(self) -> PoolStats:
+        if not self.is_open:
+            return self._metrics.stats(self.backend, 0, 0, self.min_size, self.max_size)
+        return self._metrics.stats(
+            self.backend, self._pool.get_size(), self._pool.get_idle_size(), self.min_size, self.max_size
+        )
+
+
+_PARAM = re.compile(r"\$(\d+)")
+
+# asyncpg принимает Decimal для NUMERIC; для SQLite храним его как текст
+sqlite3.register_adapter(Decimal, str)
+
+
+class SQLiteConnection:
+    """Соединение SQLite с подмножеством API asyncpg и параметрами $1..$n"""
+
+    dialect = "sqlite"
+
+    def __init__(self, path: str = ":memory:"):
+        self.db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.create_function("NOW", 0, lambda: datetime.now().isoformat(sep=" "))
+        self.queries = 0
+        self.query_observer: Optional[Callable[[float], None]] = None
+        self._in_transaction = False
+
+    def _run(self, sql, args):
+        self.queries += 1
+        if self.query_observer is None:
+            return self.db.execute(_PARAM.sub(r"?\1", sql), args)
+        started = time.perf_counter()
+        try:
+            return self.db.execute(_PARAM.sub(r"?\1", sql), args)
+        finally:
+            self.query_observer(time.perf_counter() - started)
+
+    def _commit(self):
+        if not self._in_transaction:
+            self.db.commit()
+
+    def script(self, sql: str):
+        self.db.executescript(sql)
+
+    async def fetch(self, sql, *args, timeout=None):
+        rows = [dict(row) for row in self._run(sql, args).fetchall()]
+        self._commit()
+        return rows
+
+    async def fetchrow(self, sql, *args, timeout=None):
+        row = self._run(sql, args).fetchone()
+        self._commit()
+        return dict(row) if row is not None else None
+
+    async def fetchval(self, sql, *args, timeout=None):
+        row = self._run(sql, args).fetchone()
+        self._commit()
+        return row[0] if row is not None else None
+
+    async def execute(self, sql, *args, timeout=None):
+        cursor = self._run(sql, args)
+        self._commit()
+        return f"UPDATE {cursor.rowcount}"
+
+    async def executemany(self, sql, args_list, timeout=None):
+        self.queries += 1
+        self.db.executemany(_PARAM.sub(r"?\1", sql), args_list)
+        self._commit()
+
+    @asynccontextmanager
+    async def transaction(self):
+        self._in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self.db.rollback()
+            raise
+        else:
+            self.db.commit()
+        finally:
+            self._in_transaction = False
+
+    def close(self):
+        self.db.close()
+
+
+class SQLiteDatabase(Database):
+    """Замена пула на одном соединении SQLite для тестов и локального запуска"""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = ":memory:"):
+        super().__init__(dsn=path, min_size=1, max_size=1)
+        self.connection: Optional[SQLiteConnection] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.connection is not None
+
+    async def open(self):
+        if not self.is_open:
+            self.connection = SQLiteConnection(self.dsn)
+            self.connection.query_observer = self.query_observer
+            self._lock = asyncio.Lock()
+
+    async def close(self):
+        if self.is_open:
+            self.connection.close()
+            self.connection = None
+
+    @asynccontextmanager
+    async def acquire(self):
+        started = time.perf_counter()
+        async with self._lock:
+            self._metrics.acquired(time.perf_counter() - started)
+            try:
+                yield self.connection
+            finally:
+                self._metrics.in_use -= 1
+
+    async def _hot(self, name: str, *args):
+        return await self.fetchrow(HOT_QUERIES[name], *args)
+
+    def stats(self) -> PoolStats:
+        size = 1 if self.is_open else 0
+        idle = size if self._lock is None or not self._lock.locked() else 0
+        return self._metrics.stats(self.backend, size, idle, 1, 1)
+
+
+def create_database() -> Database:
+    """Пул по переменным окружения; DATABASE_URL=sqlite:///path включает SQLite-замену"""
+    url = os.getenv("DATABASE_URL", "")
+    if url.startswith("sqlite:///"):
+        return SQLiteDatabase(url[len("sqlite:///"):] or ":memory:")
+    return Database(
+        min_size=int(os.getenv("DB_POOL_MIN", "2")),
+        max_size=int(os.getenv("DB_POOL_MAX", "10")),
+    )
+
+
+# Пул приложения: открывается в LoyaltyBot._initialize_bot, закрывается в _shutdown
+database = create_database()
+
+
+@asynccontextmanager
+async def connect():
+    """Соединение из пула приложения, а вне бота — отдельное соединение"""
+    if database.is_open:
+        async with database.acquire() as connection:
+            yield connection
+        return
+
+    import asyncpg
+
+    connection = await asyncpg.connect(database_dsn())
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+
+async def has_role(connection, telegram_id: int, roles: Sequence[str]) -> bool:
+    """Есть ли у активного сотрудника с данным telegram_id одна из ролей"""
+    role = await connection.fetchval(
+        "SELECT role FROM users WHERE telegram_id = $1 AND is_active = true", telegram_id
+    )
+    return role in roles
@@ -0,0 +1,186 @@
+"""
+Конкурентный диспетчер обновлений с сохранением порядка внутри чата
+
+Обновления разных чатов обрабатываются параллельно ограниченным пулом
+воркеров, а обновления одного чата — строго по очереди, поэтому шаги
+одного ConversationHandler никогда не переставляются местами.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+Job = Callable[[], Awaitable[Any]]
+
+
+def chat_key(update) -> Hashable:
+    """Ключ упорядочивания для обновления: чат, затем пользователь, затем само обновление"""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    if user is not None:
+        return ("user", user.id)
+    return ("update", getattr(update, "update_id", id(update)))
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+@dataclass
+class DispatcherStats:
+    """Снимок метрик диспетчера (время — в миллисекундах)"""
+    workers: int
+    queue_depth: int
+    max_queue_depth: int
+    active_chats: int
+    in_flight: int
+    processed: int
+    failed: int
+    latency_p50_ms: float
+    latency_p95_ms: float
+    latency_p99_ms: float
+    wait_p50_ms: float
+    wait_p99_ms: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(self.__dict__)
+
+
+class ChatOrderedDispatcher:
+    """Ограниченный пул воркеров с очередью на каждый чат"""
+
+    def __init__(self, workers: int = 8, max_pending: int = 1000, latency_window: int = 2048):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        if max_pending < 1:
+            raise ValueError("max_pending must be >= 1")
+
+        self.workers = workers
+        self.max_pending = max_pending
+
+        self._pending: Dict[Hashable, Deque[Tuple[float, Job]]] = {}
+        self._scheduled: Set[Hashable] = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._drained: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+        self._queue_depth = 0
+        self._max_queue_depth = 0
+        self._in_flight = 0
+        self._processed = 0
+        self._failed = 0
+        self._latencies: Deque[float] = deque(maxlen=latency_window)
+        self._waits: Deque[float] = deque(maxlen=latency_window)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Запуск воркеров в текущем event loop"""
+        if self.running:
+            return
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Update dispatcher started: {self.workers} workers, max pending {self.max_pending}")
+
+    async def stop(self, drain: bool = True):
+        """Остановка воркеров; при drain=True сначала дорабатывает очередь"""
+        if not self.running:
+            return
+        if drain:
+            await self._drained.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Update dispatcher stopped")
+
+    async def submit(self, key: Hashable, job: Job):
+        """Поставить задачу в очередь чата; ждёт, если очередь переполнена"""
+        if not self.running:
+            raise RuntimeError("Dispatcher is not started")
+
+        await self._slots.acquire()
+        self._queue_depth += 1
+        self._max_queue_depth = max(self._max_queue_depth, self._queue_depth)
+        self._drained.clear()
+
+        self._pending.setdefault(key, deque()).append((time.perf_counter(), job))
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+
+    async def join(self):
+        """Дождаться обработки всех поставленных задач"""
+        if self.running:
+            await self._drained.wait()
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._pending[key]
+            enqueued_at, job = queue.popleft()
+
+            started_at = time.perf_counter()
+            self._in_flight += 1
+            try:
+                await job()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._failed += 1
+                logger.exception(f"Unhandled error while processing update for {key!r}")
+            finally:
+                finished_at = time.perf_counter()
+                self._in_flight -= 1
+                self._processed += 1
+                self._waits.append(started_at - enqueued_at)
+                self._latencies.append(finished_at - enqueued_at)
+
+                # Чат возвращается в конец общей очереди, чтобы не монополизировать воркеры
+                if queue:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+                    self._scheduled.discard(key)
+
+                self._queue_depth -= 1
+                self._slots.release()
+                if self._queue_depth == 0:
+                    self._drained.set()
+
+    def stats(self) -> DispatcherStats:
+        latencies = sorted(self._latencies)
+        waits = sorted(self._waits)
+        return DispatcherStats(
+            workers=self.workers,
+            queue_depth=self._queue_depth,
+            max_queue_depth=self._max_queue_depth,
+            active_chats=len(self._scheduled),
+            in_flight=self._in_flight,
+            processed=self._processed,
+            failed=self._failed,
+            latency_p50_ms=_percentile(latencies, 0.50) * 1000,
+            latency_p95_ms=_percentile(latencies, 0.95) * 1000,
+            latency_p99_ms=_percentile(latencies, 0.99) * 1000,
+            wait_p50_ms=_percentile(waits, 0.50) * 1000,
+            wait_p99_ms=_percentile(waits, 0.99) * 1000,
+        )
@@ -0,0 +1,303 @@
+"""
+Потоковый экспорт таблиц в CSV/JSONL
+
+Строки читаются страницами с keyset-пагинацией, пишутся генератором во
+временный spooled-файл (опционально gzip) и отправляются частями, поэтому
+расход памяти ограничен размером страницы и части, а не объёмом таблицы.
+Для инкрементального экспорта позиция последней выгруженной строки
+сохраняется в export_state.
+
+Соединение берётся из пула на каждый запрос и не держится, пока часть
+файла отправляется в Telegram. Позиция не заходит за границу
+зафиксированных строк (commit_horizon): строка, чья транзакция началась
+раньше, но зафиксировалась позже прохода, попадёт в следующий экспорт.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import logging
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.utils.commit_horizon import time_horizon
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 5000
+PART_SIZE = 20 * 1024 * 1024
+SPOOL_SIZE = 4 * 1024 * 1024
+PROGRESS_INTERVAL = 3.0
+
+Upload = Callable[[Any, str, str], Awaitable[None]]
+Progress = Callable[[str, int], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class ExportTable:
+    """Описание выгружаемой таблицы"""
+    name: str
+    columns: Tuple[str, ...]
+    # Колонка с NOW() последней записи для инкрементального экспорта; None — только полный экспорт
+    changed_column: Optional[str] = None
+
+    def keys(self, incremental: bool) -> Tuple[str, ...]:
+        if incremental and self.changed_column:
+            return (self.changed_column, "id")
+        return ("id",)
+
+
+EXPORT_TABLES: Dict[str, ExportTable] = {
+    "clients": ExportTable(
+        "clients",
+        ("id", "telegram_id", "card_number", "full_name", "phone", "birth_date", "balance",
+         "total_spent", "visit_count", "last_visit", "notes", "is_active", "created_at", "updated_at"),
+        changed_column="updated_at",
+    ),
+    "point_transactions": ExportTable(
+        "point_transactions",
+        ("id", "client_id", "operator_id", "operation_type", "points", "amount", "description", "created_at"),
+        changed_column="created_at",
+    ),
+    "activity_log": ExportTable(
+        "activity_log",
+        ("id", "user_id", "action", "target_type", "target_id", "details", "created_at"),
+        changed_column="created_at",
+    ),
+}
+
+
+def _plain(value: Any) -> Any:
+    """Значение, пригодное для CSV/JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _csv_value(value: Any) -> Any:
+    value = _plain(value)
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return "" if value is None else value
+
+
+def _watermark_value(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def keyset_query(table: ExportTable, keys: Sequence[str], has_after: bool, bounded: bool = False) -> str:
+    """SELECT страницы после заданного ключа в порядке ключа
+
+    bounded — только строки с первым ключом меньше последнего параметра перед LIMIT.
+    """
+    columns = ", ".join(table.columns)
+    order = ", ".join(keys)
+    conditions = []
+    params = 0
+    if has_after:
+        params = len(keys)
+        placeholders = ", ".join(f"${i}" for i in range(1, params + 1))
+        conditions.append(f"({order}) > ({placeholders})" if params > 1 else f"{order} > $1")
+    if bounded:
+        params += 1
+        conditions.append(f"{keys[0]} < ${params}")
+    where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+    return f"SELECT {columns} FROM {table.name} {where}ORDER BY {order} LIMIT ${params + 1}"
+
+
+async def iter_pages(db, table: ExportTable, keys: Sequence[str], after: Optional[Sequence[Any]] = None,
+                     page_size: int = PAGE_SIZE, until: Any = None):
+    """Асинхронный генератор страниц строк (список dict)
+
+    Соединение пула берётся только на чтение страницы. until — граница первого ключа.
+    """
+    while True:
+        sql = keyset_query(table, keys, after is not None, until is not None)
+        params = [*(after or ()), *([until] if until is not None else ()), page_size]
+        async with db.acquire() as connection:
+            rows = [dict(row) for row in await connection.fetch(sql, *params)]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        after = [last[key] for key in keys]
+
+
+class _PartWriter:
+    """Одна часть файла экспорта во временном spooled-файле"""
+
+    def __init__(self, filename: str, columns: Sequence[str], fmt: str, compress: bool):
+        self.filename = filename + (".gz" if compress else "")
+        self.columns = columns
+        self.fmt = fmt
+        self.rows = 0
+        self.spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self._gzip = gzip.GzipFile(fileobj=self.spool, mode="wb") if compress else None
+        encoding = "utf-8-sig" if fmt == "csv" else "utf-8"
+        self._text = io.TextIOWrapper(self._gzip or self.spool, encoding=encoding, newline="")
+        self._csv = csv.writer(self._text) if fmt == "csv" else None
+        if self._csv:
+            self._csv.writerow(columns)
+
+    def write(self, rows: Iterable[Dict[str, Any]]):
+        if self._csv:
+            self._csv.writerows([_csv_value(row[column]) for column in self.columns] for row in rows)
+        else:
+            self._text.writelines(
+                json.dumps({column: _plain(row[column]) for column in self.columns}, ensure_ascii=False) + "\n"
+                for row in rows
+            )
+
+    @property
+    def size(self) -> int:
+        self._text.flush()
+        return self.spool.tell()
+
+    def finish(self):
+        """Закрыть поток записи и вернуть файл, готовый к чтению с начала"""
+        self._text.flush()
+        self._text.detach()
+        if self._gzip:
+            self._gzip.close()
+        self.spool.seek(0)
+        return self.spool
+
+
+@dataclass
+class TableExportResult:
+    table: str
+    rows: int = 0
+    parts: List[str] = field(default_factory=list)
+    last_key: Optional[List[Any]] = None
+
+
+class StreamingExporter:
+    """Экспорт таблиц страницами с отправкой файла по частям"""
+
+    def __init__(self, db, upload: Upload, progress: Optional[Progress] = None,
+                 fmt: str = "csv", compress: bool = False,
+                 page_size: int = PAGE_SIZE, part_size: int = PART_SIZE):
+        if fmt not in ("csv", "jsonl"):
+            raise ValueError(f"Unsupported export format: {fmt}")
+        self.db = db
+        self.upload = upload
+        self.progress = progress
+        self.fmt = fmt
+        self.compress = compress
+        self.page_size = page_size
+        self.part_size = part_size
+        self._last_progress = 0.0
+
+    async def export(self, table_names: Sequence[str], incremental: bool = False) -> List[TableExportResult]:
+        results = []
+        for name in table_names:
+            results.append(await self.export_table(EXPORT_TABLES[name], incremental))
+        return results
+
+    async def export_table(self, table: ExportTable, incremental: bool = False) -> TableExportResult:
+        keys = table.keys(incremental)
+        watermark_keys = table.keys(True)
+        async with self.db.acquire() as connection:
+            after = await self._load_watermark(connection, table, keys) if incremental else None
+            until = await time_horizon(connection) if table.changed_column else None
+        result = TableExportResult(table.name)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = "_changes" if incremental else ""
+
+        def new_part() -> _PartWriter:
+            number = len(result.parts) + 1
+            return _PartWriter(f"{table.name}{suffix}_{stamp}_part{number}.{self.fmt}", table.columns,
+                               self.fmt, self.compress)
+
+        part = new_part()
+        # Полный экспорт читает всё, но позицию сохраняет только до границы
+        bound = until if incremental else None
+        async for rows in iter_pages(self.db, table, keys, after, self.page_size, bound):
+            # Запись в файл — в отдельном потоке, чтобы не блокировать event loop
+            await asyncio.to_thread(part.write, rows)
+            part.rows += len(rows)
+            result.rows += len(rows)
+            page_keys = [[row[key] for key in watermark_keys] for row in rows]
+            page_keys = [key for key in page_keys if None not in key and (until is None or key[0] < until)]
+            if page_keys:
+                page_max = max(page_keys)
+                result.last_key = page_max if result.last_key is None else max(result.last_key, page_max)
+
+            if part.size >= self.part_size:
+                await self._upload_part(part, result)
+                part = new_part()
+            await self._report(table.name, result.rows)
+
+        if part.rows:
+            await self._upload_part(part, result)
+        else:
+            part.finish().close()
+        await self._report(table.name, result.rows, force=True)
+
+        if result.last_key is not None:
+            async with self.db.acquire() as connection:
+                await self._save_watermark(connection, table, watermark_keys, result)
+        logger.info(f"Export of {table.name}: {result.rows} rows in {len(result.parts)} part(s)")
+        return result
+
+    async def _upload_part(self, part: _PartWriter, result: TableExportResult):
+        fileobj = await asyncio.to_thread(part.finish)
+        try:
+            caption = f"{result.table}: часть {len(result.parts) + 1}, строк {part.rows}"
+            await self.upload(fileobj, part.filename, caption)
+        finally:
+            fileobj.close()
+        result.parts.append(part.filename)
+
+    async def _report(self, table: str, rows: int, force: bool = False):
+        now = time.monotonic()
+        if self.progress and (force or now - self._last_progress >= PROGRESS_INTERVAL):
+            self._last_progress = now
+            try:
+                await self.progress(table, rows)
+            except Exception as e:
+                logger.warning(f"Export progress update failed: {e}")
+
+    @staticmethod
+    async def _load_watermark(connection, table: ExportTable, keys: Sequence[str]) -> Optional[List[Any]]:
+        row = await connection.fetchrow(
+            "SELECT last_key FROM export_state WHERE table_name = $1", table.name
+        )
+        if row is None:
+            return None
+        last_key = row["last_key"]
+        if isinstance(last_key, str):
+            last_key = json.loads(last_key)
+        if any(key not in last_key for key in keys):
+            return None
+        return [_watermark_value(last_key[key]) for key in keys]
+
+    @staticmethod
+    async def _save_watermark(connection, table: ExportTable, keys: Sequence[str], result: TableExportResult):
+        last_key = {key: _plain(value) for key, value in zip(keys, result.last_key)}
+        await connection.execute(
+            """
+            INSERT INTO export_state (table_name, last_key, rows_exported, exported_at)
+            VALUES ($1, $2, $3, NOW())
+            ON CONFLICT (table_name) DO UPDATE
+            SET last_key = EXCLUDED.last_key,
+                rows_exported = export_state.rows_exported + EXCLUDED.rows_exported,
+                exported_at = EXCLUDED.exported_at
+            """,
+            table.name, json.dumps(last_key), result.rows
+        )
@@ -0,0 +1,205 @@
+"""
+Журнал баллов: атомарные и идемпотентные начисления и списания
+
+Каждая операция — одно выражение: UPDATE clients ... RETURNING с
+проверкой баланса (balance + delta >= 0) и вставка в point_transactions
+в том же запросе. Чтения и последующей записи баланса нет, поэтому
+строка клиента блокируется только на время самого UPDATE, а два
+бариста не могут списать одни и те же баллы.
+
+Повторная доставка обновления Telegram даёт тот же ключ идемпотентности
+(чат + update_id). Уникальный индекс point_transactions.idempotency_key
+отклоняет повтор целиком, и вызывающий получает результат первой операции.
+
+clients.total_spent ведёт триггер log_point_transaction (миграция 009):
+так же он обновляется и при операциях сервисов TypeScript.
+"""
+
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Optional
+
+from src.utils.client_cache import client_cache
+
+logger = logging.getLogger(__name__)
+
+EARN = "earn"
+SPEND = "spend"
+BONUS = "bonus"
+ADJUST = "adjust"
+
+# Операции, которые считаются визитом клиента (как в триггере из миграции 004)
+VISIT_OPERATIONS = (EARN, SPEND)
+
+APPLY_SQL = """
+WITH changed AS (
+    UPDATE clients
+    SET balance = balance + $3,
+        visit_count = CASE WHEN $4 THEN COALESCE(visit_count, 0) + 1 ELSE visit_count END,
+        last_visit = CASE WHEN $4 THEN NOW() ELSE last_visit END,
+        updated_at = NOW()
+    WHERE id = $1 AND is_active = true AND balance + $3 >= 0
+    RETURNING id, balance
+)
+INSERT INTO point_transactions
+    (client_id, operator_id, operation_type, points, amount, description, idempotency_key, balance_after)
+SELECT id, $2, $5, $3, $6, $7, $8, balance FROM changed
+RETURNING id, balance_after
+"""
+
+# SQLite-замена не поддерживает изменяющие CTE: те же два шага в одной транзакции
+UPDATE_SQL = """
+UPDATE clients
+SET balance = balance + $2,
+    visit_count = CASE WHEN $3 THEN COALESCE(visit_count, 0) + 1 ELSE visit_count END,
+    last_visit = CASE WHEN $3 THEN NOW() ELSE last_visit END,
+    updated_at = NOW()
+WHERE id = $1 AND is_active = true AND balance + $2 >= 0
+RETURNING balance
+"""
+
+INSERT_SQL = """
+INSERT INTO point_transactions
+    (client_id, operator_id, operation_type, points, amount, description, idempotency_key, balance_after)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+RETURNING id, balance_after
+"""
+
+REPLAY_SQL = """
+SELECT id, client_id, operation_type, points, balance_after
+FROM point_transactions WHERE idempotency_key = $1
+"""
+
+
+class LedgerError(Exception):
+    """Операция с баллами не выполнена"""
+
+
+class ClientNotFound(LedgerError):
+    pass
+
+
+class InsufficientPoints(LedgerError):
+    def __init__(self, available: int, requested: int):
+        super().__init__(f"Insufficient points. Available: {available}, requested: {requested}")
+        self.available = available
+        self.requested = requested
+
+
+class IdempotencyConflict(LedgerError):
+    """Ключ уже использован для другой операции"""
+
+
+@dataclass
+class LedgerResult:
+    transaction_id: int
+    client_id: int
+    operation_type: str
+    points: int
+    balance: int
+    replayed: bool = False
+
+
+def idempotency_key(update, operation: str = "") -> Optional[str]:
+    """Ключ операции из чата и update_id; None, если обновление без чата"""
+    chat = update.effective_chat
+    if chat is None or update.update_id is None:
+        return None
+    key = f"tg:{chat.id}:{update.update_id}"
+    return f"{key}:{operation}" if operation else key
+
+
+def _is_unique_violation(error: Exception) -> bool:
+    return getattr(error, "sqlstate", None) == "23505" or isinstance(error, sqlite3.IntegrityError)
+
+
+class PointLedger:
+    """Изменение баланса клиента с записью в point_transactions"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def earn(self, client_id: int, operator_id: int, points: int, amount=None,
+                   description: Optional[str] = None, key: Optional[str] = None) -> LedgerResult:
+        """Начисление за покупку: баланс и визит; total_spent на сумму покупки — триггером"""
+        if points <= 0:
+            raise ValueError("Points to earn must be positive")
+        return await self.apply(client_id, operator_id, EARN, points, amount=amount,
+                                description=description or f"Начислено {points} баллов", key=key)
+
+    async def spend(self, client_id: int, operator_id: int, points: int,
+                    description: Optional[str] = None, key: Optional[str] = None) -> LedgerResult:
+        """Списание баллов; при нехватке — InsufficientPoints без изменений"""
+        if points <= 0:
+            raise ValueError("Points to spend must be positive")
+        return await self.apply(client_id, operator_id, SPEND, -points,
+                                description=description or f"Списано {points} баллов", key=key)
+
+    async def bonus(self, client_id: int, operator_id: int, points: int,
+                    description: str, key: Optional[str] = None) -> LedgerResult:
+        return await self.apply(client_id, operator_id, BONUS, points, description=description, key=key)
+
+    async def adjust(self, client_id: int, operator_id: int, delta: int,
+                     description: str, key: Optional[str] = None) -> LedgerResult:
+        return await self.apply(client_id, operator_id, ADJUST, delta, description=description, key=key)
+
+    async def apply(self, client_id: int, operator_id: int, operation_type: str, delta: int,
+                    amount=None, description: Optional[str] = None, key: Optional[str] = None) -> LedgerResult:
+        visit = operation_type in VISIT_OPERATIONS
+
+        async with self.db.acquire() as connection:
+            if key is not None:
+                replay = await self._replay(connection, key, client_id, operation_type, delta)
+                if replay is not None:
+                    return replay
+
+            try:
+                row = await self._execute(
+                    connection, client_id, operator_id, operation_type, delta, visit, amount, description, key
+                )
+            except Exception as e:
+                # Параллельный повтор с тем же ключом успел зафиксироваться первым
+                if key is None or not _is_unique_violation(e):
+                    raise
+                replay = await self._replay(connection, key, client_id, operation_type, delta)
+                if replay is None:
+                    raise
+                return replay
+
+            if row is None:
+                available = await connection.fetchval(
+                    "SELECT balance FROM clients WHERE id = $1 AND is_active = true", client_id
+                )
+                if available is None:
+                    raise ClientNotFound(f"Client {client_id} not found")
+                raise InsufficientPoints(available, abs(delta))
+
+        client_cache.invalidate_client(client_id)
+        return LedgerResult(row["id"], client_id, operation_type, delta, row["balance_after"])
+
+    async def _execute(self, connection, client_id, operator_id, operation_type, delta, visit,
+                       amount, description, key):
+        if getattr(connection, "dialect", "postgresql") == "postgresql":
+            return await connection.fetchrow(
+                APPLY_SQL, client_id, operator_id, delta, visit, operation_type, amount, description, key
+            )
+
+        async with connection.transaction():
+            balance = await connection.fetchval(UPDATE_SQL, client_id, delta, visit)
+            if balance is None:
+                return None
+            return await connection.fetchrow(
+                INSERT_SQL, client_id, operator_id, operation_type, delta, amount, description, key, balance
+            )
+
+    @staticmethod
+    async def _replay(connection, key: str, client_id: int, operation_type: str,
+                      delta: int) -> Optional[LedgerResult]:
+        row = await connection.fetchrow(REPLAY_SQL, key)
+        if row is None:
+            return None
+        if (row["client_id"], row["operation_type"], row["points"]) != (client_id, operation_type, delta):
+            raise IdempotencyConflict(f"Idempotency key {key} was used for another operation")
+        logger.info(f"Ledger operation {key} replayed, transaction {row['id']}")
+        return LedgerResult(row["id"], client_id, operation_type, delta, row["balance_after"], replayed=True)
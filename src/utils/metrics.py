@@ -0,0 +1,199 @@
+"""
+Метрики обработчиков: задержка, время базы и Telegram API, ошибки
+
+Каждый зарегистрированный обработчик (команды, шаги диалогов, маршруты
+callback-запросов) оборачивается таймером. Время запросов к базе и к Bot
+API приписывается обработчику, внутри которого они выполнялись, через
+contextvar. Метрики отдаются в текстовом формате Prometheus (/metrics) и
+командой /perf.
+
+Если метрики выключены (METRICS_ENABLED=false), обработчики не
+оборачиваются и наблюдатели запросов не подключаются — накладных
+расходов нет совсем.
+"""
+
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from telegram.ext import BaseHandler, CommandHandler, ConversationHandler
+from telegram.request import HTTPXRequest
+
+Handler = Callable[..., Awaitable[Any]]
+
+# Границы корзин гистограммы задержки, секунды
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами (последняя — +Inf)"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                upper = LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+
+@dataclass
+class HandlerStats:
+    latency: Histogram = field(default_factory=Histogram)
+    errors: int = 0
+    db_seconds: float = 0.0
+    db_queries: int = 0
+    telegram_seconds: float = 0.0
+    telegram_calls: int = 0
+
+
+# Статистика обработчика, выполняющегося в текущей задаче
+_current: ContextVar[Optional[HandlerStats]] = ContextVar("current_handler_stats", default=None)
+
+
+def _callback_name(callback, default: str) -> str:
+    name = getattr(callback, "__name__", default)
+    return default if name == "<lambda>" else name
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+class HandlerMetrics:
+    """Реестр метрик обработчиков"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.handlers: Dict[str, HandlerStats] = {}
+
+    def wrap(self, name: str, callback: Handler) -> Handler:
+        """Обработчик, замеряющий своё выполнение; без изменений, если метрики выключены"""
+        if not self.enabled:
+            return callback
+        stats = self.handlers.setdefault(name, HandlerStats())
+
+        async def timed(*args, **kwargs):
+            token = _current.set(stats)
+            started = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - started)
+                _current.reset(token)
+
+        timed.__name__ = getattr(callback, "__name__", name)
+        timed.__wrapped__ = callback
+        return timed
+
+    def instrument(self, application, exclude: Iterable[Handler] = ()):
+        """Обернуть команды и шаги диалогов приложения; exclude — колбэки, замеряемые отдельно"""
+        if not self.enabled:
+            return
+        excluded = set(exclude)
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if isinstance(handler, ConversationHandler):
+                    self._instrument_conversation(handler)
+                elif handler.callback not in excluded:
+                    self._instrument_handler(handler, _callback_name(handler.callback, "handler"))
+
+    def _instrument_handler(self, handler: BaseHandler, name: str):
+        if isinstance(handler, CommandHandler):
+            name = "/" + "|/".join(sorted(handler.commands))
+        handler.callback = self.wrap(name, handler.callback)
+
+    def _instrument_conversation(self, conversation: ConversationHandler):
+        steps = [("entry", handler) for handler in conversation.entry_points]
+        for state, handlers in conversation.states.items():
+            steps.extend((f"state_{state}", handler) for handler in handlers)
+        steps.extend(("fallback", handler) for handler in conversation.fallbacks)
+        for default, handler in steps:
+            name = f"{conversation.name}.{_callback_name(handler.callback, default)}"
+            handler.callback = self.wrap(name, handler.callback)
+
+    @staticmethod
+    def record_db(elapsed: float):
+        stats = _current.get()
+        if stats is not None:
+            stats.db_seconds += elapsed
+            stats.db_queries += 1
+
+    @staticmethod
+    def record_telegram(elapsed: float):
+        stats = _current.get()
+        if stats is not None:
+            stats.telegram_seconds += elapsed
+            stats.telegram_calls += 1
+
+    def top(self, limit: int = 10) -> List[tuple]:
+        """Обработчики с наибольшим суммарным временем"""
+        ranked = sorted(self.handlers.items(), key=lambda item: item[1].latency.sum, reverse=True)
+        return [(name, stats) for name, stats in ranked if stats.latency.count][:limit]
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# HELP bot_handler_latency_seconds Handler execution time",
+            "# TYPE bot_handler_latency_seconds histogram",
+        ]
+        for name, stats in sorted(self.handlers.items()):
+            label = _label(name)
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), stats.latency.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'bot_handler_latency_seconds_bucket{{handler="{label}",le="{le}"}} {cumulative}')
+            lines.append(f'bot_handler_latency_seconds_sum{{handler="{label}"}} {stats.latency.sum:.6f}')
+            lines.append(f'bot_handler_latency_seconds_count{{handler="{label}"}} {stats.latency.count}')
+
+        counters = (
+            ("bot_handler_errors_total", "Handler exceptions", "errors", "{}"),
+            ("bot_handler_db_seconds_total", "Time spent in database queries", "db_seconds", "{:.6f}"),
+            ("bot_handler_db_queries_total", "Database queries", "db_queries", "{}"),
+            ("bot_handler_telegram_seconds_total", "Time spent in Bot API requests", "telegram_seconds", "{:.6f}"),
+            ("bot_handler_telegram_requests_total", "Bot API requests", "telegram_calls", "{}"),
+        )
+        for metric, description, attribute, value_format in counters:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, stats in sorted(self.handlers.items()):
+                value = value_format.format(getattr(stats, attribute))
+                lines.append(f'{metric}{{handler="{_label(name)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+class TimedRequest(HTTPXRequest):
+    """HTTPXRequest, приписывающий время запросов к Bot API текущему обработчику"""
+
+    async def do_request(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            HandlerMetrics.record_telegram(time.perf_counter() - started)
+
+
+handler_metrics = HandlerMetrics()
@@ -0,0 +1,262 @@
+"""
+Хранение состояния ConversationHandler и user_data в базе
+
+DatabasePersistence — бэкенд BasePersistence поверх Database (asyncpg)
+или SQLiteDatabase. PTB сам вызывает update_* раз в update_interval
+секунд, а не на каждое обновление; здесь эти вызовы только
+складываются в буфер, а запись выполняется одной транзакцией. Данные
+хранятся как pickle (со сжатием zlib для больших значений), неизменённые
+записи повторно не пишутся.
+
+Незавершённые диалоги и user_data, к которым не обращались дольше TTL,
+не загружаются при старте и периодически удаляются из таблицы. TTL
+считается от последнего обращения: у неизменённой записи updated_at
+продлевается лёгким UPDATE не чаще раза в четверть TTL, а записи,
+удалённые очисткой, при следующем обращении пишутся заново.
+
+При шардировании (src.utils.sharding) каждый процесс загружает и пишет
+только записи своих чатов: owns получает id чата (для user_data — id
+пользователя, в личном чате они совпадают). user_data пользователя,
+пришедшего из группового чата другого шарда, остаётся в памяти этого
+процесса и не перезаписывает строку шарда-владельца.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import pickle
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user"
+CONVERSATION_PREFIX = "conv:"
+
+FLUSH_INTERVAL = 10.0
+STATE_TTL = 24 * 3600
+CLEANUP_INTERVAL = 3600
+COMPRESS_FROM = 256
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+UPSERT_SQL = """
+INSERT INTO bot_persistence (kind, key, data, updated_at) VALUES ($1, $2, $3, $4)
+ON CONFLICT (kind, key) DO UPDATE SET data = EXCLUDED.data, updated_at = EXCLUDED.updated_at
+"""
+
+TOUCH_SQL = "UPDATE bot_persistence SET updated_at = $3 WHERE kind = $1 AND key = $2"
+CLEANUP_SQL = "DELETE FROM bot_persistence WHERE updated_at < $1 RETURNING kind, key"
+
+
+def dumps(value: Any) -> bytes:
+    """Компактная сериализация: pickle, сжатый при размере от COMPRESS_FROM байт"""
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(data) >= COMPRESS_FROM:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return _ZLIB + compressed
+    return _RAW + data
+
+
+def loads(blob: bytes) -> Any:
+    blob = bytes(blob)
+    data = zlib.decompress(blob[1:]) if blob[:1] == _ZLIB else blob[1:]
+    return pickle.loads(data)
+
+
+def conversation_key(key: Tuple) -> str:
+    return json.dumps(list(key), separators=(",", ":"))
+
+
+class DatabasePersistence(BasePersistence):
+    """Диалоги и user_data в таблице bot_persistence с пакетной записью"""
+
+    def __init__(self, db, update_interval: float = FLUSH_INTERVAL, ttl: float = STATE_TTL,
+                 clock=time.time, owns: Optional[Callable[[int], bool]] = None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self.ttl = ttl
+        self._clock = clock
+        self.owns = owns
+        # (kind, key) -> сериализованные данные или None для удаления
+        self._pending: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._written: Dict[Tuple[str, str], bytes] = {}
+        # Время последней записи или продления updated_at
+        self._touched_at: Dict[Tuple[str, str], float] = {}
+        self._touches: Set[Tuple[str, str]] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._last_cleanup = 0.0
+        self.flushes = 0
+        self.rows_written = 0
+
+    def _now(self) -> datetime:
+        return datetime.fromtimestamp(self._clock())
+
+    def _cutoff(self) -> datetime:
+        return self._now() - timedelta(seconds=self.ttl)
+
+    async def _load(self, kind: str) -> Dict[str, Any]:
+        rows = await self.db.fetch(
+            "SELECT key, data FROM bot_persistence WHERE kind = $1 AND updated_at >= $2", kind, self._cutoff()
+        )
+        result = {}
+        for row in rows:
+            try:
+                result[row["key"]] = loads(row["data"])
+            except Exception as e:
+                logger.warning(f"Skipping unreadable persisted {kind} {row['key']}: {e}")
+                continue
+            self._written[(kind, row["key"])] = hashlib.blake2b(bytes(row["data"]), digest_size=8).digest()
+        return result
+
+    def _owned(self, chat_id: Any) -> bool:
+        return self.owns is None or chat_id is None or self.owns(int(chat_id))
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {
+            int(key): value for key, value in (await self._load(USER_DATA)).items() if self._owned(key)
+        }
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        states = await self._load(CONVERSATION_PREFIX + name)
+        conversations = {}
+        for key, state in states.items():
+            key = tuple(json.loads(key))
+            if self._owned(key[0] if key else None):
+                conversations[key] = state
+        return conversations
+
+    def _stage(self, kind: str, key: str, value: Any, delete: bool = False):
+        if delete:
+            blob = None
+        else:
+            try:
+                blob = dumps(value)
+            except Exception as e:
+                logger.warning(f"Cannot persist {kind} {key}: {e}")
+                return
+        digest = hashlib.blake2b(blob, digest_size=8).digest() if blob is not None else None
+        item = (kind, key)
+        if self._written.get(item) == digest:
+            self._pending.pop(item, None)
+            # Обращение без изменений продлевает TTL записи
+            if digest is not None and self._clock() - self._touched_at.get(item, 0.0) >= self.ttl / 4:
+                self._touches.add(item)
+                self._schedule()
+            return
+        self._pending[item] = blob
+        self._schedule()
+
+    def _schedule(self):
+        if self._flush_task is None or self._flush_task.done():
+            # PTB вызывает update_* пачкой через gather: пишем всё после неё одним заходом
+            self._flush_task = asyncio.create_task(self._write_pending())
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        if self._owned(key[0] if key else None):
+            self._stage(CONVERSATION_PREFIX + name, conversation_key(key), new_state, delete=new_state is None)
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]):
+        if self._owned(user_id):
+            self._stage(USER_DATA, str(user_id), data, delete=not data)
+
+    async def drop_user_data(self, user_id: int):
+        if self._owned(user_id):
+            self._stage(USER_DATA, str(user_id), None, delete=True)
+
+    async def update_chat_data(self, chat_id: int, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def _write_pending(self):
+        if not self._pending and not self._touches:
+            return
+        pending, self._pending = self._pending, {}
+        touches, self._touches = self._touches - pending.keys(), set()
+        now = self._now()
+        upserts = [(kind, key, blob, now) for (kind, key), blob in pending.items() if blob is not None]
+        deletes = [(kind, key) for (kind, key), blob in pending.items() if blob is None]
+        expired = []
+        try:
+            async with self.db.acquire() as connection:
+                async with connection.transaction():
+                    if upserts:
+                        await connection.executemany(UPSERT_SQL, upserts)
+                    if deletes:
+                        await connection.executemany(
+                            "DELETE FROM bot_persistence WHERE kind = $1 AND key = $2", deletes
+                        )
+                    if touches:
+                        await connection.executemany(TOUCH_SQL, [(kind, key, now) for kind, key in touches])
+                    cleanup = self._clock() - self._last_cleanup >= CLEANUP_INTERVAL
+                    if cleanup:
+                        expired = await connection.fetch(CLEANUP_SQL, self._cutoff())
+        except Exception as e:
+            # Вернём в буфер то, что не перезаписано новыми вызовами, и попробуем в следующий раз
+            logger.error(f"Persistence flush failed: {e}")
+            for item, blob in pending.items():
+                self._pending.setdefault(item, blob)
+            self._touches |= touches
+            return
+
+        if cleanup:
+            self._last_cleanup = self._clock()
+        written_at = self._clock()
+        for item, blob in pending.items():
+            if blob is None:
+                self._written.pop(item, None)
+                self._touched_at.pop(item, None)
+            else:
+                self._written[item] = hashlib.blake2b(blob, digest_size=8).digest()
+                self._touched_at[item] = written_at
+        for item in touches:
+            self._touched_at[item] = written_at
+        # Строки удалены очисткой: следующее обращение запишет их заново
+        for row in expired:
+            item = (row["kind"], row["key"])
+            self._written.pop(item, None)
+            self._touched_at.pop(item, None)
+        self.flushes += 1
+        self.rows_written += len(pending)
+
+    async def flush(self):
+        """Запись буфера при остановке приложения"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self._write_pending()
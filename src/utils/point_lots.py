@@ -0,0 +1,354 @@
+"""
+Сгорание баллов по points_expiry_days: партии баллов (FIFO)
+
+Каждое начисление в point_transactions (earn, bonus, положительный
+adjust) становится партией point_lots со своей датой сгорания, каждое
+списание погашает самые старые открытые партии. Партии пополняются
+догоняющим заданием, как сводки статистики: проход читает только
+транзакции с id больше сохранённого в point_lot_state и не дальше
+границы зафиксированных id (commit_horizon), поэтому учтены все
+источники операций, а списание, зафиксированное позже транзакций с
+большими id, не будет пропущено.
+
+Ночное задание выбирает по индексу только партии, срок которых наступил,
+и одной командой закрывает их, уменьшает баланс клиентов и пишет
+операции adjust. Работа за ночь пропорциональна числу сгорающих партий.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.utils.birthday import OPERATOR_SQL
+from src.utils.client_cache import client_cache
+from src.utils.commit_horizon import id_horizon
+from src.utils.ledger import ADJUST, INSERT_SQL
+from src.utils.stats_rollups import ConcurrentCatchUp
+
+logger = logging.getLogger(__name__)
+
+CATCH_UP_BATCH = 20000
+LOTS_STATE = "point_transactions"
+DEFAULT_EXPIRY_DAYS = 365
+# Совпадает по стилю с описанием бонусов на день рождения
+EXPIRY_DESCRIPTION = "Points expired (auto)"
+# Операции сгорания уже погасили свои партии и пропускаются догоняющим заданием
+EXPIRY_KEY_PREFIX = "expire:"
+# Повторные проходы для клиентов с операциями, пришедшими во время сгорания
+EXPIRY_PASSES = 3
+
+EXPIRY_DAYS_SQL = "SELECT value FROM system_settings WHERE key = 'points_expiry_days'"
+
+OPEN_LOTS_SQL = "SELECT id, remaining FROM point_lots WHERE client_id = $1 AND remaining > 0 ORDER BY id"
+
+# Клиенты, чьи операции ещё не учтены в партиях, пропускаются до следующего прохода:
+# иначе сгорели бы баллы, которые уже потрачены
+EXPIRE_SQL = """
+WITH due AS (
+    SELECT client_id, SUM(remaining) AS points
+    FROM point_lots
+    WHERE expires_at <= $1 AND remaining > 0
+    GROUP BY client_id
+), locked AS (
+    SELECT c.id, LEAST(c.balance, d.points) AS points
+    FROM clients c JOIN due d ON d.client_id = c.id
+    WHERE NOT EXISTS (SELECT 1 FROM point_transactions t WHERE t.client_id = c.id AND t.id > $2)
+    FOR UPDATE OF c
+), closed AS (
+    UPDATE point_lots l
+    SET remaining = 0, expired_at = NOW()
+    FROM locked k
+    WHERE l.client_id = k.id AND l.expires_at <= $1 AND l.remaining > 0
+), debited AS (
+    UPDATE clients c
+    SET balance = c.balance - k.points, updated_at = NOW()
+    FROM locked k
+    WHERE c.id = k.id AND k.points > 0
+    RETURNING c.id, c.balance, k.points
+), logged AS (
+    INSERT INTO point_transactions
+        (client_id, operator_id, operation_type, points, amount, description, idempotency_key, balance_after)
+    SELECT id, $3, 'adjust', -points, 0, $4, $5::text || id, balance FROM debited
+)
+SELECT id, points FROM debited ORDER BY id
+"""
+
+DUE_SQL = """
+SELECT client_id, SUM(remaining) AS points
+FROM point_lots
+WHERE expires_at <= $1 AND remaining > 0
+GROUP BY client_id
+ORDER BY client_id
+"""
+
+CLOSE_SQL = """
+UPDATE point_lots SET remaining = 0, expired_at = NOW()
+WHERE client_id = $1 AND expires_at <= $2 AND remaining > 0
+"""
+
+PENDING_SQL = "SELECT 1 FROM point_transactions WHERE client_id = $1 AND id > $2 LIMIT 1"
+
+
+def _timestamp(value: Any) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+@dataclass
+class _Lot:
+    id: Optional[int]
+    client_id: int
+    transaction_id: int
+    points: int
+    remaining: int
+    earned_at: datetime
+    expires_at: Optional[date]
+    consumed: int = 0
+
+
+@dataclass
+class ExpiryRunResult:
+    day: date
+    expired: List[Tuple[int, int]] = field(default_factory=list)
+    skipped: int = 0
+
+    @property
+    def points(self) -> int:
+        return sum(points for _, points in self.expired)
+
+    @property
+    def summary(self) -> str:
+        return (
+            f"⌛ Сгорание баллов {self.day:%d.%m.%Y}: клиентов {len(self.expired)}, "
+            f"баллов {self.points}, отложено {self.skipped}"
+        )
+
+
+class PointLots:
+    """Партии баллов: догоняющее заполнение, пересчёт с нуля и ночное сгорание"""
+
+    def __init__(self, db, batch_size: int = CATCH_UP_BATCH):
+        self.db = db
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+
+    async def catch_up(self) -> int:
+        """Учесть новые транзакции в партиях; возвращает число транзакций"""
+        async with self._lock:
+            return await self._catch_up()
+
+    async def backfill(self, not_before: Optional[date] = None) -> int:
+        """Построить партии заново по всей истории point_transactions
+
+        not_before — самая ранняя дата сгорания: партии, срок которых по
+        истории уже прошёл, сгорят не раньше неё, а не в первую же ночь.
+        """
+        async with self._lock:
+            async with self.db.acquire() as connection:
+                async with connection.transaction():
+                    await connection.execute("DELETE FROM point_lots")
+                    await connection.execute("DELETE FROM point_lot_state")
+            return await self._catch_up(not_before)
+
+    async def _catch_up(self, not_before: Optional[date] = None) -> int:
+        bound = await self._horizon()
+        if bound is None:
+            return 0
+        processed = 0
+        while True:
+            try:
+                count = await self._catch_up_batch(bound, not_before)
+            except ConcurrentCatchUp as e:
+                # Пакет откатился целиком, партии уже учитывают его транзакции
+                logger.info(f"Point lots: {e}")
+                return processed
+            processed += count
+            if count < self.batch_size:
+                return processed
+
+    async def _state(self, connection) -> Dict[str, Any]:
+        row = await connection.fetchrow(
+            "SELECT last_id, pending_id, pending_at FROM point_lot_state WHERE name = $1", LOTS_STATE
+        )
+        if row is None:
+            await connection.execute(
+                "INSERT INTO point_lot_state (name, last_id) VALUES ($1, 0) ON CONFLICT (name) DO NOTHING",
+                LOTS_STATE
+            )
+            return {"last_id": 0, "pending_id": None, "pending_at": None}
+        return dict(row)
+
+    async def _horizon(self) -> Optional[int]:
+        """Граница зафиксированных id point_transactions; отложенная отметка сохраняется"""
+        async with self.db.acquire() as connection:
+            state = await self._state(connection)
+            bound, pending_id, pending_at = await id_horizon(
+                connection, LOTS_STATE, state["pending_id"], state["pending_at"]
+            )
+            await connection.execute(
+                "UPDATE point_lot_state SET pending_id = $2, pending_at = $3 WHERE name = $1",
+                LOTS_STATE, pending_id, pending_at
+            )
+        if bound is None:
+            logger.debug(f"Point lots: waiting for transactions open since {pending_at}")
+        return bound
+
+    async def _advance(self, connection, old: int, new: int):
+        status = await connection.execute(
+            "UPDATE point_lot_state SET last_id = $3, updated_at = NOW() WHERE name = $1 AND last_id = $2",
+            LOTS_STATE, old, new
+        )
+        # Другой процесс уже учёл эти транзакции: откатываем, чтобы не погасить партии дважды
+        if status.split()[-1] != "1":
+            raise ConcurrentCatchUp("Point lots were advanced concurrently")
+
+    @staticmethod
+    async def _expiry_days(connection) -> int:
+        value = await connection.fetchval(EXPIRY_DAYS_SQL)
+        return int(value) if value is not None else DEFAULT_EXPIRY_DAYS
+
+    async def _catch_up_batch(self, bound: int, not_before: Optional[date]) -> int:
+        async with self.db.acquire() as connection:
+            async with connection.transaction():
+                last_id = (await self._state(connection))["last_id"]
+                transactions = await connection.fetch(
+                    """
+                    SELECT id, client_id, points, idempotency_key, created_at
+                    FROM point_transactions WHERE id > $1 AND id <= $3 ORDER BY id LIMIT $2
+                    """,
+                    last_id, self.batch_size, bound
+                )
+                if not transactions:
+                    return 0
+                days = await self._expiry_days(connection)
+                await self._apply(connection, transactions, days, not_before)
+                await self._advance(connection, last_id, transactions[-1]["id"])
+
+        logger.debug(f"Point lots: {len(transactions)} transactions up to id {transactions[-1]['id']}")
+        return len(transactions)
+
+    async def _apply(self, connection, transactions, days: int, not_before: Optional[date]):
+        created: List[_Lot] = []
+        # Новые партии пакета по клиентам и очереди FIFO клиентов, у которых были списания
+        batch_lots: Dict[int, List[_Lot]] = defaultdict(list)
+        queues: Dict[int, Deque[_Lot]] = {}
+        loaded: List[_Lot] = []
+        uncovered = 0
+
+        for row in transactions:
+            points = row["points"] or 0
+            client_id = row["client_id"]
+            if (row["idempotency_key"] or "").startswith(EXPIRY_KEY_PREFIX):
+                continue
+            if points > 0:
+                earned_at = _timestamp(row["created_at"])
+                expires_at = earned_at.date() + timedelta(days=days) if days > 0 else None
+                if expires_at is not None and not_before is not None:
+                    expires_at = max(expires_at, not_before)
+                lot = _Lot(None, client_id, row["id"], points, points, earned_at, expires_at)
+                created.append(lot)
+                batch_lots[client_id].append(lot)
+                if client_id in queues:
+                    queues[client_id].append(lot)
+            elif points < 0:
+                queue = queues.get(client_id)
+                if queue is None:
+                    rows = await connection.fetch(OPEN_LOTS_SQL, client_id)
+                    existing = [_Lot(r["id"], client_id, 0, 0, r["remaining"], None, None) for r in rows]
+                    loaded.extend(existing)
+                    queue = queues[client_id] = deque(existing + batch_lots[client_id])
+                need = -points
+                while need and queue:
+                    lot = queue[0]
+                    taken = min(lot.remaining, need)
+                    lot.remaining -= taken
+                    lot.consumed += taken
+                    need -= taken
+                    if not lot.remaining:
+                        queue.popleft()
+                # Баллы без партии: начислены до появления истории операций
+                uncovered += need
+
+        await connection.executemany(
+            "UPDATE point_lots SET remaining = remaining - $2 WHERE id = $1",
+            [(lot.id, lot.consumed) for lot in loaded if lot.consumed]
+        )
+        await connection.executemany(
+            """
+            INSERT INTO point_lots (client_id, transaction_id, points, remaining, earned_at, expires_at)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            """,
+            [(lot.client_id, lot.transaction_id, lot.points, lot.remaining, lot.earned_at, lot.expires_at)
+             for lot in created]
+        )
+        if uncovered:
+            logger.debug(f"Point lots: {uncovered} debited points were not covered by lots")
+
+    async def expire(self, today: date) -> ExpiryRunResult:
+        """Сгорание партий со сроком по today включительно"""
+        result = ExpiryRunResult(today)
+        for _ in range(EXPIRY_PASSES):
+            await self.catch_up()
+            async with self._lock:
+                expired, result.skipped = await self._expire_pass(today)
+            result.expired.extend(expired)
+            if not result.skipped:
+                break
+
+        for client_id, _ in result.expired:
+            client_cache.invalidate_client(client_id)
+        logger.info(
+            f"Points expiry for {today}: {result.points} points of {len(result.expired)} clients, "
+            f"{result.skipped} clients postponed"
+        )
+        return result
+
+    async def _expire_pass(self, today: date) -> Tuple[List[Tuple[int, int]], int]:
+        async with self.db.acquire() as connection:
+            operator_id = await connection.fetchval(OPERATOR_SQL)
+            if operator_id is None:
+                raise RuntimeError("No staff user available to log points expiry transactions")
+
+            async with connection.transaction():
+                last_id = (await self._state(connection))["last_id"]
+                # Ключ уникален для дня и состояния партий: повторный запуск после пересчёта не конфликтует
+                key_prefix = f"{EXPIRY_KEY_PREFIX}{today.isoformat()}:{last_id}:"
+                if getattr(connection, "dialect", "postgresql") == "postgresql":
+                    rows = await connection.fetch(
+                        EXPIRE_SQL, today, last_id, operator_id, EXPIRY_DESCRIPTION, key_prefix
+                    )
+                    expired = [(row["id"], row["points"]) for row in rows]
+                else:
+                    expired = await self._expire_stepwise(connection, today, last_id, operator_id, key_prefix)
+
+            skipped = await connection.fetchval(
+                "SELECT COUNT(DISTINCT client_id) FROM point_lots WHERE expires_at <= $1 AND remaining > 0", today
+            )
+        return expired, skipped
+
+    @staticmethod
+    async def _expire_stepwise(connection, today: date, last_id: int, operator_id: int,
+                               key_prefix: str) -> List[Tuple[int, int]]:
+        """SQLite-замена не поддерживает изменяющие CTE: те же шаги в одной транзакции"""
+        expired = []
+        for row in await connection.fetch(DUE_SQL, today):
+            client_id = row["client_id"]
+            if await connection.fetchval(PENDING_SQL, client_id, last_id):
+                continue
+            balance = await connection.fetchval("SELECT balance FROM clients WHERE id = $1", client_id) or 0
+            points = min(balance, row["points"])
+            await connection.execute(CLOSE_SQL, client_id, today)
+            if points <= 0:
+                continue
+            balance = await connection.fetchval(
+                "UPDATE clients SET balance = balance - $2, updated_at = NOW() WHERE id = $1 RETURNING balance",
+                client_id, points
+            )
+            await connection.execute(
+                INSERT_SQL, client_id, operator_id, ADJUST, -points, 0, EXPIRY_DESCRIPTION,
+                f"{key_prefix}{client_id}", balance
+            )
+            expired.append((client_id, points))
+        return expired
@@ -0,0 +1,82 @@
+"""
+Ограничитель скорости отправки сообщений под лимиты Telegram
+
+Глобальный token bucket (около 30 сообщений в секунду на бота) и
+интервал на каждый чат (не чаще одного сообщения в секунду). RetryAfter
+от Telegram ставит на паузу всю отправку.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+PER_CHAT_INTERVAL = 1.0
+MAX_TRACKED_CHATS = 50000
+
+
+class TokenBucket:
+    """Token bucket с резервированием: запросы выстраиваются в очередь по времени"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def reserve(self) -> float:
+        """Занять токен; возвращает, сколько секунд нужно подождать"""
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class TelegramRateLimiter:
+    """Глобальный лимит, лимит на чат и общая пауза после RetryAfter"""
+
+    def __init__(self, rate: float = GLOBAL_RATE, burst: int = GLOBAL_BURST,
+                 per_chat_interval: float = PER_CHAT_INTERVAL,
+                 clock: Callable[[], float] = time.monotonic, sleep=asyncio.sleep):
+        self._clock = clock
+        self._sleep = sleep
+        self._bucket = TokenBucket(rate, burst, clock)
+        self.per_chat_interval = per_chat_interval
+        self._chat_next: "OrderedDict[Hashable, float]" = OrderedDict()
+        self._paused_until = 0.0
+        self.throttled = 0
+        self.pauses = 0
+
+    def pause(self, seconds: float):
+        """Пауза для всей отправки (ответ RetryAfter)"""
+        self.pauses += 1
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+    async def _wait_pause(self):
+        while True:
+            pause = self._paused_until - self._clock()
+            if pause <= 0:
+                return
+            await self._sleep(pause)
+
+    async def acquire(self, chat_id: Hashable):
+        """Дождаться разрешения на отправку сообщения в чат"""
+        await self._wait_pause()
+
+        now = self._clock()
+        chat_wait = max(0.0, self._chat_next.get(chat_id, 0.0) - now)
+        self._chat_next[chat_id] = now + chat_wait + self.per_chat_interval
+        self._chat_next.move_to_end(chat_id)
+        if len(self._chat_next) > MAX_TRACKED_CHATS:
+            self._chat_next.popitem(last=False)
+
+        wait = max(chat_wait, self._bucket.reserve())
+        if wait > 0:
+            self.throttled += 1
+            await self._sleep(wait)
+            # За время ожидания мог прийти RetryAfter
+            await self._wait_pause()
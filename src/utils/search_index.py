@@ -0,0 +1,354 @@
+"""
+Индекс поиска клиентов в памяти для /search
+
+Строится при запуске и обновляется по одному клиенту:
+- суффиксы телефона (бариста обычно вводит последние 4 цифры);
+- префиксы номера карты;
+- слова нормализованного full_name (регистр, ё/е) со словарём слов,
+  проиндексированным по триграммам: запрос сначала сопоставляется со
+  словарём (точно, по префиксу или нечётко), затем списки клиентов
+  найденных слов объединяются и пересекаются на уровне множеств.
+Поиск не обращается к базе и возвращает id клиентов.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import re
+from bisect import bisect_left, insort
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+LOAD_PAGE_SIZE = 10000
+INDEX_COLUMNS = "id, full_name, phone, card_number, is_active, updated_at"
+
+MIN_PHONE_SUFFIX = 3
+# Доля триграмм слова запроса, которая должна встретиться в слове словаря
+CANDIDATE_THRESHOLD = 0.5
+# Минимальное сходство (Жаккар по триграммам) для нечёткого совпадения
+FUZZY_THRESHOLD = 0.4
+
+
+def normalize_name(name: str) -> str:
+    """Нижний регистр, ё → е, только буквы и цифры, одиночные пробелы"""
+    name = (name or "").lower().replace("ё", "е")
+    return " ".join(re.findall(r"\w+", name))
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с дополнением пробелами, как в pg_trgm"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def word_similarity(query: str, word: str, query_grams: Set[str], word_grams: Set[str]) -> float:
+    """Сходство слова запроса со словом имени: точное > префикс > нечёткое"""
+    if word == query:
+        return 2.0
+    if word.startswith(query):
+        return 1.5 + 0.4 * len(query) / len(word)
+    shared = len(query_grams & word_grams)
+    return shared / len(query_grams | word_grams)
+
+
+def _digits(value: Any) -> str:
+    return re.sub(r"\D", "", str(value or ""))
+
+
+@dataclass
+class SearchHit:
+    """Найденный клиент и причина совпадения"""
+    client_id: int
+    score: float
+    matched: str
+
+
+class _PrefixIndex:
+    """Отсортированный список (ключ, id) для поиска по префиксу через bisect"""
+
+    def __init__(self):
+        self._entries: List[Tuple[str, int]] = []
+
+    def add(self, key: str, client_id: int):
+        insort(self._entries, (key, client_id))
+
+    def remove(self, key: str, client_id: int):
+        index = bisect_left(self._entries, (key, client_id))
+        if index < len(self._entries) and self._entries[index] == (key, client_id):
+            del self._entries[index]
+
+    def bulk_load(self, entries: Iterable[Tuple[str, int]]):
+        self._entries = sorted(entries)
+
+    def lookup(self, prefix: str, limit: int) -> List[Tuple[str, int]]:
+        start = bisect_left(self._entries, (prefix,))
+        result = []
+        for key, client_id in self._entries[start:start + limit]:
+            if not key.startswith(prefix):
+                break
+            result.append((key, client_id))
+        return result
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ClientSearchIndex:
+    """Индекс клиентов по телефону, карте и имени"""
+
+    def __init__(self):
+        self._docs: Dict[int, Tuple[str, str, str]] = {}
+        self._phones = _PrefixIndex()
+        self._cards = _PrefixIndex()
+        # Словарь слов имён: слово -> клиенты, триграмма -> слова
+        self._word_docs: Dict[str, Set[int]] = defaultdict(set)
+        self._word_grams: Dict[str, Set[str]] = {}
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._synced_at: Optional[datetime] = None
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, client_id: int):
+        return client_id in self._docs
+
+    def build(self, rows: Iterable[Mapping[str, Any]]):
+        """Полная перестройка индекса по строкам clients"""
+        self._docs.clear()
+        self._word_docs.clear()
+        self._word_grams.clear()
+        self._trigrams.clear()
+        phones, cards = [], []
+        for row in rows:
+            client_id, name, phone, card = self._document(row)
+            self._docs[client_id] = (name, phone, card)
+            if phone:
+                phones.append((phone[::-1], client_id))
+            if card:
+                cards.append((card, client_id))
+            for word in name.split():
+                self._add_word(word, client_id)
+        self._phones.bulk_load(phones)
+        self._cards.bulk_load(cards)
+        logger.info(f"Client search index built: {len(self._docs)} clients, {len(self._word_docs)} name words")
+
+    async def load(self, connection, page_size: int = LOAD_PAGE_SIZE):
+        """Построение индекса по таблице clients страницами по id"""
+        rows: List[Dict[str, Any]] = []
+        after = 0
+        while True:
+            page = await connection.fetch(
+                f"SELECT {INDEX_COLUMNS} FROM clients WHERE is_active = true AND id > $1 ORDER BY id LIMIT $2",
+                after, page_size
+            )
+            rows.extend(dict(row) for row in page)
+            if len(page) < page_size:
+                break
+            after = page[-1]["id"]
+
+        # Сборка занимает заметное время на больших базах: строим копию в потоке и подменяем
+        fresh = ClientSearchIndex()
+        await asyncio.to_thread(fresh.build, rows)
+        fresh._synced_at = max((row["updated_at"] for row in rows if row.get("updated_at")), default=None)
+        self.__dict__.update(fresh.__dict__)
+        self.loaded = True
+
+    async def refresh(self, connection) -> int:
+        """Догрузка клиентов, изменённых или добавленных после последней синхронизации"""
+        if self._synced_at is None:
+            await self.load(connection)
+            return len(self)
+        rows = await connection.fetch(
+            f"SELECT {INDEX_COLUMNS} FROM clients WHERE updated_at > $1 ORDER BY updated_at, id",
+            self._synced_at
+        )
+        for row in rows:
+            if row["is_active"]:
+                self.add(row)
+            else:
+                self.remove(row["id"])
+            self._synced_at = max(self._synced_at, row["updated_at"])
+        return len(rows)
+
+    def add(self, row: Mapping[str, Any]):
+        """Добавление или обновление клиента"""
+        client_id, name, phone, card = self._document(row)
+        self.remove(client_id)
+        self._docs[client_id] = (name, phone, card)
+        if phone:
+            self._phones.add(phone[::-1], client_id)
+        if card:
+            self._cards.add(card, client_id)
+        for word in name.split():
+            self._add_word(word, client_id)
+
+    def remove(self, client_id: Any):
+        """Удаление клиента из индекса"""
+        try:
+            client_id = int(client_id)
+        except (TypeError, ValueError):
+            return
+        doc = self._docs.pop(client_id, None)
+        if doc is None:
+            return
+        name, phone, card = doc
+        if phone:
+            self._phones.remove(phone[::-1], client_id)
+        if card:
+            self._cards.remove(card, client_id)
+        for word in set(name.split()):
+            self._remove_word(word, client_id)
+
+    def _add_word(self, word: str, client_id: int):
+        postings = self._word_docs[word]
+        if not postings:
+            grams = trigrams(word)
+            self._word_grams[word] = grams
+            for gram in grams:
+                self._trigrams[gram].add(word)
+        postings.add(client_id)
+
+    def _remove_word(self, word: str, client_id: int):
+        postings = self._word_docs.get(word)
+        if postings is None:
+            return
+        postings.discard(client_id)
+        if postings:
+            return
+        del self._word_docs[word]
+        for gram in self._word_grams.pop(word):
+            words = self._trigrams[gram]
+            words.discard(word)
+            if not words:
+                del self._trigrams[gram]
+
+    def search(self, query: str, limit: int = 10) -> List[SearchHit]:
+        """Поиск по телефону/карте/имени, лучшие совпадения первыми"""
+        query = (query or "").strip()
+        if not query:
+            return []
+
+        hits: Dict[int, SearchHit] = {}
+
+        def offer(hit: SearchHit):
+            current = hits.get(hit.client_id)
+            if current is None or hit.score > current.score:
+                hits[hit.client_id] = hit
+
+        card_query = query.upper()
+        for card, client_id in self._cards.lookup(card_query, limit):
+            offer(SearchHit(client_id, 3.0 if card == card_query else 2.0, "card_number"))
+
+        digits = _digits(query)
+        if len(digits) >= MIN_PHONE_SUFFIX and len(digits) * 2 >= len(query.replace(" ", "")):
+            suffix = digits[-10:]
+            for _, client_id in self._phones.lookup(suffix[::-1], limit):
+                offer(SearchHit(client_id, 2.0 + len(suffix) / 10, "phone"))
+
+        if not digits or len(hits) < limit:
+            for client_id, score in self._search_name(normalize_name(query), limit):
+                offer(SearchHit(client_id, score, "full_name"))
+
+        ranked = sorted(hits.values(), key=lambda hit: (-hit.score, hit.client_id))
+        return ranked[:limit]
+
+    def _match_words(self, query_word: str) -> List[Tuple[float, str]]:
+        """Слова словаря, похожие на слово запроса, по убыванию сходства"""
+        query_grams = trigrams(query_word)
+
+        # Слово-кандидат обязано содержать хотя бы `need` триграмм запроса,
+        # поэтому достаточно собрать кандидатов из самых редких списков
+        postings = sorted((self._trigrams.get(gram, ()) for gram in query_grams), key=len)
+        need = max(1, math.ceil(len(query_grams) * CANDIDATE_THRESHOLD))
+        candidates: Set[str] = set()
+        for posting in postings[:len(postings) - need + 1]:
+            candidates.update(posting)
+
+        matches = []
+        for word in candidates:
+            score = word_similarity(query_word, word, query_grams, self._word_grams[word])
+            if score >= FUZZY_THRESHOLD:
+                matches.append((score, word))
+        matches.sort(key=lambda item: (-item[0], item[1]))
+        return matches
+
+    def _search_name(self, query: str, limit: int) -> List[Tuple[int, float]]:
+        query_words = query.split()
+        if not query_words:
+            return []
+
+        word_matches = [self._match_words(word) for word in query_words]
+        if not all(word_matches):
+            return []
+
+        if len(word_matches) == 1:
+            # Одно слово: клиенты выдаются по убыванию сходства их слова
+            result: List[Tuple[int, float]] = []
+            seen: Set[int] = set()
+            for score, word in word_matches[0]:
+                fresh = self._word_docs[word] - seen if seen else self._word_docs[word]
+                for client_id in heapq.nsmallest(limit - len(result), fresh):
+                    result.append((client_id, score))
+                    seen.add(client_id)
+                if len(result) >= limit:
+                    break
+            return result
+
+        # Несколько слов: каждое слово запроса должно совпасть с каким-то словом имени.
+        # Сначала пересекаем только лучшие слова: у таких клиентов максимально
+        # возможный балл, и если их хватает, остальные комбинации не нужны
+        best_ids: Optional[Set[int]] = None
+        best_score = 0.0
+        for matches in word_matches:
+            top = matches[0][0]
+            best_score += top
+            ids = set().union(*(self._word_docs[word] for score, word in matches if score == top))
+            best_ids = ids if best_ids is None else best_ids & ids
+        if len(best_ids) >= limit:
+            best_score /= len(word_matches)
+            return [(client_id, best_score) for client_id in heapq.nsmallest(limit, best_ids)]
+
+        scores_by_word = [dict((word, score) for score, word in matches) for matches in word_matches]
+        candidates: Optional[Set[int]] = None
+        for matches in sorted(word_matches, key=len):
+            ids: Set[int] = set().union(*(self._word_docs[word] for _, word in matches))
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return []
+
+        scored = []
+        for client_id in candidates:
+            name_words = self._docs[client_id][0].split()
+            score = sum(
+                max((scores.get(word, 0.0) for word in name_words), default=0.0)
+                for scores in scores_by_word
+            ) / len(scores_by_word)
+            scored.append((client_id, score))
+        return heapq.nsmallest(limit, scored, key=lambda item: (-item[1], item[0]))
+
+    @staticmethod
+    def _document(row: Mapping[str, Any]) -> Tuple[int, str, str, str]:
+        return (
+            int(row["id"]),
+            normalize_name(row.get("full_name") or ""),
+            _digits(row.get("phone"))[-10:],
+            str(row.get("card_number") or "").strip().upper(),
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._docs),
+            "phones": len(self._phones),
+            "cards": len(self._cards),
+            "name_words": len(self._word_docs),
+            "trigrams": len(self._trigrams),
+        }
+
+
+client_search_index = ClientSearchIndex()
@@ -0,0 +1,382 @@
+"""
+Материализованные сегменты клиентов для рассылок
+
+Для каждого сегмента (all / active / vip / birthday и пользовательские
+правила) хранится битовая карта по id клиента, поэтому «сколько
+получателей» — это готовый счётчик, а перебор сегмента — проход по
+битовой карте без запросов к clients и point_transactions.
+
+Поля, от которых зависят правила (visit_count, total_spent, balance,
+last_visit, birth_date), лежат в компактных массивах, индексированных
+по id. Изменённые клиенты догружаются по updated_at, как в поисковом
+индексе, и пересчитываются поодиночке; сегменты, зависящие от текущей
+даты, пересчитываются из массивов при смене дня. Новые карты строятся
+в потоке и только читают массивы; подмена карт и пересчёт клиентов,
+изменённых за время построения, выполняются в цикле событий.
+
+Пользовательское правило — выражение над полями клиента, например
+«visit_count >= 5 and days_since_visit > 60»; допускаются только
+сравнения, and / or / not, числа и поля из RULE_FIELDS.
+"""
+
+import ast
+import asyncio
+import logging
+from array import array
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+LOAD_PAGE_SIZE = 10000
+SEGMENT_COLUMNS = (
+    "id, telegram_id, birth_date, balance, total_spent, visit_count, last_visit, is_active, updated_at"
+)
+
+# Пороги совпадают с SEGMENT_FILTERS в broadcast.py
+ACTIVE_DAYS = 30
+VIP_TOTAL_SPENT = 10000
+# days_since_visit для клиентов без визитов
+NEVER_VISITED = 10 ** 6
+MAX_CUSTOM_RULES = 32
+
+RULE_FIELDS = ("visit_count", "total_spent", "balance", "days_since_visit", "birthday_today")
+BUILTIN_RULES = {
+    "all": "True",
+    "active": f"days_since_visit <= {ACTIVE_DAYS}",
+    "vip": f"total_spent >= {VIP_TOTAL_SPENT}",
+    "birthday": "birthday_today",
+}
+
+Predicate = Callable[[int, float, int, int, bool], bool]
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.Compare,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Name, ast.Load, ast.Constant,
+)
+
+# Позиции установленных битов для каждого значения байта
+_BYTE_BITS = tuple(tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256))
+
+
+class RuleError(ValueError):
+    """Некорректное правило сегмента"""
+
+
+def compile_rule(rule: str) -> Predicate:
+    """Правило сегмента в функцию от полей клиента"""
+    try:
+        tree = ast.parse(rule.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"Syntax error in segment rule: {e.msg}") from None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleError(f"Unsupported element in segment rule: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in RULE_FIELDS:
+            raise RuleError(f"Unknown field in segment rule: {node.id}")
+        if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, bool)):
+            raise RuleError(f"Unsupported value in segment rule: {node.value!r}")
+    source = f"lambda {', '.join(RULE_FIELDS)}: {ast.unparse(tree)}"
+    return eval(compile(source, "<segment rule>", "eval"), {"__builtins__": {}})
+
+
+def normalize_rule(rule: str) -> str:
+    try:
+        return ast.unparse(ast.parse(rule.strip(), mode="eval"))
+    except SyntaxError as e:
+        raise RuleError(f"Syntax error in segment rule: {e.msg}") from None
+
+
+class Bitmap:
+    """Множество id клиентов как битовая карта с готовым счётчиком"""
+
+    __slots__ = ("_bits", "_count")
+
+    def __init__(self, capacity: int = 0):
+        self._bits = bytearray((capacity >> 3) + 1)
+        self._count = 0
+
+    def _grow(self, index: int):
+        if index >= len(self._bits):
+            self._bits.extend(bytes(max(index + 1, len(self._bits) * 2) - len(self._bits)))
+
+    def add(self, client_id: int):
+        index, mask = client_id >> 3, 1 << (client_id & 7)
+        self._grow(index)
+        if not self._bits[index] & mask:
+            self._bits[index] |= mask
+            self._count += 1
+
+    def discard(self, client_id: int):
+        index, mask = client_id >> 3, 1 << (client_id & 7)
+        if index < len(self._bits) and self._bits[index] & mask:
+            self._bits[index] &= ~mask
+            self._count -= 1
+
+    def __contains__(self, client_id: int) -> bool:
+        index = client_id >> 3
+        return index < len(self._bits) and bool(self._bits[index] >> (client_id & 7) & 1)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def iter_from(self, after: int = 0) -> Iterator[int]:
+        """id по возрастанию, большие after"""
+        bits = self._bits
+        start = (after + 1) >> 3
+        for index in range(start, len(bits)):
+            byte = bits[index]
+            if byte:
+                base = index << 3
+                for bit in _BYTE_BITS[byte]:
+                    if base + bit > after:
+                        yield base + bit
+
+    def __iter__(self) -> Iterator[int]:
+        return self.iter_from(-1)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._bits)
+
+
+class SegmentIndex:
+    """Членство клиентов в сегментах рассылок"""
+
+    def __init__(self, max_custom_rules: int = MAX_CUSTOM_RULES):
+        self.max_custom_rules = max_custom_rules
+        # Поля клиентов по id (массивы растут вместе с максимальным id)
+        self._eligible = Bitmap()
+        self._visit_count = array("l")
+        self._total_spent = array("d")
+        self._balance = array("l")
+        self._last_visit = array("l")
+        self._birthday = array("H")
+        self._predicates: Dict[str, Predicate] = {name: compile_rule(rule) for name, rule in BUILTIN_RULES.items()}
+        self._segments: Dict[str, Bitmap] = {name: Bitmap() for name in BUILTIN_RULES}
+        self._custom: "OrderedDict[str, None]" = OrderedDict()
+        self._today: date = date.today()
+        self._synced_at: Optional[datetime] = None
+        # Клиенты, изменённые во время построения карт в потоке
+        self._watchers: List[Set[int]] = []
+
+    # --- загрузка и догрузка ---
+
+    async def load(self, connection, today: Optional[date] = None, page_size: int = LOAD_PAGE_SIZE):
+        """Загрузка всех клиентов страницами по id и построение сегментов"""
+        rows: List[Dict[str, Any]] = []
+        after = 0
+        while True:
+            page = await connection.fetch(
+                f"SELECT {SEGMENT_COLUMNS} FROM clients WHERE id > $1 ORDER BY id LIMIT $2", after, page_size
+            )
+            rows.extend(dict(row) for row in page)
+            if len(page) < page_size:
+                break
+            after = page[-1]["id"]
+
+        fresh = SegmentIndex(self.max_custom_rules)
+        await asyncio.to_thread(fresh.build, rows, today or date.today(), list(self._custom))
+        fresh._synced_at = max((row["updated_at"] for row in rows if row.get("updated_at")), default=None)
+        fresh._watchers = self._watchers
+        self.__dict__.update(fresh.__dict__)
+
+    async def refresh(self, connection, today: Optional[date] = None) -> int:
+        """Догрузка изменённых клиентов; при смене дня — пересчёт сегментов по дате"""
+        today = today or date.today()
+        if self._synced_at is None:
+            await self.load(connection, today)
+            return len(self._eligible)
+        if today != self._today:
+            await self._rebuild(today)
+        rows = await connection.fetch(
+            f"SELECT {SEGMENT_COLUMNS} FROM clients WHERE updated_at > $1 ORDER BY updated_at, id", self._synced_at
+        )
+        for row in rows:
+            self.update(row)
+            self._synced_at = max(self._synced_at, row["updated_at"])
+        return len(rows)
+
+    def build(self, rows, today: date, custom_rules=()):
+        for row in rows:
+            self._store(row)
+        self._today = today
+        for rule in custom_rules:
+            key = normalize_rule(rule)
+            self._predicates[key] = compile_rule(rule)
+            self._custom[key] = None
+        self._segments = self._evaluate(self._predicates, today)
+        logger.info(
+            f"Client segments built: {len(self._eligible)} recipients, "
+            + ", ".join(f"{name} {len(bitmap)}" for name, bitmap in self._segments.items() if name in BUILTIN_RULES)
+        )
+
+    def update(self, row: Mapping[str, Any]):
+        """Пересчёт сегментов одного клиента после изменения его строки"""
+        client_id = self._store(row)
+        self._place(client_id, self._segments, self._predicates, self._today)
+
+    def remove(self, client_id: int):
+        """Удалённый клиент выходит из всех сегментов"""
+        client_id = int(client_id)
+        self._eligible.discard(client_id)
+        self._place(client_id, self._segments, self._predicates, self._today)
+
+    def _place(self, client_id: int, segments: Dict[str, Bitmap], predicates: Mapping[str, Predicate], today: date):
+        values = self._values(client_id, today) if client_id in self._eligible else None
+        for name, bitmap in segments.items():
+            if values is not None and predicates[name](*values):
+                bitmap.add(client_id)
+            else:
+                bitmap.discard(client_id)
+        for changed in self._watchers:
+            changed.add(client_id)
+
+    def _store(self, row: Mapping[str, Any]) -> int:
+        client_id = int(row["id"])
+        self._reserve(client_id)
+        if row.get("is_active") and row.get("telegram_id") is not None:
+            self._eligible.add(client_id)
+        else:
+            self._eligible.discard(client_id)
+        self._visit_count[client_id] = int(row.get("visit_count") or 0)
+        self._total_spent[client_id] = float(row.get("total_spent") or Decimal(0))
+        self._balance[client_id] = int(row.get("balance") or 0)
+        self._last_visit[client_id] = _to_date(row.get("last_visit")).toordinal() if row.get("last_visit") else 0
+        birth = _to_date(row.get("birth_date")) if row.get("birth_date") else None
+        self._birthday[client_id] = birth.month * 100 + birth.day if birth else 0
+        return client_id
+
+    def _reserve(self, client_id: int):
+        missing = client_id + 1 - len(self._visit_count)
+        if missing > 0:
+            # Запас, чтобы массивы не перевыделялись на каждого нового клиента
+            missing = max(missing, len(self._visit_count) // 4, 1024)
+            for column in (self._visit_count, self._total_spent, self._balance, self._last_visit, self._birthday):
+                column.extend(array(column.typecode, bytes(missing * column.itemsize)))
+
+    def _values(self, client_id: int, today: date):
+        last_visit = self._last_visit[client_id]
+        return (
+            self._visit_count[client_id],
+            self._total_spent[client_id],
+            self._balance[client_id],
+            today.toordinal() - last_visit if last_visit else NEVER_VISITED,
+            self._birthday[client_id] == today.month * 100 + today.day,
+        )
+
+    def _evaluate(self, predicates: Mapping[str, Predicate], today: date) -> Dict[str, Bitmap]:
+        """Новые карты сегментов из массивов; состояние индекса только читается"""
+        fresh = {name: Bitmap(len(self._visit_count)) for name in predicates}
+        checks = [(fresh[name].add, predicate) for name, predicate in predicates.items()]
+        for client_id in self._eligible:
+            values = self._values(client_id, today)
+            for add, predicate in checks:
+                if predicate(*values):
+                    add(client_id)
+        return fresh
+
+    async def _build(self, predicates: Mapping[str, Predicate], today: date) -> Dict[str, Bitmap]:
+        """Карты строятся в потоке, изменённые за это время клиенты пересчитываются в цикле"""
+        changed: Set[int] = set()
+        self._watchers.append(changed)
+        try:
+            fresh = await asyncio.to_thread(self._evaluate, predicates, today)
+        finally:
+            self._watchers.remove(changed)
+        for client_id in changed:
+            self._place(client_id, fresh, predicates, today)
+        return fresh
+
+    async def _rebuild(self, today: date):
+        """Пересчёт всех сегментов на новую дату"""
+        fresh: Dict[str, Bitmap] = {}
+        # Правила, добавленные во время построения, досчитываются следующим заходом
+        while True:
+            missing = {name: predicate for name, predicate in self._predicates.items() if name not in fresh}
+            if not missing:
+                break
+            fresh.update(await self._build(missing, today))
+        # Новые карты подменяют старые целиком: читатели не видят частично построенных
+        self._today = today
+        self._segments.update((name, bitmap) for name, bitmap in fresh.items() if name in self._predicates)
+
+    # --- пользовательские правила ---
+
+    async def prepare(self, rule: str) -> str:
+        """Построить сегмент по правилу в потоке, не блокируя обработку обновлений"""
+        if not rule:
+            raise RuleError("Custom segment requires a rule")
+        predicate = compile_rule(rule)
+        key = normalize_rule(rule)
+        while key not in self._custom:
+            today = self._today
+            fresh = await self._build({key: predicate}, today)
+            # Пока карта строилась, сменился день — строим заново
+            if key not in self._custom and today == self._today:
+                self._predicates[key] = predicate
+                self._segments[key] = fresh[key]
+                self._custom[key] = None
+                if len(self._custom) > self.max_custom_rules:
+                    evicted, _ = self._custom.popitem(last=False)
+                    self._segments.pop(evicted, None)
+                    self._predicates.pop(evicted, None)
+        self._custom.move_to_end(key)
+        return key
+
+    def _bitmap(self, segment: str, rule: Optional[str] = None) -> Bitmap:
+        if segment == "custom":
+            if not rule:
+                raise RuleError("Custom segment requires a rule")
+            key = normalize_rule(rule)
+            if key not in self._custom:
+                raise RuleError("Custom segment is not prepared, call prepare() first")
+            return self._segments[key]
+        if segment not in BUILTIN_RULES:
+            raise ValueError(f"Unsupported broadcast segment: {segment}")
+        return self._segments[segment]
+
+    # --- запросы ---
+
+    @property
+    def loaded(self) -> bool:
+        return self._synced_at is not None
+
+    def count(self, segment: str, rule: Optional[str] = None) -> int:
+        """Число получателей сегмента"""
+        return len(self._bitmap(segment, rule))
+
+    def members(self, segment: str, rule: Optional[str] = None, after: int = 0,
+                limit: Optional[int] = None) -> List[int]:
+        """id получателей сегмента по возрастанию, начиная после after"""
+        result = []
+        for client_id in self._bitmap(segment, rule).iter_from(after):
+            result.append(client_id)
+            if limit is not None and len(result) >= limit:
+                break
+        return result
+
+    def __contains__(self, client_id: int) -> bool:
+        return client_id in self._eligible
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recipients": len(self._eligible),
+            "segments": {name: len(bitmap) for name, bitmap in self._segments.items()},
+            "bytes": sum(bitmap.nbytes for bitmap in self._segments.values())
+                     + sum(column.itemsize * len(column) for column in (
+                         self._visit_count, self._total_spent, self._balance, self._last_visit, self._birthday)),
+        }
+
+
+def _to_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+segment_index = SegmentIndex()
@@ -0,0 +1,228 @@
+"""
+Шардирование обновлений между процессами бота
+
+ShardFront — входной процесс: принимает обновления от Telegram (webhook
+или getUpdates), вычисляет шард по чату и пересылает обновление
+рабочему процессу этого шарда на его локальный webhook-порт. Рабочие
+процессы — обычный LoyaltyBot с SHARD_INDEX; фронт запускает их сам и
+перезапускает упавшие.
+
+Обновления одного чата всегда попадают в один процесс и пересылаются
+ему по одному, поэтому порядок внутри чата сохраняется, а диалоги и
+кэши чата живут в одном процессе. Недоступный рабочий (перезапуск)
+получает обновления позже: очередь шарда ждёт его, остальные шарды
+продолжают работу. Обновление, на которое рабочий отвечает ошибкой,
+повторяется не больше MAX_FAILED_RESPONSES раз и отбрасывается, чтобы
+не держать за собой очередь шарда.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional
+
+import httpx
+from telegram import Bot, Update
+
+from src.utils.dispatcher import chat_key
+from src.utils.webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+WORKER_PATH = "/update"
+WORKER_COMMAND = "import main; main.LoyaltyBot().run()"
+SHARD_QUEUE_SIZE = 1000
+RETRY_DELAYS = (0.1, 0.5, 1.0, 2.0, 5.0)
+MAX_FAILED_RESPONSES = 5
+RESTART_DELAYS = (1.0, 2.0, 5.0, 15.0, 30.0)
+
+
+def shard_for(key: Hashable, shards: int) -> int:
+    """Номер шарда для ключа chat_key: личный чат и его пользователь — в одном шарде"""
+    if isinstance(key, tuple):
+        key = key[-1]
+    return int(key) % shards
+
+
+def update_shard(payload: Dict[str, Any], shards: int) -> int:
+    return shard_for(chat_key(Update.de_json(payload, None)), shards)
+
+
+@dataclass
+class ShardStats:
+    index: int
+    pid: Optional[int]
+    restarts: int
+    queued: int
+    forwarded: int
+    dropped: int
+    retries: int
+
+    def as_dict(self) -> Dict[str, Any]:
+        return self.__dict__.copy()
+
+
+class Shard:
+    """Рабочий процесс шарда и очередь пересылки ему"""
+
+    def __init__(self, index: int, port: int, max_pending: int = SHARD_QUEUE_SIZE):
+        self.index = index
+        self.port = port
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.restarts = 0
+        self.forwarded = 0
+        self.dropped = 0
+        self.retries = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}{WORKER_PATH}"
+
+    def stats(self) -> ShardStats:
+        return ShardStats(
+            index=self.index,
+            pid=self.process.pid if self.process is not None else None,
+            restarts=self.restarts,
+            queued=self.queue.qsize(),
+            forwarded=self.forwarded,
+            dropped=self.dropped,
+            retries=self.retries,
+        )
+
+
+class ShardFront:
+    """Входной процесс: приём обновлений и раздача их рабочим процессам"""
+
+    def __init__(self, shards: int, base_port: int, secret: str, spawn_workers: bool = True,
+                 max_pending: int = SHARD_QUEUE_SIZE, worker_command: str = WORKER_COMMAND):
+        if shards < 1:
+            raise ValueError("shards must be positive")
+        self.shards = [Shard(index, base_port + index, max_pending) for index in range(shards)]
+        self.secret = secret
+        self.spawn_workers = spawn_workers
+        self.worker_command = worker_command
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self):
+        self._client = httpx.AsyncClient(timeout=30.0, headers={SECRET_HEADER: self.secret})
+        for shard in self.shards:
+            if self.spawn_workers:
+                self._tasks.append(asyncio.create_task(self._supervise(shard)))
+            self._tasks.append(asyncio.create_task(self._forward(shard)))
+        logger.info(f"Shard front started: {len(self.shards)} workers")
+
+    async def stop(self, drain: bool = True, timeout: float = 30.0):
+        if drain:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(shard.queue.join() for shard in self.shards)), timeout)
+            except asyncio.TimeoutError:
+                logger.warning("Shard queues not drained before shutdown")
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.gather(*(self._terminate(shard) for shard in self.shards))
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def route(self, payload: Dict[str, Any]):
+        """Постановка обновления в очередь его шарда (ждёт при переполнении)"""
+        shard = self.shards[update_shard(payload, len(self.shards))]
+        await shard.queue.put(payload)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [shard.stats().as_dict() for shard in self.shards]
+
+    async def _forward(self, shard: Shard):
+        """Пересылка по одному: следующее обновление — после ответа на предыдущее"""
+        while True:
+            payload = await shard.queue.get()
+            try:
+                await self._deliver(shard, payload)
+            finally:
+                shard.queue.task_done()
+
+    async def _deliver(self, shard: Shard, payload: Dict[str, Any]):
+        attempt = 0
+        failures = 0
+        while True:
+            try:
+                response = await self._client.post(shard.url, json=payload)
+                if response.status_code == 200:
+                    shard.forwarded += 1
+                    return
+                if response.status_code in (400, 403):
+                    # Повтор не поможет: обновление битое или секрет не совпадает
+                    shard.dropped += 1
+                    logger.error(f"Shard {shard.index} rejected update {payload.get('update_id')}: "
+                                 f"{response.status_code}")
+                    return
+                failures += 1
+                if failures >= MAX_FAILED_RESPONSES:
+                    # Рабочий жив, но не может обработать обновление: не держим за ним очередь
+                    shard.dropped += 1
+                    logger.error(f"Shard {shard.index} failed update {payload.get('update_id')} "
+                                 f"{failures} times ({response.status_code}), dropping it")
+                    return
+            except httpx.HTTPError as e:
+                if attempt == 0:
+                    logger.warning(f"Shard {shard.index} unavailable: {e}")
+            shard.retries += 1
+            await asyncio.sleep(RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)])
+            attempt += 1
+
+    async def _supervise(self, shard: Shard):
+        """Запуск рабочего процесса и перезапуск после падения"""
+        failures = 0
+        while not self._stopping:
+            env = dict(os.environ, SHARD_INDEX=str(shard.index), SHARD_PORT=str(shard.port),
+                       SHARD_SECRET=self.secret)
+            shard.process = await asyncio.create_subprocess_exec(sys.executable, "-c", self.worker_command, env=env)
+            logger.info(f"Shard {shard.index} started (pid {shard.process.pid}, port {shard.port})")
+            started = asyncio.get_running_loop().time()
+            code = await shard.process.wait()
+            if self._stopping:
+                return
+            # Долго проработавший процесс перезапускается сразу, падающий при старте — с паузой
+            failures = 0 if asyncio.get_running_loop().time() - started > 60 else failures + 1
+            shard.restarts += 1
+            delay = RESTART_DELAYS[min(failures, len(RESTART_DELAYS) - 1)] if failures else 0
+            logger.error(f"Shard {shard.index} exited with code {code}, restarting in {delay:.0f}s")
+            await asyncio.sleep(delay)
+
+    async def _terminate(self, shard: Shard, timeout: float = 30.0):
+        process = shard.process
+        if process is None or process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    async def poll(self, bot: Bot, allowed_updates: List[str], timeout: int = 30, drop_pending: bool = False):
+        """Приём обновлений через getUpdates вместо webhook"""
+        await bot.delete_webhook(drop_pending_updates=drop_pending)
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=timeout, allowed_updates=allowed_updates
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"getUpdates failed: {e}")
+                await asyncio.sleep(RETRY_DELAYS[-1])
+                continue
+            for update in updates:
+                await self.route(update.to_dict())
+                offset = update.update_id + 1
@@ -0,0 +1,331 @@
+"""
+Общее состояние процессов бота при шардировании
+
+Хранилище даёт процессам две вещи: рассылку сообщений по каналу
+(сбросы кэшей клиентов) и именованную блокировку, которую держит не
+больше одного процесса (выбор ведущего для планировщиков).
+
+PostgresStore работает через отдельное соединение PostgreSQL: LISTEN /
+pg_notify для сообщений и сессионную advisory-блокировку для ведущего —
+при обрыве соединения сервер снимает блокировку сам, и ведущим
+становится другой процесс. LocalStore — замена в памяти для одного
+процесса и тестов; несколько LocalStore с общим LocalHub ведут себя как
+разные процессы.
+
+Диалоги и user_data уже хранятся в базе (DatabasePersistence), а строки
+клиентов читаются из неё же, поэтому между процессами передаются только
+сбросы кэшей: CacheInvalidation пересылает их остальным процессам.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from src.utils.client_cache import client_cache
+from src.utils.client_listing import client_listing
+from src.utils.search_index import client_search_index
+from src.utils.segments import segment_index
+
+logger = logging.getLogger(__name__)
+
+CACHE_CHANNEL = "loyalty_cache"
+LEADER_CHECK_INTERVAL = 5.0
+
+MessageCallback = Callable[[str], None]
+
+
+def lock_key(name: str) -> int:
+    """Ключ advisory-блокировки (bigint) по имени"""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "big", signed=True)
+
+
+class LocalHub:
+    """Общие каналы и блокировки для LocalStore одного интерпретатора"""
+
+    def __init__(self):
+        self.subscribers: Dict[str, List[MessageCallback]] = defaultdict(list)
+        self.locks: Dict[str, "LocalStore"] = {}
+
+
+class LocalStore:
+    """Хранилище в памяти процесса"""
+
+    def __init__(self, hub: Optional[LocalHub] = None):
+        self.hub = hub or LocalHub()
+        self._held: Set[str] = set()
+        self._subscriptions: List[tuple] = []
+
+    async def publish(self, channel: str, message: str):
+        for callback in list(self.hub.subscribers[channel]):
+            callback(message)
+
+    async def subscribe(self, channel: str, callback: MessageCallback):
+        self.hub.subscribers[channel].append(callback)
+        self._subscriptions.append((channel, callback))
+
+    async def try_lock(self, name: str) -> bool:
+        holder = self.hub.locks.setdefault(name, self)
+        if holder is self:
+            self._held.add(name)
+            return True
+        return False
+
+    async def holds(self, name: str) -> bool:
+        return name in self._held
+
+    async def unlock(self, name: str):
+        if self.hub.locks.get(name) is self:
+            del self.hub.locks[name]
+        self._held.discard(name)
+
+    async def close(self):
+        for name in list(self._held):
+            await self.unlock(name)
+        for channel, callback in self._subscriptions:
+            self.hub.subscribers[channel].remove(callback)
+        self._subscriptions = []
+
+
+class PostgresStore:
+    """Каналы и блокировки на отдельном соединении PostgreSQL"""
+
+    def __init__(self, dsn: str, timeout: float = 5.0):
+        self.dsn = dsn
+        self.timeout = timeout
+        self._connection = None
+        # Соединение asyncpg выполняет одну команду за раз
+        self._lock = asyncio.Lock()
+        self._channels: Dict[str, List[MessageCallback]] = defaultdict(list)
+        self._held: Set[str] = set()
+
+    async def _connect(self):
+        if self._connection is not None and not self._connection.is_closed():
+            return self._connection
+        import asyncpg
+
+        # Блокировки прежнего соединения сняты сервером вместе с ним
+        self._held.clear()
+        self._connection = await asyncpg.connect(self.dsn, timeout=self.timeout)
+        for channel in self._channels:
+            await self._connection.add_listener(channel, self._notified)
+        return self._connection
+
+    def _notified(self, connection, pid, channel, payload):
+        for callback in list(self._channels.get(channel, ())):
+            try:
+                callback(payload)
+            except Exception:
+                logger.exception(f"Shared state message handler failed on {channel}")
+
+    async def publish(self, channel: str, message: str):
+        async with self._lock:
+            connection = await self._connect()
+            await connection.execute("SELECT pg_notify($1, $2)", channel, message)
+
+    async def subscribe(self, channel: str, callback: MessageCallback):
+        async with self._lock:
+            connection = await self._connect()
+            if channel not in self._channels:
+                await connection.add_listener(channel, self._notified)
+            self._channels[channel].append(callback)
+
+    async def try_lock(self, name: str) -> bool:
+        async with self._lock:
+            connection = await self._connect()
+            if name in self._held:
+                return True
+            if await connection.fetchval("SELECT pg_try_advisory_lock($1)", lock_key(name), timeout=self.timeout):
+                self._held.add(name)
+                return True
+            return False
+
+    async def holds(self, name: str) -> bool:
+        """Блокировка держится, пока живо соединение"""
+        async with self._lock:
+            if name not in self._held or self._connection is None or self._connection.is_closed():
+                return False
+            try:
+                await self._connection.fetchval("SELECT 1", timeout=self.timeout)
+            except Exception as e:
+                logger.warning(f"Shared state connection lost: {e}")
+                await self._drop()
+                return False
+            return True
+
+    async def unlock(self, name: str):
+        async with self._lock:
+            if name not in self._held:
+                return
+            self._held.discard(name)
+            try:
+                await self._connection.execute("SELECT pg_advisory_unlock($1)", lock_key(name))
+            except Exception as e:
+                logger.warning(f"Advisory unlock of {name} failed: {e}")
+                await self._drop()
+
+    async def _drop(self):
+        self._held.clear()
+        if self._connection is not None:
+            self._connection.terminate()
+            self._connection = None
+
+    async def close(self):
+        async with self._lock:
+            if self._connection is not None:
+                await self._connection.close()
+                self._connection = None
+            self._held.clear()
+
+
+def create_store(db, shared: bool):
+    """PostgresStore для нескольких процессов на PostgreSQL, иначе LocalStore"""
+    if shared and db.backend == "postgresql":
+        from src.utils.database import database_dsn
+
+        return PostgresStore(db.dsn or database_dsn())
+    return LocalStore()
+
+
+class LeaderElection:
+    """Запуск служб только в одном процессе: у того, кто держит блокировку"""
+
+    def __init__(self, store, name: str, on_elected: Callable[[], Awaitable[None]],
+                 on_lost: Callable[[], Awaitable[None]], interval: float = LEADER_CHECK_INTERVAL):
+        self.store = store
+        self.name = name
+        self.on_elected = on_elected
+        self.on_lost = on_lost
+        self.interval = interval
+        self.is_leader = False
+
+    async def run(self):
+        try:
+            while True:
+                await self.check()
+                await asyncio.sleep(self.interval)
+        finally:
+            await self._step_down()
+
+    async def check(self):
+        """Один шаг: захватить блокировку или убедиться, что она ещё наша"""
+        try:
+            if self.is_leader:
+                if not await self.store.holds(self.name):
+                    logger.warning(f"Leadership {self.name} lost")
+                    await self._step_down()
+            elif await self.store.try_lock(self.name):
+                self.is_leader = True
+                logger.info(f"Leadership {self.name} acquired (pid {os.getpid()})")
+                await self.on_elected()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Leader election {self.name} failed: {e}")
+            await self._step_down()
+
+    async def _step_down(self):
+        if not self.is_leader:
+            return
+        self.is_leader = False
+        try:
+            await self.on_lost()
+        finally:
+            try:
+                await self.store.unlock(self.name)
+            except Exception as e:
+                logger.warning(f"Releasing leadership {self.name} failed: {e}")
+
+
+class CacheInvalidation:
+    """Сбросы кэшей клиентов этого процесса рассылаются остальным процессам"""
+
+    def __init__(self, store, cache=client_cache, listing=client_listing, search=client_search_index,
+                 segments=segment_index, channel: str = CACHE_CHANNEL):
+        self.store = store
+        self.cache = cache
+        self.listing = listing
+        self.search = search
+        self.segments = segments
+        self.channel = channel
+        self.origin = uuid.uuid4().hex[:12]
+        self.sent = 0
+        self.received = 0
+        self._applying = False
+        self._pending: List[Dict[str, Any]] = []
+        self._flush: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.store.subscribe(self.channel, self._received)
+        self.cache.on_invalidate = self._cache_invalidated
+        self.listing.on_invalidate = self._listing_invalidated
+
+    def stop(self):
+        self.cache.on_invalidate = None
+        self.listing.on_invalidate = None
+
+    def client_deleted(self, client_id: int):
+        """Удаление клиента: остальные процессы убирают его из поискового индекса и сегментов"""
+        self._send({"e": "deleted", "id": int(client_id)})
+
+    def _cache_invalidated(self, kind: Optional[str], value: Any):
+        self._send({"e": "client", "k": kind, "v": value})
+
+    def _listing_invalidated(self):
+        self._send({"e": "listing"})
+
+    def _send(self, event: Dict[str, Any]):
+        if self._applying:
+            return
+        # Сбросы одного обработчика уходят одним сообщением после него
+        self._pending.append(event)
+        if self._flush is None or self._flush.done():
+            self._flush = asyncio.get_running_loop().create_task(self._publish())
+
+    async def _publish(self):
+        await asyncio.sleep(0)
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        try:
+            await self.store.publish(self.channel, json.dumps({"o": self.origin, "e": events}))
+            self.sent += len(events)
+        except Exception as e:
+            # Кэши других процессов устареют не дольше их TTL
+            logger.warning(f"Cache invalidation broadcast failed: {e}")
+
+    def _received(self, message: str):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        if payload.get("o") == self.origin:
+            return
+        self._applying = True
+        try:
+            for event in payload.get("e", ()):
+                self._apply(event)
+                self.received += 1
+        finally:
+            self._applying = False
+
+    def _apply(self, event: Dict[str, Any]):
+        kind = event.get("e")
+        if kind == "client":
+            if event.get("k") is None:
+                self.cache.clear()
+            elif event["k"] == "id":
+                self.cache.invalidate_client(event["v"])
+            else:
+                self.cache.invalidate(event["k"], event["v"])
+        elif kind == "listing":
+            self.listing.invalidate()
+        elif kind == "deleted":
+            self.cache.invalidate_client(event["id"])
+            self.search.remove(event["id"])
+            self.segments.remove(event["id"])
+            self.listing.invalidate()
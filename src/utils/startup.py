@@ -0,0 +1,105 @@
+"""
+Быстрый запуск бота: ленивые обработчики и отложенные фоновые службы
+
+Модули обработчиков не импортируются при загрузке main.py: обработчик
+регистрируется ссылкой вида "src.handlers.stats_handlers:StatsHandlers.stats_menu"
+и импортируется при первом вызове (или фоновым прогревом после старта).
+Планировщики и прочие фоновые службы запускаются DeferredStart после
+первого обработанного обновления, чтобы не задерживать начало приёма
+обновлений; если обновлений нет, — по таймауту.
+"""
+
+import asyncio
+import importlib
+import logging
+from typing import Any, Awaitable, Callable, List, Optional
+
+from telegram import Update
+from telegram.ext import TypeHandler
+
+logger = logging.getLogger(__name__)
+
+DEFERRED_START_TIMEOUT = 30.0
+# Группа после всех обработчиков бота: срабатывает, когда обновление уже обработано
+DEFERRED_GROUP = 1000
+
+
+class LazyCallback:
+    """Обработчик, модуль которого импортируется при первом вызове"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.module, _, self.attribute = path.partition(":")
+        self.__name__ = self.attribute.rsplit(".", 1)[-1]
+        self._target: Optional[Callable[..., Awaitable[Any]]] = None
+
+    def resolve(self) -> Callable[..., Awaitable[Any]]:
+        if self._target is None:
+            target = importlib.import_module(self.module)
+            for name in self.attribute.split("."):
+                target = getattr(target, name)
+            self._target = target
+        return self._target
+
+    async def __call__(self, *args, **kwargs):
+        return await self.resolve()(*args, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"LazyCallback({self.path!r})"
+
+
+_registered: List[LazyCallback] = []
+
+
+def lazy(path: str) -> LazyCallback:
+    """Ленивая ссылка на обработчик "модуль:Класс.метод\""""
+    callback = LazyCallback(path)
+    _registered.append(callback)
+    return callback
+
+
+def resolve_all() -> int:
+    """Импортировать модули всех ленивых обработчиков; возвращает их число"""
+    for callback in _registered:
+        callback.resolve()
+    return len(_registered)
+
+
+async def warm_up():
+    """Фоновый импорт обработчиков, чтобы первый вызов каждого не ждал импорта"""
+    try:
+        count = await asyncio.to_thread(resolve_all)
+    except Exception as e:
+        logger.error(f"Ошибка загрузки модулей обработчиков: {e}")
+        return
+    logger.debug("Lazy handlers resolved: %d", count)
+
+
+class DeferredStart:
+    """Запуск служб после первого обработанного обновления или по таймауту"""
+
+    def __init__(self, start: Callable[[], Awaitable[None]], timeout: float = DEFERRED_START_TIMEOUT):
+        self._start = start
+        self.timeout = timeout
+        self.handler = TypeHandler(Update, self._on_update, block=False)
+        self._triggered = asyncio.Event()
+        self._application = None
+        self.started = False
+
+    def install(self, application):
+        self._application = application
+        application.add_handler(self.handler, DEFERRED_GROUP)
+
+    async def _on_update(self, update, context):
+        self._triggered.set()
+
+    async def run(self):
+        """Фоновая задача: ждёт первого обновления и запускает службы"""
+        try:
+            await asyncio.wait_for(self._triggered.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            logger.info(f"No updates in {self.timeout:.0f}s, starting deferred services")
+        if self._application is not None:
+            self._application.remove_handler(self.handler, DEFERRED_GROUP)
+        self.started = True
+        await self._start()
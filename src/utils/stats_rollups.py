@@ -0,0 +1,325 @@
+"""
+Предрасчитанная статистика по операциям с баллами
+
+Сводки по часам (stats_hourly) и дням (stats_daily) пополняются
+догоняющим заданием: каждый проход читает только транзакции с id больше
+сохранённого в stats_rollup_state и прибавляет их к сводкам. Проход не
+заходит за границу зафиксированных id (commit_horizon): транзакция,
+получившая меньший id, но зафиксированная позже, не будет пропущена. Активные
+клиенты считаются через членство в stats_active_clients, поэтому число
+уникальных клиентов за неделю и месяц тоже не требует пересчёта.
+
+Экраны статистики читают только сводки: не больше 31 строки за месяц
+вместо прохода по всей point_transactions.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.commit_horizon import id_horizon
+
+logger = logging.getLogger(__name__)
+
+CATCH_UP_BATCH = 20000
+TRANSACTIONS_STATE = "point_transactions"
+CLIENTS_STATE = "clients"
+# Имя состояния совпадает с таблицей, из которой оно читает строки
+STATES = (TRANSACTIONS_STATE, CLIENTS_STATE)
+
+# Периоды, для которых хранится число уникальных клиентов
+ACTIVE_PERIODS = ("hour", "day", "week", "month")
+
+# Пересчёт числа активных клиентов затронутого периода: по индексу членства,
+# не дороже числа клиентов этого периода
+ACTIVE_RECOUNT_SQL = {
+    "hour": """
+        UPDATE stats_hourly SET active_clients = (
+            SELECT COUNT(*) FROM stats_active_clients WHERE period = 'hour' AND bucket = $1
+        ) WHERE hour = $1
+    """,
+    "day": """
+        UPDATE stats_daily SET active_clients = (
+            SELECT COUNT(*) FROM stats_active_clients WHERE period = 'day' AND bucket = $1
+        ) WHERE day = $2
+    """,
+    "period": """
+        INSERT INTO stats_active_totals (period, bucket, active_clients)
+        SELECT $1, $2, COUNT(*) FROM stats_active_clients WHERE period = $1 AND bucket = $2
+        ON CONFLICT (period, bucket) DO UPDATE SET active_clients = EXCLUDED.active_clients
+    """,
+}
+
+ROLLUP_TABLES = ("stats_hourly", "stats_daily", "stats_active_clients", "stats_active_totals", "stats_rollup_state")
+
+
+class ConcurrentCatchUp(RuntimeError):
+    """Другой процесс уже учёл этот пакет"""
+
+
+def _timestamp(value: Any) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def bucket_start(period: str, moment: datetime) -> datetime:
+    """Начало часа / дня / недели (с понедельника) / месяца"""
+    if period == "hour":
+        return moment.replace(minute=0, second=0, microsecond=0)
+    day = datetime.combine(moment.date(), time())
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+def period_range(period: str, today: date) -> Tuple[date, date]:
+    """Первый и последний день периода, в который входит today"""
+    if period == "day":
+        return today, today
+    start = bucket_start(period, datetime.combine(today, time())).date()
+    if period == "week":
+        return start, start + timedelta(days=6)
+    if period == "month":
+        following = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return start, following - timedelta(days=1)
+    raise ValueError(f"Unknown period: {period}")
+
+
+@dataclass
+class _Bucket:
+    transactions: int = 0
+    points_earned: int = 0
+    points_spent: int = 0
+    revenue: Decimal = Decimal(0)
+    new_clients: int = 0
+
+    def add_transaction(self, row):
+        self.transactions += 1
+        points = row["points"] or 0
+        if row["operation_type"] == "spend":
+            self.points_spent += -points
+        elif points > 0:
+            self.points_earned += points
+        if row["operation_type"] == "earn" and row["amount"] is not None:
+            self.revenue += Decimal(str(row["amount"]))
+
+
+@dataclass
+class PeriodSummary:
+    period: str
+    start: date
+    end: date
+    transactions: int = 0
+    points_earned: int = 0
+    points_spent: int = 0
+    revenue: Decimal = Decimal(0)
+    new_clients: int = 0
+    active_clients: int = 0
+    hours: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class StatsRollups:
+    """Догоняющее обновление сводок и чтение статистики из них"""
+
+    def __init__(self, db, batch_size: int = CATCH_UP_BATCH):
+        self.db = db
+        self.batch_size = batch_size
+        self._lock = asyncio.Lock()
+
+    async def catch_up(self) -> int:
+        """Учесть новые транзакции и регистрации; возвращает число транзакций"""
+        async with self._lock:
+            bounds = await self._horizons()
+            processed = 0
+            while True:
+                try:
+                    count = await self._catch_up_batch(bounds)
+                except ConcurrentCatchUp as e:
+                    # Пакет откатился целиком, сводки уже содержат его строки
+                    logger.info(f"Stats rollups: {e}")
+                    return processed
+                processed += count
+                if count < self.batch_size:
+                    return processed
+
+    async def backfill(self) -> int:
+        """Пересчитать сводки с нуля по всей истории"""
+        async with self._lock:
+            async with self.db.acquire() as connection:
+                async with connection.transaction():
+                    for table in ROLLUP_TABLES:
+                        await connection.execute(f"DELETE FROM {table}")
+        return await self.catch_up()
+
+    async def _state(self, connection, name: str) -> Dict[str, Any]:
+        row = await connection.fetchrow(
+            "SELECT last_id, pending_id, pending_at FROM stats_rollup_state WHERE name = $1", name
+        )
+        if row is None:
+            await connection.execute(
+                "INSERT INTO stats_rollup_state (name, last_id) VALUES ($1, 0) ON CONFLICT (name) DO NOTHING", name
+            )
+            return {"last_id": 0, "pending_id": None, "pending_at": None}
+        return dict(row)
+
+    async def _horizons(self) -> Dict[str, Optional[int]]:
+        """Граница зафиксированных id для каждой таблицы; отложенная отметка сохраняется"""
+        bounds = {}
+        async with self.db.acquire() as connection:
+            for name in STATES:
+                state = await self._state(connection, name)
+                bound, pending_id, pending_at = await id_horizon(
+                    connection, name, state["pending_id"], state["pending_at"]
+                )
+                await connection.execute(
+                    "UPDATE stats_rollup_state SET pending_id = $2, pending_at = $3 WHERE name = $1",
+                    name, pending_id, pending_at
+                )
+                if bound is None:
+                    logger.debug(f"Stats rollups: {name} waits for transactions open since {pending_at}")
+                bounds[name] = bound
+        return bounds
+
+    async def _advance(self, connection, name: str, old: int, new: int):
+        status = await connection.execute(
+            "UPDATE stats_rollup_state SET last_id = $3, updated_at = NOW() WHERE name = $1 AND last_id = $2",
+            name, old, new
+        )
+        # Другой процесс уже учёл эти строки: откатываем, чтобы не прибавить их дважды
+        if status.split()[-1] != "1":
+            raise ConcurrentCatchUp(f"Stats rollup {name} was advanced concurrently")
+
+    async def _catch_up_batch(self, bounds: Dict[str, Optional[int]]) -> int:
+        async with self.db.acquire() as connection:
+            async with connection.transaction():
+                last_tx = (await self._state(connection, TRANSACTIONS_STATE))["last_id"]
+                last_client = (await self._state(connection, CLIENTS_STATE))["last_id"]
+                transactions = []
+                if bounds[TRANSACTIONS_STATE] is not None:
+                    transactions = await connection.fetch(
+                        """
+                        SELECT id, client_id, operation_type, points, amount, created_at
+                        FROM point_transactions WHERE id > $1 AND id <= $3 ORDER BY id LIMIT $2
+                        """,
+                        last_tx, self.batch_size, bounds[TRANSACTIONS_STATE]
+                    )
+                clients = []
+                if bounds[CLIENTS_STATE] is not None:
+                    clients = await connection.fetch(
+                        "SELECT id, created_at FROM clients WHERE id > $1 AND id <= $3 ORDER BY id LIMIT $2",
+                        last_client, self.batch_size, bounds[CLIENTS_STATE]
+                    )
+                if not transactions and not clients:
+                    return 0
+
+                await self._apply(connection, transactions, clients)
+                if transactions:
+                    await self._advance(connection, TRANSACTIONS_STATE, last_tx, transactions[-1]["id"])
+                if clients:
+                    await self._advance(connection, CLIENTS_STATE, last_client, clients[-1]["id"])
+
+        if transactions:
+            logger.debug(f"Stats rollups: {len(transactions)} transactions up to id {transactions[-1]['id']}")
+        return max(len(transactions), len(clients))
+
+    async def _apply(self, connection, transactions, clients):
+        hourly: Dict[datetime, _Bucket] = defaultdict(_Bucket)
+        active = set()
+        for row in transactions:
+            created = _timestamp(row["created_at"])
+            hourly[bucket_start("hour", created)].add_transaction(row)
+            for period in ACTIVE_PERIODS:
+                active.add((period, bucket_start(period, created), row["client_id"]))
+        for row in clients:
+            hourly[bucket_start("hour", _timestamp(row["created_at"]))].new_clients += 1
+
+        daily: Dict[date, _Bucket] = defaultdict(_Bucket)
+        for hour, bucket in hourly.items():
+            total = daily[hour.date()]
+            total.transactions += bucket.transactions
+            total.points_earned += bucket.points_earned
+            total.points_spent += bucket.points_spent
+            total.revenue += bucket.revenue
+            total.new_clients += bucket.new_clients
+
+        for table, key, buckets in (("stats_hourly", "hour", hourly), ("stats_daily", "day", daily)):
+            await connection.executemany(
+                f"""
+                INSERT INTO {table} ({key}, transactions, points_earned, points_spent, revenue, new_clients)
+                VALUES ($1, $2, $3, $4, $5, $6)
+                ON CONFLICT ({key}) DO UPDATE SET
+                    transactions = {table}.transactions + EXCLUDED.transactions,
+                    points_earned = {table}.points_earned + EXCLUDED.points_earned,
+                    points_spent = {table}.points_spent + EXCLUDED.points_spent,
+                    revenue = {table}.revenue + EXCLUDED.revenue,
+                    new_clients = {table}.new_clients + EXCLUDED.new_clients
+                """,
+                [(bucket_key, b.transactions, b.points_earned, b.points_spent, b.revenue, b.new_clients)
+                 for bucket_key, b in buckets.items()]
+            )
+
+        if not active:
+            return
+        await connection.executemany(
+            """
+            INSERT INTO stats_active_clients (period, bucket, client_id) VALUES ($1, $2, $3)
+            ON CONFLICT (period, bucket, client_id) DO NOTHING
+            """,
+            sorted(active)
+        )
+        touched = sorted({(period, bucket) for period, bucket, _ in active})
+        await connection.executemany(
+            ACTIVE_RECOUNT_SQL["hour"], [(bucket,) for period, bucket in touched if period == "hour"]
+        )
+        await connection.executemany(
+            ACTIVE_RECOUNT_SQL["day"], [(bucket, bucket.date()) for period, bucket in touched if period == "day"]
+        )
+        await connection.executemany(
+            ACTIVE_RECOUNT_SQL["period"], [key for key in touched if key[0] in ("week", "month")]
+        )
+
+    async def summary(self, period: str, today: date) -> PeriodSummary:
+        """Сводка за день / неделю / месяц, содержащий today"""
+        start, end = period_range(period, today)
+        result = PeriodSummary(period, start, end)
+        async with self.db.acquire() as connection:
+            row = await connection.fetchrow(
+                """
+                SELECT COALESCE(SUM(transactions), 0) AS transactions,
+                       COALESCE(SUM(points_earned), 0) AS points_earned,
+                       COALESCE(SUM(points_spent), 0) AS points_spent,
+                       COALESCE(SUM(revenue), 0) AS revenue,
+                       COALESCE(SUM(new_clients), 0) AS new_clients,
+                       COALESCE(MAX(active_clients), 0) AS active_clients
+                FROM stats_daily WHERE day BETWEEN $1 AND $2
+                """,
+                start, end
+            )
+            active = row["active_clients"]
+            if period != "day":
+                active = await connection.fetchval(
+                    "SELECT active_clients FROM stats_active_totals WHERE period = $1 AND bucket = $2",
+                    period, datetime.combine(start, time())
+                )
+            else:
+                hours = await connection.fetch(
+                    "SELECT hour, transactions, points_earned, points_spent, revenue, active_clients FROM stats_hourly "
+                    "WHERE hour >= $1 AND hour < $2 ORDER BY hour",
+                    datetime.combine(start, time()), datetime.combine(start + timedelta(days=1), time())
+                )
+                result.hours = [dict(hour) for hour in hours]
+
+        result.transactions = int(row["transactions"])
+        result.points_earned = int(row["points_earned"])
+        result.points_spent = int(row["points_spent"])
+        result.revenue = Decimal(str(row["revenue"]))
+        result.new_clients = int(row["new_clients"])
+        result.active_clients = active or 0
+        return result
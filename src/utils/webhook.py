@@ -0,0 +1,173 @@
+"""
+Локальный HTTP-приёмник webhook-обновлений Telegram
+
+Минимальный HTTP/1.1 сервер на asyncio: принимает POST с JSON-обновлением,
+проверяет секретный токен и передаёт словарь обновления в колбэк.
+Дополнительные GET-маршруты используются для отдачи метрик; без
+on_update сервер отдаёт только их (метрики в режиме polling).
+"""
+
+import asyncio
+import json
+import logging
+import secrets
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+MAX_BODY_SIZE = 1024 * 1024
+
+UpdateCallback = Callable[[Dict[str, Any]], Awaitable[None]]
+RouteCallback = Callable[[], Tuple[str, str]]
+
+_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class WebhookListener:
+    """HTTP-приёмник обновлений для режима webhook"""
+
+    def __init__(
+        self,
+        on_update: Optional[UpdateCallback],
+        host: str = "127.0.0.1",
+        port: int = 8443,
+        path: str = "/webhook",
+        secret_token: Optional[str] = None,
+    ):
+        self.on_update = on_update
+        self.host = host
+        self.port = port
+        self.path = path if path.startswith("/") else f"/{path}"
+        self.secret_token = secret_token
+        self.routes: Dict[str, RouteCallback] = {}
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def add_route(self, path: str, callback: RouteCallback):
+        """Регистрация GET-маршрута; колбэк возвращает (content_type, body)"""
+        self.routes[path] = callback
+
+    @property
+    def bound_port(self) -> int:
+        """Фактический порт (полезно при port=0)"""
+        if not self._server or not self._server.sockets:
+            return self.port
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        path = self.path if self.on_update is not None else ""
+        logger.info(f"HTTP listener started on {self.host}:{self.bound_port}{path}")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            logger.info("HTTP listener stopped")
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+
+                status, content_type, payload = await self._dispatch(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except _RequestTooLarge:
+            self._write_response(writer, 413, "text/plain", "", keep_alive=False)
+        except _BadRequest:
+            self._write_response(writer, 400, "text/plain", "", keep_alive=False)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2:
+            return None
+        method, target = parts[0].upper(), parts[1]
+
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise _BadRequest() from None
+        if length < 0:
+            raise _BadRequest()
+        if length > MAX_BODY_SIZE:
+            raise _RequestTooLarge()
+        body = await reader.readexactly(length) if length else b""
+        return method, target.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        if self.on_update is not None and target == self.path:
+            if method != "POST":
+                return 405, "text/plain", ""
+            if self.secret_token and not secrets.compare_digest(
+                headers.get(SECRET_HEADER, ""), self.secret_token
+            ):
+                logger.warning("Webhook request rejected: invalid secret token")
+                return 403, "text/plain", ""
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                return 400, "text/plain", ""
+            if not isinstance(payload, dict):
+                return 400, "text/plain", ""
+            try:
+                await self.on_update(payload)
+            except Exception:
+                logger.exception("Failed to enqueue webhook update")
+                return 500, "text/plain", ""
+            return 200, "text/plain", ""
+
+        route = self.routes.get(target)
+        if route is not None and method == "GET":
+            content_type, payload = route()
+            return 200, content_type, payload
+        return 404, "text/plain", ""
+
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, content_type: str, payload: str, keep_alive: bool):
+        data = payload.encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + data)
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
+class _BadRequest(Exception):
+    pass
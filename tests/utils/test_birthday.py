@@ -0,0 +1,88 @@
+import asyncio
+from datetime import date
+
+from src.utils.birthday import BirthdayBonusJob, birthday_days
+from src.utils.client_cache import client_cache
+from src.utils.database import SQLiteDatabase
+from src.utils.rate_limiter import TelegramRateLimiter
+
+
+def test_birthday_days_handles_leap_day():
+    assert birthday_days(date(2026, 2, 28)) == (2, [28, 29])
+    assert birthday_days(date(2028, 2, 28)) == (2, [28])
+    assert birthday_days(date(2028, 2, 29)) == (2, [29])
+    assert birthday_days(date(2026, 10, 17)) == (10, [17])
+
+
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, role TEXT, is_active INTEGER DEFAULT 1);
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, telegram_id INTEGER, full_name TEXT, birth_date DATE, balance INTEGER DEFAULT 0,
+  is_active INTEGER DEFAULT 1, updated_at TIMESTAMP
+);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT, points INTEGER,
+  amount NUMERIC, description TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE birthday_bonus_awards (
+  client_id INTEGER NOT NULL, year INTEGER NOT NULL, points INTEGER NOT NULL, awarded_at TIMESTAMP,
+  PRIMARY KEY (client_id, year)
+);
+INSERT INTO users (id, role) VALUES (7, 'admin');
+INSERT INTO clients (id, telegram_id, full_name, birth_date, balance, is_active) VALUES
+  (1, 11, 'А', '1990-02-28', 10, 1),
+  (2, NULL, 'Б', '1985-02-29', 0, 1),
+  (3, 13, 'В', '2000-02-28', 50, 1),
+  (4, 14, 'Г', '1990-02-28', 5, 0),
+  (5, 15, 'Д', '1990-03-01', 5, 1);
+"""
+
+
+def _database():
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA)
+    return db
+
+
+class _Bot:
+    def __init__(self, db=None):
+        self.db = db
+        self.sent = []
+        self.pool_free = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.db is not None:
+            self.pool_free.append(not self.db._lock.locked())
+        if chat_id == 13:
+            raise RuntimeError("chat not found")
+        self.sent.append(chat_id)
+
+
+def test_award_credits_once_per_year_and_notifies_after_releasing_connection():
+    db = _database()
+    bot = _Bot(db)
+    limiter = TelegramRateLimiter(rate=1e6, burst=1e6, per_chat_interval=0)
+    job = BirthdayBonusJob(db, bot, points=200, timezone="Europe/Kaliningrad", limiter=limiter)
+
+    client_cache.put({"id": 1, "telegram_id": 11, "card_number": "0001", "phone": None, "balance": 10})
+    first = asyncio.run(job.run(date(2026, 2, 28)))
+    # Баланс изменился в базе: строка кэша сброшена
+    assert client_cache.get("id", 1) is None
+    # 29.02 празднуется 28.02 невисокосного года, неактивные и чужие даты не получают бонус
+    assert [client["id"] for client in first.awarded] == [1, 2, 3]
+    assert (first.notified, first.notify_failed) == (1, 1)
+    assert bot.sent == [11] and bot.pool_free and all(bot.pool_free)
+
+    second = asyncio.run(job.run(date(2026, 2, 28)))
+    assert second.awarded == [] and bot.sent == [11]
+
+    sql = db.connection.db
+    balances = dict(tuple(row) for row in sql.execute("SELECT id, balance FROM clients ORDER BY id"))
+    assert balances == {1: 210, 2: 200, 3: 250, 4: 5, 5: 5}
+    transactions = [tuple(row) for row in sql.execute(
+        "SELECT client_id, operator_id, operation_type, points, description FROM point_transactions ORDER BY id"
+    )]
+    assert transactions == [(client_id, 7, "bonus", 200, "Birthday bonus (auto)") for client_id in (1, 2, 3)]
+    awards = [tuple(row) for row in sql.execute("SELECT client_id, year, points FROM birthday_bonus_awards")]
+    assert sorted(awards) == [(1, 2026, 200), (2, 2026, 200), (3, 2026, 200)]
@@ -0,0 +1,204 @@
+import asyncio
+import re
+import sqlite3
+from pathlib import Path
+
+import pytest
+from telegram.error import Forbidden, RetryAfter, TimedOut
+
+from src.utils.broadcast import (
+    UNCERTAIN_ERROR, BroadcastEngine, BroadcastResult, BroadcastStore, LeaseLost, personalize
+)
+from src.utils.database import SQLiteDatabase
+from src.utils.rate_limiter import TelegramRateLimiter
+
+SCHEMA = (Path(__file__).parents[2] / "migrations" / "001_initial_schema.sql").read_text(encoding="utf-8")
+
+
+class _MemoryStore:
+    """Хранилище рассылок в памяти с тем же интерфейсом, что и BroadcastStore"""
+
+    def __init__(self, clients, segment="all"):
+        self.clients = clients
+        self.broadcast = {"id": 1, "message": "Карта {card}: скидка!", "image_url": None,
+                          "segment": segment, "status": "scheduled"}
+        self.recipients = {}
+        self.counters = {"sent": 0, "failed": 0}
+        self.record_calls = 0
+        # Число продлений аренды, после которого её перехватывает другой процесс
+        self.lease_renewals = None
+
+    async def get_broadcast(self, broadcast_id):
+        return dict(self.broadcast)
+
+    async def set_status(self, broadcast_id, status):
+        self.broadcast["status"] = status
+
+    async def last_materialized(self, broadcast_id):
+        return max((r["client_id"] for r in self.recipients.values()), default=0)
+
+    async def materialize_batch(self, broadcast_id, segment, after_client_id, limit, rule=None):
+        batch = [c for c in self.clients if c["id"] > after_client_id][:limit]
+        for client in batch:
+            if all(r["client_id"] != client["id"] for r in self.recipients.values()):
+                rid = len(self.recipients) + 1
+                self.recipients[rid] = {"id": rid, "client_id": client["id"], "telegram_id": client["telegram_id"],
+                                        "card_number": client["card_number"], "status": "pending"}
+        return batch[-1]["id"] if batch else None
+
+    async def finish_materialization(self, broadcast_id):
+        self.broadcast["total_recipients"] = len(self.recipients)
+
+    async def pending_batch(self, broadcast_id, after_id, limit):
+        pending = [dict(r) for rid, r in sorted(self.recipients.items())
+                   if r["status"] == "pending" and rid > after_id]
+        return pending[:limit]
+
+    async def renew(self, broadcast_id):
+        if self.lease_renewals is None:
+            return True
+        self.lease_renewals -= 1
+        return self.lease_renewals >= 0
+
+    async def record(self, broadcast_id, outcomes):
+        self.record_calls += 1
+        for rid, status, error in outcomes:
+            if self.recipients[rid]["status"] == "pending":
+                self.recipients[rid]["status"] = status
+                self.counters["sent" if status == "sent" else "failed"] += 1
+
+
+class _Crash(BaseException):
+    """Имитация падения процесса: не перехватывается обработкой ошибок отправки"""
+
+
+class _FakeBot:
+    def __init__(self, blocked=(), flood_on=(), crash_after=None, timeout_on=()):
+        self.blocked = set(blocked)
+        self.flood_on = set(flood_on)
+        self.timeout_on = set(timeout_on)
+        self.crash_after = crash_after
+        self.delivered = []
+        self.calls = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        if chat_id in self.timeout_on:
+            raise TimedOut()
+        if self.crash_after is not None and len(self.delivered) >= self.crash_after:
+            raise _Crash()
+        if chat_id in self.flood_on:
+            self.flood_on.discard(chat_id)
+            raise RetryAfter(0)
+        if chat_id in self.blocked:
+            raise Forbidden("Forbidden: bot was blocked by the user")
+        self.delivered.append((chat_id, text))
+
+
+def _clients(count):
+    return [{"id": i, "telegram_id": 1000 + i, "card_number": f"RC{i}"} for i in range(1, count + 1)]
+
+
+def _fast_limiter():
+    return TelegramRateLimiter(rate=1e6, burst=1e6, per_chat_interval=0)
+
+
+def test_personalize_replaces_card_placeholders():
+    assert personalize("{имя}, ваша карта {card}", "RC7") == "RC7, ваша карта RC7"
+
+
+def test_broadcast_sends_records_in_bulk_and_handles_errors():
+    store = _MemoryStore(_clients(25))
+    bot = _FakeBot(blocked={1003}, flood_on={1005})
+    engine = BroadcastEngine(store, bot, _fast_limiter(), send_batch=10, materialize_batch=7)
+    result = asyncio.run(engine.run(1))
+
+    assert (result.sent, result.failed, result.retries) == (24, 1, 1)
+    assert store.broadcast["status"] == "completed"
+    assert store.broadcast["total_recipients"] == 25
+    assert store.counters == {"sent": 24, "failed": 1}
+    assert store.record_calls == 3
+    assert (1001, "Карта RC1: скидка!") in bot.delivered
+
+
+def test_broadcast_resumes_after_crash():
+    store = _MemoryStore(_clients(30))
+    engine = BroadcastEngine(store, _FakeBot(crash_after=12), _fast_limiter(), send_batch=5)
+    with pytest.raises(_Crash):
+        asyncio.run(engine.run(1))
+    assert store.broadcast["status"] == "sending"
+    assert store.counters["sent"] == 10
+
+    bot = _FakeBot()
+    result = asyncio.run(BroadcastEngine(store, bot, _fast_limiter(), send_batch=5).run(1))
+    assert result.sent == 20
+    assert sorted(chat for chat, _ in bot.delivered) == list(range(1011, 1031))
+    assert all(r["status"] == "sent" for r in store.recipients.values())
+
+
+def test_broadcast_stops_when_lease_is_taken_over():
+    store = _MemoryStore(_clients(30))
+    # Два продления при материализации и одно после первого пакета, затем аренда чужая
+    store.lease_renewals = 3
+    bot = _FakeBot()
+    with pytest.raises(LeaseLost):
+        asyncio.run(BroadcastEngine(store, bot, _fast_limiter(), send_batch=5, materialize_batch=50).run(1))
+    assert len(bot.delivered) == 10 and store.counters["sent"] == 10
+    assert store.broadcast["status"] == "sending"
+
+
+def test_timed_out_send_is_not_retried():
+    store = _MemoryStore(_clients(3))
+    bot = _FakeBot(timeout_on={1002})
+    result = asyncio.run(BroadcastEngine(store, bot, _fast_limiter()).run(1))
+
+    # Сообщение могло быть доставлено: вторая отправка не делается
+    assert bot.calls == 3
+    assert (result.sent, result.failed, result.uncertain, result.retries) == (2, 0, 1, 0)
+    assert store.recipients[2]["status"] == "failed"
+
+
+def _schema_table(name):
+    """CREATE TABLE из миграции 001 в виде, который принимает SQLite (CHECK сохраняется)"""
+    ddl = re.search(rf"CREATE TABLE {name} \(.*?\n\);", SCHEMA, re.S).group(0)
+    return ddl.replace("SERIAL PRIMARY KEY", "INTEGER PRIMARY KEY").replace("DEFAULT NOW()", "DEFAULT CURRENT_TIMESTAMP")
+
+
+def test_timed_out_send_is_recorded_within_schema_statuses():
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(_schema_table("broadcasts") + _schema_table("broadcast_recipients"))
+    db.connection.db.execute(
+        "INSERT INTO broadcasts (id, title, message, segment, status, created_by) "
+        "VALUES (1, 'Акция', 'Карта {card}', 'all', 'sending', 1)"
+    )
+    db.connection.db.executemany(
+        "INSERT INTO broadcast_recipients (id, broadcast_id, client_id, telegram_id) VALUES (?, 1, ?, ?)",
+        [(i, i, 1000 + i) for i in (1, 2, 3)]
+    )
+    db.connection.db.commit()
+    with pytest.raises(sqlite3.IntegrityError):
+        db.connection.db.execute("UPDATE broadcast_recipients SET status = 'uncertain' WHERE id = 1")
+    db.connection.db.rollback()
+
+    store = BroadcastStore(db.connection)
+    engine = BroadcastEngine(store, _FakeBot(timeout_on={1002}), _fast_limiter())
+    broadcast = {"id": 1, "message": "Карта {card}", "image_url": None}
+
+    async def scenario():
+        result = BroadcastResult(1)
+        outcomes = [
+            await engine._deliver(broadcast, {"id": i, "telegram_id": 1000 + i, "card_number": f"RC{i}"}, result)
+            for i in (1, 2, 3)
+        ]
+        # Весь пакет, включая таймаут, записывается одной транзакцией без нарушения CHECK
+        await store.record(1, outcomes)
+
+    asyncio.run(scenario())
+    rows = db.connection.db.execute("SELECT id, status, error_message FROM broadcast_recipients ORDER BY id")
+    statuses = [(row["id"], row["status"]) for row in rows]
+    assert statuses == [(1, "sent"), (2, "failed"), (3, "sent")]
+    error = db.connection.db.execute("SELECT error_message FROM broadcast_recipients WHERE id = 2").fetchone()[0]
+    assert error.startswith(UNCERTAIN_ERROR)
+    counters = db.connection.db.execute("SELECT sent_count, failed_count FROM broadcasts WHERE id = 1").fetchone()
+    assert tuple(counters) == (2, 1)
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from src.utils.callback_router import CallbackRouter
+
+
+class _Query:
+    def __init__(self, data):
+        self.data = data
+        self.answered = 0
+
+    async def answer(self):
+        self.answered += 1
+
+
+class _Update:
+    def __init__(self, data):
+        self.callback_query = _Query(data)
+
+
+def _handler(name, calls):
+    async def handler(update, context, **kwargs):
+        calls.append((name, kwargs))
+    return handler
+
+
+def _router(calls):
+    router = CallbackRouter()
+    router.exact("manage_clients", _handler("menu", calls), answer=True)
+    router.pattern("manage_client_{client_id:int}", _handler("client", calls), answer=True)
+    router.prefix("confirm_delete_", _handler("delete", calls))
+    router.prefix("stats_", _handler("stats", calls))
+    router.pattern("stats_page_{page:int}", _handler("stats_page", calls))
+    return router
+
+
+def test_exact_match_wins_over_prefix():
+    calls = []
+    asyncio.run(_router(calls).dispatch(_Update("manage_clients"), None))
+    assert calls == [("menu", {})]
+
+
+def test_typed_argument_extraction():
+    calls = []
+    update = _Update("manage_client_42")
+    asyncio.run(_router(calls).dispatch(update, None))
+    assert calls == [("client", {"client_id": 42})]
+    assert update.callback_query.answered == 1
+
+
+def test_longest_prefix_with_fallback_to_shorter_on_conversion_error():
+    calls = []
+    router = _router(calls)
+    asyncio.run(router.dispatch(_Update("stats_page_3"), None))
+    asyncio.run(router.dispatch(_Update("stats_page_x"), None))
+    assert calls == [("stats_page", {"page": 3}), ("stats", {})]
+
+
+def test_prefix_routes_leave_answer_to_handler():
+    calls = []
+    update = _Update("confirm_delete_7")
+    asyncio.run(_router(calls).dispatch(update, None))
+    assert calls == [("delete", {})]
+    assert update.callback_query.answered == 0
+
+
+def test_unknown_callback_is_answered():
+    calls = []
+    update = _Update("manage_client_abc")
+    asyncio.run(_router(calls).dispatch(update, None))
+    assert calls == []
+    assert update.callback_query.answered == 1
+
+
+def test_duplicate_and_malformed_routes_are_rejected():
+    router = _router([])
+    with pytest.raises(ValueError):
+        router.exact("manage_clients", _handler("x", []))
+    with pytest.raises(ValueError):
+        router.prefix("stats_", _handler("x", []))
+    with pytest.raises(ValueError):
+        router.pattern("{a}_{b}", _handler("x", []))
+    with pytest.raises(ValueError):
+        router.pattern("item_{a:float}", _handler("x", []))
+    assert len(router) == 5
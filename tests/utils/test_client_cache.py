@@ -0,0 +1,94 @@
+import asyncio
+
+from src.utils.client_cache import ClientCache, invalidating
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _row(client_id, balance=100):
+    return {
+        "id": client_id,
+        "telegram_id": 1000 + client_id,
+        "card_number": f"RC{client_id:04d}",
+        "phone": f"+7 (900) 000-{client_id:04d}",
+        "balance": balance,
+    }
+
+
+def test_lookup_by_every_key_shares_one_row():
+    cache = ClientCache()
+    cache.put(_row(1))
+    assert cache.get("telegram_id", "1001")["id"] == 1
+    assert cache.get("card_number", "RC0001")["id"] == 1
+    assert cache.get("phone", "89000000001")["id"] == 1
+    assert cache.get("id", 1)["id"] == 1
+    assert cache.get("phone", "89000000002") is None
+    stats = cache.stats()
+    assert (stats.size, stats.hits, stats.misses) == (1, 4, 1)
+
+
+def test_lru_eviction_and_ttl_expiry():
+    clock = _Clock()
+    cache = ClientCache(max_size=2, ttl=10, clock=clock)
+    cache.put(_row(1))
+    cache.put(_row(2))
+    cache.get("id", 1)
+    cache.put(_row(3))
+    assert cache.get("card_number", "RC0002") is None
+    assert cache.get("card_number", "RC0001") is not None
+
+    clock.now = 11
+    assert cache.get("id", 3) is None
+    stats = cache.stats()
+    assert stats.evictions == 1
+    assert stats.expirations == 1
+
+
+def test_invalidation_drops_secondary_keys():
+    cache = ClientCache()
+    cache.put(_row(1))
+    cache.invalidate("phone", "9000000001")
+    assert cache.get("telegram_id", 1001) is None
+    assert cache.stats().invalidations == 1
+
+
+def test_load_racing_with_invalidation_is_not_cached():
+    cache = ClientCache()
+
+    async def scenario():
+        async def loader():
+            # Запись баланса завершилась, пока строка читалась
+            cache.invalidate_client(1)
+            return _row(1, balance=50)
+
+        await cache.get_or_load("id", 1, loader)
+
+    asyncio.run(scenario())
+    assert cache.get("id", 1) is None
+
+
+def test_invalidating_wrapper_uses_user_data_snapshot():
+    cache = ClientCache()
+    cache.put(_row(1))
+    cache.put(_row(2))
+
+    class _Context:
+        user_data = {"client_id": 1}
+
+    async def confirm(update, context):
+        context.user_data.clear()
+
+    handler = invalidating(confirm, lambda u, c, data: cache.invalidate_from_user_data(data))
+    asyncio.run(handler(None, _Context()))
+    assert cache.get("id", 1) is None
+    assert cache.get("id", 2) is not None
+
+    # Без сведений о клиенте кэш сбрасывается целиком
+    asyncio.run(handler(None, _Context()))
+    assert cache.stats().size == 0
@@ -0,0 +1,109 @@
+import asyncio
+import random
+from pathlib import Path
+
+from src.utils.client_listing import ClientListing, Cursor, decode_cursor
+from src.utils.database import SQLiteDatabase
+
+MIGRATION = (Path(__file__).parents[2] / "migrations" / "013_client_listing_indexes.sql").read_text(encoding="utf-8")
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, card_number TEXT, full_name TEXT, balance INTEGER, last_visit TIMESTAMP,
+  is_active INTEGER
+);
+"""
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _database(count=47):
+    rng = random.Random(3)
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA + MIGRATION)
+    db.connection.db.executemany(
+        "INSERT INTO clients VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (i, f"RC{i:06d}", rng.choice(["Анна", "Борис", "Вера", "Глеб"]), rng.randint(0, 5),
+             None if i % 5 == 0 else f"2026-10-{rng.randint(1, 9):02d} 12:00:00", 0 if i % 11 == 0 else 1)
+            for i in range(1, count + 1)
+        ],
+    )
+    return db
+
+
+def _expected(db, sort):
+    rows = db.connection.db.execute("SELECT id, full_name, balance, last_visit FROM clients WHERE is_active = 1")
+    rows = [dict(row) for row in rows]
+    if sort == "n":
+        rows.sort(key=lambda row: (row["full_name"], row["id"]))
+    elif sort == "b":
+        rows.sort(key=lambda row: (row["balance"], row["id"]), reverse=True)
+    else:
+        rows.sort(key=lambda row: (str(row["last_visit"] or "1970-01-01"), row["id"]), reverse=True)
+    return [row["id"] for row in rows]
+
+
+def test_cursor_is_compact_and_roundtrips():
+    cursor = Cursor("n", False, 123, 987654321)
+    assert decode_cursor(cursor.encode()) == cursor
+    assert len(cursor.encode().encode()) <= 64
+    assert decode_cursor("cl:garbage") == Cursor()
+    assert decode_cursor(Cursor().encode()) == Cursor()
+
+
+def test_pages_cover_every_client_in_both_directions():
+    db = _database()
+    listing = ClientListing(page_size=10)
+
+    async def walk(sort):
+        pages = [await listing.page(db.connection, Cursor(sort))]
+        while pages[-1].next_cursor():
+            pages.append(await listing.page(db.connection, pages[-1].next_cursor()))
+        backwards = [pages[-1]]
+        while backwards[-1].prev_cursor():
+            backwards.append(await listing.page(db.connection, backwards[-1].prev_cursor()))
+        return pages, backwards
+
+    for sort in ("v", "b", "n"):
+        listing.invalidate()
+        pages, backwards = asyncio.run(walk(sort))
+        ids = [client["id"] for page in pages for client in page.clients]
+        assert ids == _expected(db, sort)
+        assert [page.page for page in pages] == list(range(1, len(pages) + 1))
+        assert [page.clients for page in backwards] == [page.clients for page in reversed(pages)]
+        assert backwards[-1].page == 1 and not backwards[-1].has_prev
+
+
+def test_flipping_back_and_forth_hits_the_cache():
+    db = _database()
+    clock = _Clock()
+    listing = ClientListing(page_size=10, ttl=20, clock=clock)
+
+    async def flip():
+        first = await listing.page(db.connection, Cursor())
+        second = await listing.page(db.connection, first.next_cursor())
+        queries = db.connection.queries
+        for _ in range(5):
+            await listing.page(db.connection, second.prev_cursor())
+            await listing.page(db.connection, first.next_cursor())
+        cached_queries = db.connection.queries - queries
+        clock.now += 21
+        await listing.page(db.connection, Cursor())
+        return cached_queries, db.connection.queries - queries
+
+    assert asyncio.run(flip()) == (0, 1)
+
+
+def test_missing_anchor_restarts_from_first_page():
+    db = _database()
+    listing = ClientListing(page_size=10)
+    page = asyncio.run(listing.page(db.connection, Cursor("n", True, 4, 999999)))
+    assert page.page == 1 and not page.has_prev
@@ -0,0 +1,49 @@
+import asyncio
+from datetime import datetime
+
+from src.utils.commit_horizon import id_horizon, time_horizon
+
+T0 = datetime(2026, 10, 17, 12, 0, 0)
+T1 = datetime(2026, 10, 17, 12, 1, 0)
+
+
+class _Postgres:
+    """Ответы PostgreSQL: значение последовательности и начало самой старой открытой транзакции"""
+
+    def __init__(self, last_id, read_at, oldest):
+        self.last_id = last_id
+        self.read_at = read_at
+        self.oldest = oldest
+
+    async def fetchrow(self, sql, *args):
+        return {"last_id": self.last_id, "read_at": self.read_at}
+
+    async def fetchval(self, sql, *args):
+        return self.read_at if "clock_timestamp" in sql else self.oldest
+
+
+def test_id_horizon_waits_for_transactions_older_than_the_sequence_read():
+    async def scenario():
+        # Открытых транзакций нет: выданные id уже безопасны
+        assert await id_horizon(_Postgres(10, T0, None), "clients", None, None) == (10, None, None)
+        # Транзакция старше чтения ещё открыта: отметка откладывается
+        pending = await id_horizon(_Postgres(10, T0, datetime(2026, 10, 17, 11, 59)), "clients", None, None)
+        assert pending == (None, 10, T0)
+        # Она ещё открыта при следующем проходе: отметка не заменяется более новой
+        assert await id_horizon(_Postgres(15, T1, datetime(2026, 10, 17, 11, 59)), "clients", 10, T0) == (
+            None, 10, T0
+        )
+        # Все транзакции, открытые в T0, завершились: id до 10 безопасны, новая отметка — 15
+        assert await id_horizon(_Postgres(15, T1, datetime(2026, 10, 17, 12, 0, 30)), "clients", 10, T0) == (
+            10, 15, T1
+        )
+
+    asyncio.run(scenario())
+
+
+def test_time_horizon_is_the_oldest_open_transaction():
+    async def scenario():
+        assert await time_horizon(_Postgres(0, T1, None)) == T1
+        assert await time_horizon(_Postgres(0, T1, T0)) == T0
+
+    asyncio.run(scenario())
@@ -0,0 +1,132 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+from src.utils.client_cache import client_cache, load_client
+from src.utils.database import HOT_QUERIES, Database, SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, telegram_id INTEGER, card_number TEXT, full_name TEXT, phone TEXT,
+  balance INTEGER, total_spent TEXT, visit_count INTEGER, last_visit TEXT, is_active INTEGER
+);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT,
+  points INTEGER, amount TEXT, description TEXT
+);
+INSERT INTO clients VALUES (1, 501, 'RC000101', 'Петров Пётр', '+79001234567', 120, '0', 3, NULL, 1);
+INSERT INTO clients VALUES (2, 502, 'RC000102', 'Анна', '+79007654321', 0, '0', 0, NULL, 0);
+"""
+
+INSERT = "INSERT INTO point_transactions (client_id, operator_id, operation_type, points) VALUES ($1, 1, 'earn', $2)"
+
+
+def _database():
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA)
+    return db
+
+
+def test_hot_queries_return_rows():
+    db = _database()
+
+    async def scenario():
+        assert (await db.client_balance(501))["balance"] == 120
+        assert await db.client_balance(502) is None
+        assert (await db.client_by_phone("+79007654321"))["id"] == 2
+        assert (await db.client_by_card("RC000101"))["full_name"] == "Петров Пётр"
+
+    asyncio.run(scenario())
+
+
+def test_transaction_rolls_back_on_error():
+    db = _database()
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            async with db.acquire() as connection:
+                async with connection.transaction():
+                    await connection.execute(INSERT, 1, 10)
+                    raise RuntimeError("boom")
+        async with db.acquire() as connection:
+            async with connection.transaction():
+                await connection.execute(INSERT, 1, 10)
+        return await db.fetchval("SELECT COUNT(*) FROM point_transactions")
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_stats_track_acquires_and_health():
+    db = _database()
+
+    async def scenario():
+        await db.client_balance(501)
+        assert await db.health_check()
+        return db.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats.backend == "sqlite"
+    assert stats.acquires == 2
+    assert stats.in_use == 0
+    assert stats.healthy and stats.last_check_ms is not None
+
+
+def test_load_client_goes_through_cache():
+    db = _database()
+    client_cache.clear()
+
+    async def scenario():
+        first = await load_client(db, "card_number", "RC000101")
+        second = await load_client(db, "telegram_id", 501)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first["id"] == second["id"] == 1
+    assert db.connection.queries == 1
+    client_cache.clear()
+
+
+def test_phone_lookup_matches_cache_normalization():
+    db = _database()
+    client_cache.clear()
+
+    async def scenario():
+        by_phone = await load_client(db, "phone", "8 (900) 123-45-67")
+        queries = db.connection.queries
+        # Тот же номер в другой записи — попадание в кэш, а не новый запрос
+        again = await load_client(db, "phone", "9001234567")
+        by_id = await load_client(db, "id", 1)
+        return by_phone, again, by_id, db.connection.queries - queries
+
+    by_phone, again, by_id, queries = asyncio.run(scenario())
+    assert by_phone["id"] == again["id"] == by_id["id"] == 1
+    assert queries == 0
+    client_cache.clear()
+
+
+def test_pool_init_prepares_hot_queries_and_tolerates_missing_columns():
+    class _Connection:
+        def __init__(self):
+            self.listeners = []
+
+        async def prepare(self, sql):
+            if "card_number = $1" in sql:
+                raise asyncpg.UndefinedColumnError("column \"card_number\" does not exist")
+            return sql
+
+        def get_server_pid(self):
+            return 4242
+
+        def add_termination_listener(self, callback):
+            self.listeners.append(callback)
+
+    db = Database()
+    connection = _Connection()
+    asyncio.run(db._init_connection(connection))
+    assert set(db._prepared[4242]) == set(HOT_QUERIES) - {"client_by_card"}
+
+    # Закрытое соединение забирает свои выражения
+    connection.listeners[0](connection)
+    assert 4242 not in db._prepared
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from src.utils.dispatcher import ChatOrderedDispatcher, chat_key
+
+
+class _Chat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class _Update:
+    def __init__(self, update_id, chat_id=None):
+        self.update_id = update_id
+        self.effective_chat = _Chat(chat_id) if chat_id is not None else None
+        self.effective_user = None
+
+
+def test_chat_key_prefers_chat_then_update():
+    assert chat_key(_Update(1, chat_id=42)) == 42
+    assert chat_key(_Update(7)) == ("update", 7)
+
+
+def test_per_chat_order_is_preserved():
+    async def scenario():
+        dispatcher = ChatOrderedDispatcher(workers=4, max_pending=100)
+        await dispatcher.start()
+        seen = {chat: [] for chat in range(5)}
+
+        def job(chat, step):
+            async def run():
+                # Разные задержки провоцируют перестановку при отсутствии упорядочивания
+                await asyncio.sleep(0.001 * ((step * 7 + chat) % 3))
+                seen[chat].append(step)
+            return run
+
+        for step in range(20):
+            for chat in range(5):
+                await dispatcher.submit(chat, job(chat, step))
+        await dispatcher.stop(drain=True)
+        return seen, dispatcher.stats()
+
+    seen, stats = asyncio.run(scenario())
+    for steps in seen.values():
+        assert steps == list(range(20))
+    assert stats.processed == 100
+    assert stats.queue_depth == 0
+
+
+def test_concurrency_is_bounded_by_workers():
+    async def scenario():
+        dispatcher = ChatOrderedDispatcher(workers=3, max_pending=50)
+        await dispatcher.start()
+        running = 0
+        peak = 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.005)
+            running -= 1
+
+        for chat in range(12):
+            await dispatcher.submit(chat, job)
+        await dispatcher.join()
+        await dispatcher.stop()
+        return peak
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_failures_are_counted_and_do_not_stop_workers():
+    async def scenario():
+        dispatcher = ChatOrderedDispatcher(workers=1, max_pending=10)
+        await dispatcher.start()
+
+        async def broken():
+            raise RuntimeError("boom")
+
+        async def ok():
+            return None
+
+        await dispatcher.submit(1, broken)
+        await dispatcher.submit(1, ok)
+        await dispatcher.stop(drain=True)
+        return dispatcher.stats()
+
+    stats = asyncio.run(scenario())
+    assert stats.processed == 2
+    assert stats.failed == 1
+
+
+def test_submit_requires_started_dispatcher():
+    async def scenario():
+        async def job():
+            return None
+        await ChatOrderedDispatcher().submit(1, job)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
@@ -0,0 +1,131 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+
+from src.utils import export
+from src.utils.export import EXPORT_TABLES, StreamingExporter, keyset_query
+from src.utils.database import SQLiteDatabase
+
+SCHEMA = """
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT,
+  points INTEGER, amount TEXT, description TEXT, created_at TEXT
+);
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, telegram_id INTEGER, card_number TEXT, full_name TEXT, phone TEXT,
+  birth_date TEXT, balance INTEGER, total_spent TEXT, visit_count INTEGER, last_visit TEXT,
+  notes TEXT, is_active INTEGER, created_at TEXT, updated_at TEXT
+);
+CREATE TABLE export_state (
+  table_name TEXT PRIMARY KEY, last_key TEXT NOT NULL, rows_exported INTEGER NOT NULL DEFAULT 0,
+  exported_at TEXT
+);
+"""
+
+
+def _database(transactions=0, clients=0):
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA)
+    db.connection.db.executemany(
+        "INSERT INTO point_transactions VALUES (?, 1, 1, 'earn', ?, '100.00', 'Покупка', '2026-01-01')",
+        [(i, i % 50) for i in range(1, transactions + 1)],
+    )
+    db.connection.db.executemany(
+        "INSERT INTO clients (id, card_number, full_name, balance, updated_at) VALUES (?, ?, 'Клиент', 0, ?)",
+        [(i, f"RC{i}", f"2026-01-01 00:00:{i:02d}") for i in range(1, clients + 1)],
+    )
+    db.connection.db.commit()
+    return db
+
+
+class _Uploads:
+    def __init__(self, db=None):
+        self.db = db
+        self.files = []
+
+    async def __call__(self, fileobj, filename, caption):
+        # Во время отправки соединение возвращено в пул
+        assert self.db is None or not self.db._lock.locked()
+        data = fileobj.read()
+        if filename.endswith(".gz"):
+            data = gzip.decompress(data)
+        self.files.append((filename, data.decode("utf-8-sig")))
+
+
+def test_keyset_query_shapes():
+    table = EXPORT_TABLES["clients"]
+    assert "WHERE id > $1" in keyset_query(table, ("id",), True)
+    assert keyset_query(table, ("id",), True).endswith("LIMIT $2")
+    assert "WHERE (updated_at, id) > ($1, $2)" in keyset_query(table, ("updated_at", "id"), True)
+    assert keyset_query(table, ("updated_at", "id"), False).endswith("ORDER BY updated_at, id LIMIT $1")
+    bounded = keyset_query(table, ("updated_at", "id"), True, bounded=True)
+    assert "WHERE (updated_at, id) > ($1, $2) AND updated_at < $3 " in bounded and bounded.endswith("LIMIT $4")
+
+
+def test_csv_export_is_paged_and_split_into_parts():
+    db = _database(transactions=1050)
+    uploads = _Uploads(db)
+    exporter = StreamingExporter(db, uploads, page_size=100, part_size=16 * 1024)
+    result = asyncio.run(exporter.export_table(EXPORT_TABLES["point_transactions"]))
+
+    assert result.rows == 1050
+    assert len(result.parts) == len(uploads.files) > 1
+    rows = []
+    for _, text in uploads.files:
+        reader = list(csv.reader(io.StringIO(text)))
+        assert reader[0][0] == "id"
+        rows.extend(reader[1:])
+    assert [int(row[0]) for row in rows] == list(range(1, 1051))
+    # Граница, 11 страниц и одна запись позиции экспорта
+    assert db.connection.queries == 13
+
+
+def test_incremental_jsonl_export_continues_from_watermark():
+    db = _database(clients=5)
+    uploads = _Uploads()
+    exporter = StreamingExporter(db, uploads, fmt="jsonl", compress=True, page_size=2)
+    first = asyncio.run(exporter.export_table(EXPORT_TABLES["clients"], incremental=True))
+    assert first.rows == 5
+
+    db.connection.db.execute("UPDATE clients SET balance = 10, updated_at = '2026-02-01 00:00:00' WHERE id = 2")
+    db.connection.db.execute("INSERT INTO clients (id, card_number, full_name, updated_at) VALUES (6, 'RC6', 'Новый', "
+                  "'2026-02-01 00:00:01')")
+    uploads.files.clear()
+    second = asyncio.run(exporter.export_table(EXPORT_TABLES["clients"], incremental=True))
+
+    assert second.rows == 2
+    lines = [json.loads(line) for _, text in uploads.files for line in text.splitlines()]
+    assert [(line["id"], line["balance"]) for line in lines] == [(2, 10), (6, None)]
+    assert uploads.files[0][0].endswith(".jsonl.gz")
+
+    uploads.files.clear()
+    third = asyncio.run(exporter.export_table(EXPORT_TABLES["clients"], incremental=True))
+    assert third.rows == 0 and uploads.files == []
+
+
+def test_incremental_export_keeps_rows_committed_late(monkeypatch):
+    db = _database(clients=5)
+    uploads = _Uploads(db)
+    exporter = StreamingExporter(db, uploads, fmt="jsonl", page_size=2)
+    horizons = iter(["2026-01-01 00:00:04", "2026-12-31 00:00:00"])
+
+    async def horizon(connection):
+        return next(horizons)
+
+    # Транзакция, начатая в 00:00:04, ещё не зафиксирована: позиция останавливается перед ней
+    monkeypatch.setattr(export, "time_horizon", horizon)
+    first = asyncio.run(exporter.export_table(EXPORT_TABLES["clients"], incremental=True))
+    assert first.rows == 3 and first.last_key[1] == 3
+
+    # Строка с отметкой раньше сохранённой позиции не пропадёт при следующем экспорте
+    db.connection.db.execute("INSERT INTO clients (id, card_number, full_name, updated_at) VALUES (6, 'RC6', 'Поздний', "
+                             "'2026-01-01 00:00:04')")
+    db.connection.db.commit()
+    uploads.files.clear()
+    second = asyncio.run(exporter.export_table(EXPORT_TABLES["clients"], incremental=True))
+    lines = [json.loads(line) for _, text in uploads.files for line in text.splitlines()]
+    assert sorted(line["id"] for line in lines) == [4, 5, 6]
+    assert second.rows == 3
@@ -0,0 +1,162 @@
+import asyncio
+import random
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.database import SQLiteDatabase
+from src.utils.ledger import (
+    ClientNotFound, IdempotencyConflict, InsufficientPoints, PointLedger, idempotency_key
+)
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, balance INTEGER, total_spent NUMERIC DEFAULT 0, visit_count INTEGER DEFAULT 0,
+  last_visit TEXT, is_active INTEGER DEFAULT 1, updated_at TEXT
+);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT, points INTEGER,
+  amount NUMERIC, description TEXT, idempotency_key TEXT UNIQUE, balance_after INTEGER, created_at TEXT
+);
+-- Как триггер миграции 009: total_spent ведёт база, а не журнал
+CREATE TRIGGER trigger_log_point_transaction AFTER INSERT ON point_transactions
+BEGIN
+  UPDATE clients SET total_spent = COALESCE(total_spent, 0) + CASE
+      WHEN NEW.operation_type = 'spend' THEN ABS(NEW.points)
+      WHEN NEW.operation_type = 'earn' AND NEW.amount IS NOT NULL THEN NEW.amount
+      ELSE 0
+    END
+  WHERE id = NEW.client_id;
+END;
+"""
+
+START_BALANCE = 50
+
+
+def _create(path, clients):
+    db = SQLiteDatabase(path)
+    asyncio.run(db.open())
+    db.connection.db.execute("PRAGMA journal_mode=WAL")
+    db.connection.script(SCHEMA)
+    db.connection.db.executemany(
+        "INSERT INTO clients (id, balance) VALUES (?, ?)", [(i, START_BALANCE) for i in range(1, clients + 1)]
+    )
+    db.connection.db.commit()
+    return db
+
+
+def test_earn_and_spend_update_balance_and_visits(tmp_path):
+    db = _create(str(tmp_path / "ledger.db"), clients=1)
+    ledger = PointLedger(db)
+
+    async def scenario():
+        earned = await ledger.earn(1, 7, 30, amount=300)
+        spent = await ledger.spend(1, 7, 80)
+        return earned, spent
+
+    earned, spent = asyncio.run(scenario())
+    assert (earned.balance, spent.balance) == (80, 0)
+    row = db.connection.db.execute("SELECT balance, visit_count, total_spent FROM clients").fetchone()
+    assert tuple(row) == (0, 2, 380)
+
+
+def test_spend_guard_leaves_balance_untouched(tmp_path):
+    db = _create(str(tmp_path / "ledger.db"), clients=1)
+    ledger = PointLedger(db)
+
+    with pytest.raises(InsufficientPoints) as error:
+        asyncio.run(ledger.spend(1, 7, START_BALANCE + 1))
+    assert error.value.available == START_BALANCE
+    with pytest.raises(ClientNotFound):
+        asyncio.run(ledger.earn(99, 7, 10))
+    assert db.connection.db.execute("SELECT COUNT(*) FROM point_transactions").fetchone()[0] == 0
+
+
+def test_replayed_key_returns_first_result(tmp_path):
+    db = _create(str(tmp_path / "ledger.db"), clients=1)
+    ledger = PointLedger(db)
+    update = SimpleNamespace(update_id=1001, effective_chat=SimpleNamespace(id=42))
+    key = idempotency_key(update, "spend")
+    assert key == "tg:42:1001:spend"
+
+    async def scenario():
+        first = await ledger.spend(1, 7, 20, key=key)
+        second = await ledger.spend(1, 7, 20, key=key)
+        with pytest.raises(IdempotencyConflict):
+            await ledger.spend(1, 7, 5, key=key)
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert not first.replayed and second.replayed
+    assert second.transaction_id == first.transaction_id
+    assert second.balance == first.balance == START_BALANCE - 20
+
+
+def test_parallel_operations_reconcile(tmp_path):
+    """Тысячи операций из нескольких потоков, каждая доставлена дважды"""
+    path = str(tmp_path / "ledger.db")
+    clients, threads, operations = 10, 8, 1500
+    _create(path, clients)
+
+    rng = random.Random(7)
+    ops = []
+    for i in range(operations):
+        kind = rng.choice(("earn", "spend", "spend"))
+        ops.append((f"op{i}", kind, rng.randint(1, clients), rng.randint(1, 30)))
+    # Каждая операция попадает в два разных потока — как повторная доставка обновления
+    queues = [[] for _ in range(threads)]
+    for i, op in enumerate(ops):
+        queues[i % threads].append(op)
+        queues[(i + 3) % threads].append(op)
+
+    results = {}
+    lock = threading.Lock()
+
+    def worker(queue):
+        async def run():
+            db = SQLiteDatabase(path)
+            await db.open()
+            ledger = PointLedger(db)
+
+            async def one(op):
+                key, kind, client_id, points = op
+                try:
+                    if kind == "earn":
+                        result = await ledger.earn(client_id, 1, points, key=key)
+                    else:
+                        result = await ledger.spend(client_id, 1, points, key=key)
+                except InsufficientPoints:
+                    result = None
+                with lock:
+                    results.setdefault(key, []).append(result)
+
+            rng_local = random.Random(len(queue))
+            rng_local.shuffle(queue)
+            await asyncio.gather(*(one(op) for op in queue))
+            await db.close()
+
+        asyncio.run(run())
+
+    pool = [threading.Thread(target=worker, args=(queue,)) for queue in queues]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    check = sqlite3.connect(path)
+    balances = dict(check.execute("SELECT id, balance FROM clients").fetchall())
+    logged = dict(check.execute("SELECT client_id, SUM(points) FROM point_transactions GROUP BY client_id").fetchall())
+    keys = [row[0] for row in check.execute("SELECT idempotency_key FROM point_transactions")]
+
+    assert all(balance >= 0 for balance in balances.values())
+    for client_id, balance in balances.items():
+        assert balance == START_BALANCE + logged.get(client_id, 0)
+
+    applied = {key for key, outcomes in results.items() if any(outcomes)}
+    assert sorted(keys) == sorted(applied)
+    for outcomes in results.values():
+        ids = {outcome.transaction_id for outcome in outcomes if outcome}
+        assert len(ids) <= 1
+    assert any(outcome and outcome.replayed for outcomes in results.values() for outcome in outcomes)
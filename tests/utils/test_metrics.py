@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ConversationHandler, MessageHandler, filters
+
+from src.utils.callback_router import CallbackRouter
+from src.utils.database import SQLiteDatabase
+from src.utils.metrics import HandlerMetrics, Histogram
+
+
+def test_wrapped_handler_records_latency_db_telegram_and_errors():
+    metrics = HandlerMetrics()
+    db = SQLiteDatabase()
+    db.query_observer = metrics.record_db
+
+    async def balance(update, context):
+        async with db.acquire() as connection:
+            await connection.fetchval("SELECT 1")
+            await connection.fetchval("SELECT 2")
+        metrics.record_telegram(0.02)
+        return "done"
+
+    async def broken(update, context):
+        raise RuntimeError("boom")
+
+    async def scenario():
+        await db.open()
+        timed = metrics.wrap("/balance", balance)
+        results = [await timed(None, None) for _ in range(3)]
+        with pytest.raises(RuntimeError):
+            await metrics.wrap("/broken", broken)(None, None)
+        # Запрос вне обработчика никому не приписывается
+        await db.fetchval("SELECT 3")
+        return results
+
+    assert asyncio.run(scenario()) == ["done"] * 3
+    stats = metrics.handlers["/balance"]
+    assert stats.latency.count == 3
+    assert stats.db_queries == 6
+    assert stats.telegram_calls == 3
+    assert stats.telegram_seconds == pytest.approx(0.06)
+    assert stats.errors == 0
+    assert metrics.handlers["/broken"].errors == 1
+    assert metrics.handlers["/broken"].latency.count == 1
+
+
+def test_disabled_metrics_leave_handlers_untouched():
+    metrics = HandlerMetrics(enabled=False)
+
+    async def start(update, context):
+        pass
+
+    application = Application.builder().token("1:TEST").updater(None).build()
+    application.add_handler(CommandHandler("start", start))
+    metrics.instrument(application)
+    assert metrics.wrap("/start", start) is start
+    assert application.handlers[0][0].callback is start
+    assert metrics.handlers == {}
+
+
+def test_instrument_names_commands_conversation_steps_and_routes():
+    metrics = HandlerMetrics()
+
+    async def start(update, context):
+        pass
+
+    async def add_points_client(update, context):
+        pass
+
+    async def cancel(update, context):
+        pass
+
+    async def manage(update, context, client_id):
+        pass
+
+    router = CallbackRouter()
+    router.exact("statistics", start)
+    router.prefix("stats_", start)
+    router.pattern("manage_client_{client_id:int}", manage)
+
+    application = Application.builder().token("1:TEST").updater(None).build()
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("add_points", lambda u, c: None)],
+        states={0: [MessageHandler(filters.TEXT, add_points_client)]},
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="add_points",
+    ))
+    application.add_handler(CallbackQueryHandler(router.dispatch))
+
+    metrics.instrument(application, exclude=[router.dispatch])
+    router.wrap_handlers(metrics.wrap)
+
+    assert set(metrics.handlers) == {
+        "/start", "add_points.entry", "add_points.add_points_client", "add_points.cancel",
+        "statistics", "stats_*", "manage_client_{client_id}",
+    }
+    assert application.handlers[0][-1].callback == router.dispatch
+    assert application.handlers[0][0].callback.__wrapped__ is start
+
+
+def test_histogram_quantiles_and_prometheus_output():
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.observe(0.004)
+    for _ in range(10):
+        histogram.observe(0.3)
+    assert histogram.quantile(0.5) < 0.005
+    assert 0.25 < histogram.quantile(0.99) <= 0.5
+
+    metrics = HandlerMetrics()
+
+    async def start(update, context):
+        pass
+
+    asyncio.run(metrics.wrap('say "hi"', start)(None, None))
+    text = metrics.render_prometheus()
+    assert '# TYPE bot_handler_latency_seconds histogram' in text
+    assert 'bot_handler_latency_seconds_bucket{handler="say \\"hi\\"",le="+Inf"} 1' in text
+    assert 'bot_handler_latency_seconds_count{handler="say \\"hi\\""} 1' in text
+    assert 'bot_handler_errors_total{handler="say \\"hi\\""} 0' in text
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ConversationHandler, MessageHandler, filters
+from telegram.request import BaseRequest
+
+from src.utils.database import SQLiteDatabase
+from src.utils.persistence import DatabasePersistence, dumps, loads
+
+MIGRATION = (Path(__file__).parents[2] / "migrations" / "012_bot_persistence.sql").read_text(encoding="utf-8")
+
+ASK_NAME, ASK_PHONE = range(2)
+
+
+class _OfflineRequest(BaseRequest):
+    """Bot API без сети: отвечает только на getMe"""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "Rock Coffee", "username": "rock_coffee_bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_800_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _database(path):
+    db = SQLiteDatabase(path)
+    asyncio.run(db.open())
+    db.connection.script(MIGRATION)
+    return db
+
+
+def _message(update_id, user_id, text):
+    message = {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "Клиент"},
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+def _application(persistence, replies):
+    async def start(update, context):
+        context.user_data["started"] = True
+        return ASK_NAME
+
+    async def name(update, context):
+        context.user_data["name"] = update.message.text
+        return ASK_PHONE
+
+    async def phone(update, context):
+        replies.append((context.user_data.get("name"), update.message.text))
+        return ConversationHandler.END
+
+    builder = Application.builder().token("1:TEST").request(_OfflineRequest()).updater(None)
+    if persistence is not None:
+        builder = builder.persistence(persistence)
+    application = builder.build()
+    application.add_handler(ConversationHandler(
+        entry_points=[CommandHandler("purchase", start)],
+        states={
+            ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, name)],
+            ASK_PHONE: [MessageHandler(filters.TEXT & ~filters.COMMAND, phone)],
+        },
+        fallbacks=[],
+        name="purchase",
+        persistent=persistence is not None,
+    ))
+    return application
+
+
+def test_serialization_is_compact_and_roundtrips():
+    small = {"client_id": 5}
+    large = {"history": ["Покупка капучино"] * 200}
+    assert loads(dumps(small)) == small
+    assert loads(dumps(large)) == large
+    assert len(dumps(large)) < len(json.dumps(large, ensure_ascii=False).encode()) / 10
+
+
+def test_conversation_resumes_after_restart(tmp_path):
+    path = str(tmp_path / "state.db")
+    db = _database(path)
+    replies = []
+
+    async def first_run():
+        application = _application(DatabasePersistence(db), replies)
+        await application.initialize()
+        for payload in (_message(1, 42, "/purchase"), _message(2, 42, "Анна")):
+            await application.process_update(Update.de_json(payload, application.bot))
+        await application.update_persistence()
+        await application.shutdown()
+
+    async def second_run():
+        application = _application(DatabasePersistence(db), replies)
+        await application.initialize()
+        await application.process_update(Update.de_json(_message(3, 42, "+79001234567"), application.bot))
+        await application.update_persistence()
+        await application.shutdown()
+
+    asyncio.run(first_run())
+    asyncio.run(second_run())
+    assert replies == [("Анна", "+79001234567")]
+    # Завершённый диалог удалён, остались только user_data
+    kinds = [row[0] for row in db.connection.db.execute("SELECT kind FROM bot_persistence")]
+    assert kinds == ["user"]
+
+
+def test_unchanged_entries_are_not_rewritten_and_writes_are_batched(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+    persistence = DatabasePersistence(db)
+
+    async def scenario():
+        await asyncio.gather(*(persistence.update_user_data(user_id, {"step": 1}) for user_id in range(500)))
+        await persistence.flush()
+        queries = db.connection.queries
+        await asyncio.gather(*(persistence.update_user_data(user_id, {"step": 1}) for user_id in range(500)))
+        await persistence.update_user_data(7, {"step": 2})
+        await persistence.flush()
+        return db.connection.queries - queries
+
+    assert asyncio.run(scenario()) == 1
+    assert persistence.flushes == 2
+    assert persistence.rows_written == 501
+
+
+def test_abandoned_conversations_expire(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+    clock = _Clock()
+    persistence = DatabasePersistence(db, ttl=3600, clock=clock)
+
+    async def scenario():
+        await persistence.update_conversation("purchase", (42, 42), ASK_PHONE)
+        await persistence.update_conversation("purchase", (43, 43), ASK_NAME)
+        await persistence.flush()
+        clock.now += 1800
+        await persistence.update_conversation("purchase", (43, 43), ASK_PHONE)
+        await persistence.flush()
+        clock.now += 2400
+        return await DatabasePersistence(db, ttl=3600, clock=clock).get_conversations("purchase")
+
+    assert asyncio.run(scenario()) == {(43, 43): ASK_PHONE}
+
+
+def test_unchanged_user_data_outlives_ttl_while_accessed(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+    clock = _Clock()
+    persistence = DatabasePersistence(db, ttl=3600, clock=clock)
+
+    async def scenario():
+        await persistence.update_user_data(42, {"name": "Анна"})
+        await persistence.update_user_data(43, {"name": "Олег"})
+        await persistence.flush()
+        # 42 обращается без изменений: updated_at продлевается, 43 молчит
+        for _ in range(4):
+            clock.now += 1000
+            await persistence.update_user_data(42, {"name": "Анна"})
+            await persistence.flush()
+        restarted = await DatabasePersistence(db, ttl=3600, clock=clock).get_user_data()
+        # Очистка удалила 43; следующее обращение записывает его заново
+        await persistence.update_user_data(43, {"name": "Олег"})
+        await persistence.flush()
+        return restarted, await DatabasePersistence(db, ttl=3600, clock=clock).get_user_data()
+
+    restarted, after_access = asyncio.run(scenario())
+    assert restarted == {42: {"name": "Анна"}}
+    assert after_access == {42: {"name": "Анна"}, 43: {"name": "Олег"}}
+    assert persistence.rows_written == 3
+
+
+def test_hot_path_overhead_is_below_a_millisecond(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+    updates = 2000
+
+    async def measure(persistence):
+        application = _application(persistence, [])
+        await application.initialize()
+        payloads = []
+        for i in range(0, updates, 3):
+            user_id = i % 200
+            payloads += [_message(i, user_id, "/purchase"), _message(i + 1, user_id, "Анна"),
+                         _message(i + 2, user_id, "+7900")]
+        parsed = [Update.de_json(payload, application.bot) for payload in payloads]
+        started = time.perf_counter()
+        for update in parsed:
+            await application.process_update(update)
+        elapsed = time.perf_counter() - started
+        await application.update_persistence()
+        await application.shutdown()
+        return elapsed / len(parsed)
+
+    baseline = asyncio.run(measure(None))
+    persisted = asyncio.run(measure(DatabasePersistence(db)))
+    assert persisted - baseline < 0.001
+
+
+def test_shard_loads_only_its_own_chats(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+
+    async def scenario():
+        writer = DatabasePersistence(db)
+        for chat_id in (10, 11, 12, 13):
+            await writer.update_conversation("purchase", (chat_id, chat_id), ASK_NAME)
+            await writer.update_user_data(chat_id, {"step": chat_id})
+        await writer.flush()
+        shard = DatabasePersistence(db, owns=lambda chat_id: chat_id % 2 == 1)
+        return await shard.get_conversations("purchase"), await shard.get_user_data()
+
+    conversations, user_data = asyncio.run(scenario())
+    assert conversations == {(11, 11): ASK_NAME, (13, 13): ASK_NAME}
+    assert user_data == {11: {"step": 11}, 13: {"step": 13}}
+
+
+def test_shard_writes_only_its_own_user_data(tmp_path):
+    db = _database(str(tmp_path / "state.db"))
+
+    async def scenario():
+        owner = DatabasePersistence(db, owns=lambda chat_id: chat_id % 2 == 1)
+        other = DatabasePersistence(db, owns=lambda chat_id: chat_id % 2 == 0)
+        await owner.update_user_data(11, {"step": "owner"})
+        await owner.flush()
+        # Пользователь 11 написал в групповой чат другого шарда: его копия user_data не пишется
+        await other.update_user_data(11, {"step": "group"})
+        await other.drop_user_data(11)
+        await other.flush()
+        return await DatabasePersistence(db).get_user_data()
+
+    assert asyncio.run(scenario()) == {11: {"step": "owner"}}
+    assert [row[0] for row in db.connection.db.execute("SELECT kind FROM bot_persistence")] == ["user"]
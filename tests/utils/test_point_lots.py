@@ -0,0 +1,184 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from src.utils import point_lots
+from src.utils.database import SQLiteDatabase
+from src.utils.point_lots import EXPIRY_DESCRIPTION, PointLots
+
+SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY, role TEXT, is_active INTEGER DEFAULT 1);
+CREATE TABLE system_settings (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE clients (id INTEGER PRIMARY KEY, balance INTEGER DEFAULT 0, updated_at TIMESTAMP);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operator_id INTEGER, operation_type TEXT, points INTEGER,
+  amount NUMERIC, description TEXT, idempotency_key TEXT UNIQUE, balance_after INTEGER, created_at TIMESTAMP
+);
+CREATE TABLE point_lots (
+  id INTEGER PRIMARY KEY, client_id INTEGER NOT NULL, transaction_id INTEGER NOT NULL, points INTEGER NOT NULL,
+  remaining INTEGER NOT NULL CHECK (remaining >= 0), earned_at TIMESTAMP NOT NULL, expires_at DATE,
+  expired_at TIMESTAMP
+);
+CREATE INDEX idx_point_lots_expiry ON point_lots(expires_at) WHERE remaining > 0 AND expires_at IS NOT NULL;
+CREATE TABLE point_lot_state (
+  name TEXT PRIMARY KEY, last_id INTEGER NOT NULL DEFAULT 0, pending_id INTEGER, pending_at TIMESTAMP,
+  updated_at TIMESTAMP
+);
+INSERT INTO users (id, role) VALUES (1, 'admin');
+INSERT INTO system_settings (key, value) VALUES ('points_expiry_days', '365');
+"""
+
+START = datetime(2025, 1, 10, 12)
+
+
+def _database(clients):
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA)
+    db.connection.db.executemany("INSERT INTO clients (id) VALUES (?)", [(i,) for i in range(1, clients + 1)])
+    db.connection.db.commit()
+    return db
+
+
+def _operation(db, client_id, operation_type, points, moment):
+    """Операция с баллами, как её пишет журнал: баланс и строка point_transactions"""
+    sql = db.connection.db
+    sql.execute("UPDATE clients SET balance = balance + ? WHERE id = ?", (points, client_id))
+    balance = sql.execute("SELECT balance FROM clients WHERE id = ?", (client_id,)).fetchone()[0]
+    sql.execute(
+        "INSERT INTO point_transactions (client_id, operator_id, operation_type, points, balance_after, created_at) "
+        "VALUES (?, 1, ?, ?, ?, ?)", (client_id, operation_type, points, balance, moment)
+    )
+    sql.commit()
+
+
+def _lots(db, client_id):
+    return [
+        tuple(row) for row in db.connection.db.execute(
+            "SELECT points, remaining, expires_at FROM point_lots WHERE client_id = ? ORDER BY id", (client_id,)
+        )
+    ]
+
+
+def _balance(db, client_id):
+    return db.connection.db.execute("SELECT balance FROM clients WHERE id = ?", (client_id,)).fetchone()[0]
+
+
+def test_spends_consume_oldest_lots_across_batches():
+    db = _database(clients=2)
+    lots = PointLots(db, batch_size=2)
+    _operation(db, 1, "earn", 100, START)
+    _operation(db, 2, "earn", 10, START)
+    _operation(db, 1, "bonus", 50, START + timedelta(days=30))
+    _operation(db, 1, "spend", -120, START + timedelta(days=40))
+    _operation(db, 1, "earn", 20, START + timedelta(days=41))
+    _operation(db, 1, "spend", -10, START + timedelta(days=42))
+
+    processed = asyncio.run(lots.catch_up())
+    assert processed == 6
+    assert _lots(db, 1) == [
+        (100, 0, date(2026, 1, 10)),
+        (50, 20, date(2026, 2, 9)),
+        (20, 20, date(2026, 2, 20)),
+    ]
+    assert _lots(db, 2) == [(10, 10, date(2026, 1, 10))]
+
+    # Пересчёт с нуля даёт те же партии, что и догоняющие проходы
+    rebuilt = PointLots(db)
+    assert asyncio.run(rebuilt.backfill()) == 6
+    assert _lots(db, 1)[1:] == [(50, 20, date(2026, 2, 9)), (20, 20, date(2026, 2, 20))]
+
+
+def test_expiry_debits_due_lots_once_and_is_skipped_by_catch_up():
+    db = _database(clients=2)
+    lots = PointLots(db)
+    _operation(db, 1, "earn", 100, START)
+    _operation(db, 1, "earn", 40, START + timedelta(days=100))
+    _operation(db, 1, "spend", -30, START + timedelta(days=200))
+    _operation(db, 2, "earn", 25, START)
+    # Баланс уменьшен мимо журнала: сгорает не больше, чем есть на счёте
+    db.connection.db.execute("UPDATE clients SET balance = 5 WHERE id = 2")
+    db.connection.db.commit()
+
+    first = asyncio.run(lots.expire(date(2026, 1, 10)))
+    assert sorted(first.expired) == [(1, 70), (2, 5)]
+    assert first.skipped == 0
+    assert (_balance(db, 1), _balance(db, 2)) == (40, 0)
+    rows = db.connection.db.execute(
+        "SELECT client_id, operation_type, points, balance_after FROM point_transactions "
+        "WHERE description = ? ORDER BY client_id", (EXPIRY_DESCRIPTION,)
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [(1, "adjust", -70, 40), (2, "adjust", -5, 0)]
+
+    # Повторный запуск в тот же день ничего не списывает, операции сгорания не гасят партии
+    again = asyncio.run(lots.expire(date(2026, 1, 10)))
+    assert again.expired == []
+    assert _lots(db, 1) == [(100, 0, date(2026, 1, 10)), (40, 40, date(2026, 4, 20))]
+
+    later = asyncio.run(lots.expire(date(2026, 4, 20)))
+    assert later.expired == [(1, 40)]
+    assert _balance(db, 1) == 0
+
+
+def test_nightly_work_depends_on_due_lots_not_history():
+    db = _database(clients=300)
+    lots = PointLots(db)
+    for client_id in range(1, 301):
+        _operation(db, client_id, "earn", 10, START + timedelta(days=client_id % 3 * 100))
+    asyncio.run(lots.catch_up())
+
+    queries = db.connection.queries
+    result = asyncio.run(lots.expire(date(2026, 1, 10)))
+    assert len(result.expired) == 100
+    per_client = (db.connection.queries - queries) / len(result.expired)
+
+    queries = db.connection.queries
+    assert asyncio.run(lots.expire(date(2026, 1, 11))).expired == []
+    # Ночь без сгорающих партий — несколько запросов, сколько бы партий ни было открыто
+    assert db.connection.queries - queries < 15
+    assert per_client < 6
+
+
+def test_backfill_postpones_expiry_of_historical_lots():
+    db = _database(clients=1)
+    lots = PointLots(db)
+    _operation(db, 1, "earn", 30, START - timedelta(days=800))
+    _operation(db, 1, "earn", 20, START)
+
+    asyncio.run(lots.backfill(not_before=date(2025, 6, 1)))
+    assert _lots(db, 1) == [(30, 30, date(2025, 6, 1)), (20, 20, date(2026, 1, 10))]
+
+    db.connection.db.execute("UPDATE system_settings SET value = '0'")
+    db.connection.db.commit()
+    _operation(db, 1, "earn", 5, START)
+    asyncio.run(lots.catch_up())
+    assert _lots(db, 1)[-1] == (5, 5, None)
+
+
+def test_spend_committed_late_is_consumed_before_expiry(monkeypatch):
+    db = _database(1)
+    lots = PointLots(db)
+    _operation(db, 1, "earn", 100, START)
+    _operation(db, 1, "earn", 50, START + timedelta(days=1))
+    _operation(db, 1, "spend", -120, START + timedelta(days=2))
+    # Списание с id 3 ещё не зафиксировано: граница сначала 2, потом её нет
+    bound = [2]
+
+    async def horizon(connection, table, pending_id, pending_at):
+        return bound[0], None, None
+
+    monkeypatch.setattr(point_lots, "id_horizon", horizon)
+    day = START.date() + timedelta(days=400)
+
+    async def scenario():
+        assert await lots.catch_up() == 2
+        bound[0] = None
+        postponed = await lots.expire(day)
+        bound[0] = 3
+        return postponed, await lots.expire(day)
+
+    postponed, result = asyncio.run(scenario())
+    # Пока списание не учтено в партиях, клиент откладывается, а не теряет потраченные баллы
+    assert postponed.expired == [] and postponed.skipped == 1
+    assert result.expired == [(1, 30)]
+    assert _lots(db, 1) == [(100, 0, date(2026, 1, 10)), (50, 0, date(2026, 1, 11))]
+    assert _balance(db, 1) == 0
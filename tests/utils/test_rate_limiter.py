@@ -0,0 +1,57 @@
+import asyncio
+
+from src.utils.rate_limiter import TelegramRateLimiter, TokenBucket
+
+
+class _FakeTime:
+    def __init__(self):
+        self.now = 0.0
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    fake = _FakeTime()
+    bucket = TokenBucket(rate=10, capacity=3, clock=fake.clock)
+    waits = [bucket.reserve() for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3:] == [0.1, 0.2]
+
+
+def test_per_chat_interval_and_global_rate():
+    fake = _FakeTime()
+    limiter = TelegramRateLimiter(rate=30, burst=30, per_chat_interval=1.0, clock=fake.clock, sleep=fake.sleep)
+
+    async def scenario():
+        sent_at = []
+        for _ in range(3):
+            await limiter.acquire(42)
+            sent_at.append(fake.now)
+        return sent_at
+
+    assert asyncio.run(scenario()) == [0.0, 1.0, 2.0]
+
+    fake.now = 100.0
+    limiter = TelegramRateLimiter(rate=30, burst=30, per_chat_interval=1.0, clock=fake.clock, sleep=fake.sleep)
+
+    async def many_chats():
+        for chat_id in range(90):
+            await limiter.acquire(chat_id)
+
+    asyncio.run(many_chats())
+    # 30 сообщений сразу, остальные 60 — со скоростью 30 в секунду
+    assert round(fake.now - 100.0, 6) == 2.0
+
+
+def test_pause_blocks_everyone_until_retry_after_elapses():
+    fake = _FakeTime()
+    limiter = TelegramRateLimiter(clock=fake.clock, sleep=fake.sleep)
+    limiter.pause(5)
+
+    asyncio.run(limiter.acquire(1))
+    assert fake.now == 5
+    assert limiter.pauses == 1
@@ -0,0 +1,90 @@
+import asyncio
+
+from src.utils.database import SQLiteConnection
+from src.utils.search_index import ClientSearchIndex, normalize_name
+
+ROWS = [
+    {"id": 1, "full_name": "Фёдоров Пётр", "phone": "+7 (900) 123-45-67", "card_number": "RC000101"},
+    {"id": 2, "full_name": "Федорова Анна", "phone": "89001112233", "card_number": "RC000102"},
+    {"id": 3, "full_name": "Иванов Иван", "phone": "+79005554567", "card_number": "RC000200"},
+    {"id": 4, "full_name": "Смирнова Алёна", "phone": None, "card_number": "RC000300"},
+]
+
+
+def _index():
+    index = ClientSearchIndex()
+    index.build(ROWS)
+    return index
+
+
+def _ids(hits):
+    return [hit.client_id for hit in hits]
+
+
+def test_normalize_name_folds_yo_and_case():
+    assert normalize_name("  Фёдоров-ПЁТР ") == "федоров петр"
+
+
+def test_phone_suffix_lookup():
+    hits = _index().search("4567")
+    assert sorted(_ids(hits)) == [1, 3]
+    assert all(hit.matched == "phone" for hit in hits)
+    assert _ids(_index().search("+7 900 555-45-67")) == [3]
+
+
+def test_card_prefix_ranks_exact_card_first():
+    index = _index()
+    assert _ids(index.search("rc0001")) == [1, 2]
+    assert _ids(index.search("RC000102"))[0] == 2
+
+
+def test_partial_name_with_yo_folding():
+    index = _index()
+    assert _ids(index.search("федор")) == [1, 2]
+    assert _ids(index.search("Федоров"))[0] == 1
+    assert _ids(index.search("смирнова алена")) == [4]
+
+
+def test_fuzzy_name_tolerates_typo():
+    assert _ids(_index().search("Ивонов"))[0] == 3
+
+
+def test_incremental_add_update_remove():
+    index = _index()
+    index.add({"id": 5, "full_name": "Орлова Ксения", "phone": "+79990001122", "card_number": "RC000500"})
+    assert _ids(index.search("1122")) == [5]
+
+    index.add({"id": 5, "full_name": "Соколова Ксения", "phone": "+79990003344", "card_number": "RC000500"})
+    assert index.search("1122") == []
+    assert _ids(index.search("орлова")) == []
+    assert _ids(index.search("соколова")) == [5]
+
+    index.remove(5)
+    assert index.search("соколова") == []
+    assert len(index) == 4
+    assert index.stats()["name_words"] == 8
+
+
+def test_load_and_refresh_from_database():
+    db = SQLiteConnection()
+    db.script(
+        "CREATE TABLE clients (id INTEGER PRIMARY KEY, full_name TEXT, phone TEXT, card_number TEXT,"
+        " is_active INTEGER, updated_at TEXT);"
+        "INSERT INTO clients VALUES (1, 'Иванов Иван', '+79005554567', 'RC1', 1, '2026-01-01 10:00:00');"
+        "INSERT INTO clients VALUES (2, 'Петров Пётр', '+79001112233', 'RC2', 1, '2026-01-01 11:00:00');"
+    )
+    index = ClientSearchIndex()
+
+    async def scenario():
+        assert not index.loaded
+        await index.load(db, page_size=1)
+        assert index.loaded and len(index) == 2
+        db.script(
+            "UPDATE clients SET is_active = 0, updated_at = '2026-01-02 09:00:00' WHERE id = 1;"
+            "INSERT INTO clients VALUES (3, 'Сидорова Анна', NULL, 'RC3', 1, '2026-01-02 10:00:00');"
+        )
+        return await index.refresh(db)
+
+    assert asyncio.run(scenario()) == 2
+    assert _ids(index.search("Сидорова")) == [3]
+    assert index.search("Иванов") == []
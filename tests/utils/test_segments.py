@@ -0,0 +1,214 @@
+import asyncio
+import random
+import threading
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from src.utils.database import SQLiteDatabase
+from src.utils.segments import Bitmap, RuleError, SegmentIndex, compile_rule
+
+TODAY = date(2026, 3, 15)
+
+SCHEMA = """
+CREATE TABLE clients (
+  id INTEGER PRIMARY KEY, telegram_id INTEGER, birth_date DATE, balance INTEGER DEFAULT 0,
+  total_spent NUMERIC DEFAULT 0, visit_count INTEGER DEFAULT 0, last_visit TIMESTAMP,
+  is_active BOOLEAN DEFAULT 1, updated_at TIMESTAMP
+);
+"""
+
+
+def _database(clients):
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA)
+    db.connection.db.executemany(
+        "INSERT INTO clients VALUES (:id, :telegram_id, :birth_date, :balance, :total_spent, :visit_count, "
+        ":last_visit, :is_active, :updated_at)",
+        clients
+    )
+    db.connection.db.commit()
+    return db
+
+
+def _clients(count, seed=7):
+    rng = random.Random(seed)
+    moment = datetime(2026, 3, 1)
+    clients = []
+    for client_id in range(1, count + 1):
+        visits = rng.randrange(0, 20)
+        clients.append({
+            "id": client_id,
+            "telegram_id": None if client_id % 17 == 0 else 10_000 + client_id,
+            "birth_date": date(1990, 3, 15) if client_id % 50 == 0 else date(1990, rng.randrange(1, 13), 1),
+            "balance": rng.randrange(0, 500),
+            "total_spent": rng.choice([0, 500, 9999, 10000, 25000]),
+            "visit_count": visits,
+            "last_visit": datetime.combine(TODAY - timedelta(days=rng.randrange(0, 90)), datetime.min.time())
+            if visits else None,
+            "is_active": client_id % 23 != 0,
+            "updated_at": moment,
+        })
+    return clients
+
+
+def _expected(clients, predicate):
+    return [
+        c["id"] for c in clients
+        if c["is_active"] and c["telegram_id"] is not None and predicate(c)
+    ]
+
+
+def _days_since(client):
+    return (TODAY - client["last_visit"].date()).days if client["last_visit"] else 10 ** 6
+
+
+def test_load_matches_segment_filters_and_iterates_in_id_order():
+    clients = _clients(2000)
+    db = _database(clients)
+    index = SegmentIndex()
+
+    async def scenario():
+        async with db.acquire() as connection:
+            await index.load(connection, TODAY, page_size=300)
+
+    asyncio.run(scenario())
+
+    expected = {
+        "all": _expected(clients, lambda c: True),
+        "active": _expected(clients, lambda c: _days_since(c) <= 30),
+        "vip": _expected(clients, lambda c: c["total_spent"] >= 10000),
+        "birthday": _expected(clients, lambda c: (c["birth_date"].month, c["birth_date"].day) == (3, 15)),
+    }
+    for segment, ids in expected.items():
+        assert index.count(segment) == len(ids)
+        assert index.members(segment) == ids
+    vip = expected["vip"]
+    assert index.members("vip", after=vip[10], limit=5) == vip[11:16]
+
+    with pytest.raises(ValueError):
+        index.count("unknown")
+
+
+def test_refresh_recomputes_changed_clients_and_date_segments():
+    clients = _clients(300)
+    db = _database(clients)
+    index = SegmentIndex()
+    target = next(c for c in clients if c["is_active"] and c["telegram_id"] and c["total_spent"] < 10000
+                  and _days_since(c) > 30)
+
+    async def scenario():
+        async with db.acquire() as connection:
+            await index.load(connection, TODAY)
+            before = (index.count("vip"), index.count("active"), index.count("all"))
+
+            await connection.execute(
+                "UPDATE clients SET total_spent = 12000, visit_count = visit_count + 1, last_visit = $2, "
+                "updated_at = $3 WHERE id = $1",
+                target["id"], datetime(2026, 3, 15, 12), datetime(2026, 3, 15, 12)
+            )
+            await connection.execute(
+                "UPDATE clients SET is_active = 0, updated_at = $2 WHERE id = $1", 1, datetime(2026, 3, 15, 12)
+            )
+            changed = await index.refresh(connection, TODAY)
+            after = (index.count("vip"), index.count("active"), index.count("all"))
+
+            birthdays_today = index.count("birthday")
+            # На следующий день сегменты по дате пересчитываются без изменений в clients
+            await index.refresh(connection, TODAY + timedelta(days=1))
+            return before, changed, after, birthdays_today, index.count("birthday")
+
+    before, changed, after, birthdays_today, birthdays_tomorrow = asyncio.run(scenario())
+    assert changed == 2
+    first_was_member = clients[0]["telegram_id"] is not None and clients[0]["is_active"]
+    assert after[2] == before[2] - first_was_member
+    assert target["id"] in index.members("vip")
+    assert target["id"] in index.members("active")
+    assert 1 not in index.members("all")
+    assert birthdays_today > 0
+    assert birthdays_tomorrow == 0
+
+
+def test_custom_rules_are_validated_and_maintained():
+    clients = _clients(500)
+    db = _database(clients)
+    index = SegmentIndex(max_custom_rules=2)
+
+    async def scenario():
+        async with db.acquire() as connection:
+            await index.load(connection, TODAY)
+        await index.prepare("visit_count >= 5 and  days_since_visit > 60")
+
+    asyncio.run(scenario())
+
+    rule = "visit_count >= 5 and days_since_visit > 60"
+    expected = _expected(clients, lambda c: c["visit_count"] >= 5 and _days_since(c) > 60)
+    assert index.count("custom", rule) == len(expected)
+    assert index.members("custom", rule) == expected
+
+    member = expected[0]
+    index.update({**next(c for c in clients if c["id"] == member), "last_visit": datetime(2026, 3, 14)})
+    assert member not in index.members("custom", rule)
+
+    for bad in ("__import__('os')", "phone == 1", "visit_count == 'x'", "visit_count >", "", "[1][0]"):
+        with pytest.raises(RuleError):
+            compile_rule(bad)
+    with pytest.raises(RuleError):
+        index.count("custom")
+
+    with pytest.raises(RuleError):
+        index.count("custom", "balance > 100")
+    asyncio.run(index.prepare("balance > 100"))
+    asyncio.run(index.prepare("balance > 200"))
+    assert len(index.stats()["segments"]) == 4 + 2
+
+
+def test_rule_is_built_off_loop_with_concurrent_changes_and_deletions():
+    clients = _clients(300)
+    db = _database(clients)
+    index = SegmentIndex()
+    members = _expected(clients, lambda c: c["balance"] > 100)
+    outsider = next(c for c in clients if c["id"] in _expected(clients, lambda c: c["balance"] <= 100))
+    deleted = members[0]
+
+    started, proceed = threading.Event(), threading.Event()
+    evaluate = index._evaluate
+
+    def slow_evaluate(predicates, today):
+        fresh = evaluate(predicates, today)
+        started.set()
+        proceed.wait(5)
+        return fresh
+
+    async def scenario():
+        async with db.acquire() as connection:
+            await index.load(connection, TODAY)
+        index._evaluate = slow_evaluate
+        task = asyncio.create_task(index.prepare("balance > 100"))
+        while not started.is_set():
+            await asyncio.sleep(0.001)
+        # Изменения, пришедшие, пока карта строится в потоке
+        index.update({**outsider, "balance": 400})
+        index.remove(deleted)
+        proceed.set()
+        await task
+
+    asyncio.run(scenario())
+    custom = index.members("custom", "balance > 100")
+    assert outsider["id"] in custom
+    assert deleted not in custom and deleted not in index.members("all")
+    assert len(custom) == len(members)
+
+
+def test_bitmap_add_discard_and_iteration():
+    bitmap = Bitmap()
+    for value in (3, 8, 9, 1000, 64):
+        bitmap.add(value)
+    bitmap.add(8)
+    bitmap.discard(9)
+    bitmap.discard(5000)
+    assert len(bitmap) == 4
+    assert list(bitmap) == [3, 8, 64, 1000]
+    assert list(bitmap.iter_from(8)) == [64, 1000]
+    assert 64 in bitmap and 9 not in bitmap and 10 ** 6 not in bitmap
@@ -0,0 +1,124 @@
+import asyncio
+
+from src.utils import sharding
+from src.utils.sharding import ShardFront, shard_for, update_shard
+from src.utils.webhook import WebhookListener
+
+SECRET = "shard-secret"
+
+
+def _message(update_id, chat_id, text="/balance"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": {"id": abs(chat_id), "is_bot": False, "first_name": "Клиент"},
+        },
+    }
+
+
+def _callback(update_id, user_id):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id), "chat_instance": "1", "data": "balance",
+            "from": {"id": user_id, "is_bot": False, "first_name": "Клиент"},
+        },
+    }
+
+
+async def _worker(received, delay=0.0):
+    """Рабочий процесс шарда: локальный webhook, медленный ответ не мешает порядку"""
+    async def on_update(payload):
+        if delay:
+            await asyncio.sleep(delay)
+        received.append(payload["update_id"])
+
+    listener = WebhookListener(on_update, port=0, path="/update", secret_token=SECRET)
+    await listener.start()
+    return listener
+
+
+def test_private_chat_and_its_user_share_a_shard():
+    assert shard_for(42, 4) == shard_for(("user", 42), 4) == 2
+    assert update_shard(_message(1, 42), 4) == update_shard(_callback(2, 42), 4)
+    assert update_shard(_message(3, -1001), 4) == shard_for(-1001, 4)
+    assert {update_shard(_message(i, 1000 + i), 3) for i in range(30)} == {0, 1, 2}
+
+
+def test_front_keeps_per_chat_order_across_workers():
+    async def scenario():
+        received = [[], []]
+        workers = [await _worker(received[0], delay=0.002), await _worker(received[1])]
+        front = ShardFront(2, base_port=0, secret=SECRET, spawn_workers=False)
+        for shard, worker in zip(front.shards, workers):
+            shard.port = worker.bound_port
+        await front.start()
+        try:
+            for update_id in range(1, 41):
+                await front.route(_message(update_id, 100 + update_id % 4))
+            await front.stop(drain=True)
+        finally:
+            for worker in workers:
+                await worker.stop()
+        return received, front.stats()
+
+    received, stats = asyncio.run(scenario())
+    # Чаты 100 и 102 — шард 0, 101 и 103 — шард 1; внутри шарда порядок прихода
+    assert received[0] == [i for i in range(1, 41) if i % 2 == 0]
+    assert received[1] == [i for i in range(1, 41) if i % 2 == 1]
+    assert [s["forwarded"] for s in stats] == [20, 20]
+
+
+def test_updates_wait_for_restarting_worker():
+    async def scenario():
+        received = []
+        worker = await _worker(received)
+        port = worker.bound_port
+        await worker.stop()
+        front = ShardFront(1, base_port=port, secret=SECRET, spawn_workers=False)
+        await front.start()
+        for update_id in (1, 2, 3):
+            await front.route(_message(update_id, 7))
+        await asyncio.sleep(0.05)
+        assert received == []
+
+        # Рабочий поднялся на том же порту — очередь доставляется по порядку
+        worker = WebhookListener(worker.on_update, port=port, path="/update", secret_token=SECRET)
+        await worker.start()
+        await front.stop(drain=True, timeout=5)
+        await worker.stop()
+        return received, front.stats()[0]
+
+    received, stats = asyncio.run(scenario())
+    assert received == [1, 2, 3]
+    assert stats["forwarded"] == 3 and stats["retries"] >= 1 and stats["dropped"] == 0
+
+
+def test_update_failing_in_worker_is_dropped_after_retries(monkeypatch):
+    monkeypatch.setattr(sharding, "RETRY_DELAYS", (0.001,))
+
+    async def scenario():
+        received = []
+
+        async def on_update(payload):
+            if payload["update_id"] == 1:
+                raise RuntimeError("poison update")
+            received.append(payload["update_id"])
+
+        worker = WebhookListener(on_update, port=0, path="/update", secret_token=SECRET)
+        await worker.start()
+        front = ShardFront(1, base_port=worker.bound_port, secret=SECRET, spawn_workers=False)
+        await front.start()
+        for update_id in (1, 2, 3):
+            await front.route(_message(update_id, 7))
+        await front.stop(drain=True, timeout=5)
+        await worker.stop()
+        return received, front.stats()[0]
+
+    received, stats = asyncio.run(scenario())
+    # Обновление, на которое рабочий отвечает 500, не держит очередь шарда
+    assert received == [2, 3]
+    assert stats["dropped"] == 1 and stats["retries"] == sharding.MAX_FAILED_RESPONSES - 1
+    assert stats["forwarded"] == 2
@@ -0,0 +1,136 @@
+import asyncio
+
+from src.utils.client_cache import ClientCache
+from src.utils.client_listing import ClientListing
+from src.utils.search_index import ClientSearchIndex
+from src.utils.segments import SegmentIndex
+from src.utils.shared_state import CacheInvalidation, LeaderElection, LocalHub, LocalStore
+
+
+class _Services:
+    """Службы ведущего: считает запуски и остановки"""
+
+    def __init__(self):
+        self.running = False
+        self.starts = 0
+
+    async def start(self):
+        self.running = True
+        self.starts += 1
+
+    async def stop(self):
+        self.running = False
+
+
+def _process(hub):
+    """Кэши одного процесса и рассылка их сбросов через общий hub"""
+    return CacheInvalidation(LocalStore(hub), cache=ClientCache(), listing=ClientListing(), search=ClientSearchIndex(),
+                             segments=SegmentIndex())
+
+
+def test_only_one_process_runs_leader_services_and_failover():
+    async def scenario():
+        hub = LocalHub()
+        services = [_Services() for _ in range(3)]
+        elections = [
+            LeaderElection(LocalStore(hub), "schedulers", s.start, s.stop, interval=0.01) for s in services
+        ]
+        tasks = [asyncio.create_task(election.run()) for election in elections]
+        await asyncio.sleep(0.05)
+        assert [s.running for s in services].count(True) == 1
+        leader = next(i for i, s in enumerate(services) if s.running)
+
+        # Ведущий остановился — блокировку подхватывает ровно один из остальных
+        tasks[leader].cancel()
+        await asyncio.gather(tasks[leader], return_exceptions=True)
+        assert not services[leader].running
+        await asyncio.sleep(0.05)
+        assert [s.running for s in services].count(True) == 1
+        assert sum(s.starts for s in services) == 2
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert not any(s.running for s in services)
+        assert hub.locks == {}
+
+    asyncio.run(scenario())
+
+
+def test_lost_lock_stops_services():
+    class FlakyStore(LocalStore):
+        alive = True
+
+        async def holds(self, name):
+            return self.alive and await super().holds(name)
+
+    async def scenario():
+        store = FlakyStore()
+        services = _Services()
+        election = LeaderElection(store, "schedulers", services.start, services.stop)
+        await election.check()
+        assert services.running and election.is_leader
+
+        # Соединение с блокировкой оборвалось: службы останавливаются до следующего захвата
+        store.alive = False
+        await election.check()
+        assert not services.running and not election.is_leader
+        store.alive = True
+        await election.check()
+        assert services.running and services.starts == 2
+
+    asyncio.run(scenario())
+
+
+def test_cache_invalidations_reach_other_processes_once():
+    async def scenario():
+        hub = LocalHub()
+        first, second = _process(hub), _process(hub)
+        for bus in (first, second):
+            await bus.start()
+            bus.cache.put({"id": 7, "telegram_id": 70, "card_number": "0007", "phone": "+79990000007"})
+            bus.cache.put({"id": 8, "telegram_id": 80, "card_number": "0008", "phone": "+79990000008"})
+
+        # Сбросы одного обработчика уходят одним сообщением
+        first.cache.invalidate_client(7)
+        first.listing.invalidate()
+        await asyncio.sleep(0.01)
+        assert first.sent == 2 and second.received == 2
+        assert second.cache.get("id", 7) is None
+        assert second.cache.get("card_number", "0008") is not None
+        # Применённый сброс не пересылается обратно
+        assert second.sent == 0 and first.received == 0
+
+        second.cache.invalidate("telegram_id", 80)
+        await asyncio.sleep(0.01)
+        assert first.cache.get("id", 8) is None
+
+        second.cache.clear()
+        await asyncio.sleep(0.01)
+        assert first.cache.stats().size == 0
+
+        first.stop()
+        first.cache.invalidate_client(8)
+        await asyncio.sleep(0.01)
+        assert first.sent == 2
+
+    asyncio.run(scenario())
+
+
+def test_deleted_client_leaves_search_index_of_other_processes():
+    async def scenario():
+        hub = LocalHub()
+        first, second = _process(hub), _process(hub)
+        await first.start()
+        await second.start()
+        second.search.add({"id": 5, "full_name": "Анна Петрова", "phone": "+79991112233", "card_number": "0005"})
+        second.segments.update({"id": 5, "telegram_id": 50, "is_active": True})
+        assert [hit.client_id for hit in second.search.search("Анна")] == [5]
+
+        first.client_deleted(5)
+        await asyncio.sleep(0.01)
+        assert second.search.search("Анна") == []
+        assert 5 not in second.segments and second.segments.count("all") == 0
+        assert first.sent == 1 and second.received == 1
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import sys
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+from telegram.request import BaseRequest
+
+from src.utils.startup import DEFERRED_GROUP, DeferredStart, LazyCallback
+
+
+class _OfflineRequest(BaseRequest):
+    """Bot API без сети: отвечает только на getMe"""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        result = {"id": 1, "is_bot": True, "first_name": "Rock Coffee", "username": "rock_coffee_bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _command(update_id, text):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "text": text,
+            "chat": {"id": 7, "type": "private"},
+            "from": {"id": 7, "is_bot": False, "first_name": "Клиент"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}],
+        },
+    }
+
+
+def test_lazy_callback_imports_module_on_first_call(tmp_path, monkeypatch):
+    (tmp_path / "lazy_target_handlers.py").write_text(
+        "class Handlers:\n"
+        "    @staticmethod\n"
+        "    async def greet(update, context, name='мир'):\n"
+        "        return f'привет, {name}'\n",
+        encoding="utf-8",
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "lazy_target_handlers", raising=False)
+
+    callback = LazyCallback("lazy_target_handlers:Handlers.greet")
+    assert callback.__name__ == "greet"
+    assert "lazy_target_handlers" not in sys.modules
+
+    assert asyncio.run(callback(None, None, name="бариста")) == "привет, бариста"
+    assert "lazy_target_handlers" in sys.modules
+
+
+def test_deferred_start_runs_after_first_served_update():
+    events = []
+
+    async def start_command(update, context):
+        events.append("served")
+
+    async def start_services():
+        events.append("services")
+
+    async def scenario():
+        application = Application.builder().token("1:TEST").request(_OfflineRequest()).updater(None).build()
+        application.add_handler(CommandHandler("start", start_command))
+        deferred = DeferredStart(start_services, timeout=5)
+        deferred.install(application)
+        await application.initialize()
+        await application.start()
+        waiter = asyncio.create_task(deferred.run())
+        await asyncio.sleep(0.01)
+        assert not deferred.started
+
+        await application.process_update(Update.de_json(_command(1, "/start"), application.bot))
+        await asyncio.wait_for(waiter, 1)
+        await application.process_update(Update.de_json(_command(2, "/start"), application.bot))
+        await application.stop()
+        await application.shutdown()
+        return application.handlers.get(DEFERRED_GROUP, [])
+
+    assert asyncio.run(scenario()) == []
+    assert events == ["served", "services", "served"]
+
+
+def test_deferred_start_falls_back_to_timeout():
+    started = []
+
+    async def start_services():
+        started.append(True)
+
+    deferred = DeferredStart(start_services, timeout=0.01)
+    asyncio.run(deferred.run())
+    assert started == [True]
+    assert deferred.started
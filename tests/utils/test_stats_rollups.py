@@ -0,0 +1,120 @@
+import asyncio
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+
+from src.utils import stats_rollups
+from src.utils.database import SQLiteDatabase
+from src.utils.stats_rollups import ConcurrentCatchUp, StatsRollups, bucket_start, period_range
+
+MIGRATION = (Path(__file__).parents[2] / "migrations" / "011_stats_rollups.sql").read_text(encoding="utf-8")
+
+SCHEMA = """
+CREATE TABLE clients (id INTEGER PRIMARY KEY, created_at TIMESTAMP);
+CREATE TABLE point_transactions (
+  id INTEGER PRIMARY KEY, client_id INTEGER, operation_type TEXT, points INTEGER, amount NUMERIC,
+  created_at TIMESTAMP
+);
+"""
+
+
+def _database():
+    db = SQLiteDatabase()
+    asyncio.run(db.open())
+    db.connection.script(SCHEMA + MIGRATION)
+    return db
+
+
+def _transactions(db, rows):
+    db.connection.db.executemany(
+        "INSERT INTO point_transactions (client_id, operation_type, points, amount, created_at) VALUES (?, ?, ?, ?, ?)",
+        rows,
+    )
+    db.connection.db.commit()
+
+
+def test_period_boundaries():
+    assert bucket_start("week", datetime(2026, 10, 17, 15, 30)) == datetime(2026, 10, 12)
+    assert bucket_start("hour", datetime(2026, 10, 17, 15, 30)) == datetime(2026, 10, 17, 15)
+    assert period_range("month", date(2026, 2, 10)) == (date(2026, 2, 1), date(2026, 2, 28))
+    assert period_range("week", date(2026, 10, 17)) == (date(2026, 10, 12), date(2026, 10, 18))
+
+
+def test_catch_up_is_incremental_and_matches_raw_aggregates():
+    db = _database()
+    rollups = StatsRollups(db, batch_size=2)
+    db.connection.db.executemany(
+        "INSERT INTO clients (id, created_at) VALUES (?, ?)",
+        [(1, "2026-10-12 09:00:00"), (2, "2026-10-13 10:00:00")],
+    )
+    _transactions(db, [
+        (1, "earn", 30, "300.50", "2026-10-12 09:15:00"),
+        (1, "spend", -20, None, "2026-10-12 09:40:00"),
+        (2, "earn", 10, "100", "2026-10-13 10:05:00"),
+        (1, "bonus", 100, "0", "2026-10-13 11:00:00"),
+    ])
+
+    async def scenario():
+        assert await rollups.catch_up() == 4
+        assert await rollups.catch_up() == 0
+        _transactions(db, [(2, "spend", -5, None, "2026-10-13 12:00:00")])
+        assert await rollups.catch_up() == 1
+        return (
+            await rollups.summary("day", date(2026, 10, 12)),
+            await rollups.summary("week", date(2026, 10, 15)),
+        )
+
+    day, week = asyncio.run(scenario())
+    assert (day.transactions, day.points_earned, day.points_spent) == (2, 30, 20)
+    assert day.revenue == Decimal("300.5")
+    assert (day.active_clients, day.new_clients) == (1, 1)
+    assert [hour["transactions"] for hour in day.hours] == [2]
+    assert (week.transactions, week.points_earned, week.points_spent) == (5, 140, 25)
+    assert (week.active_clients, week.new_clients) == (2, 2)
+
+
+def test_backfill_rebuilds_from_scratch():
+    db = _database()
+    rollups = StatsRollups(db)
+    _transactions(db, [(1, "earn", 5, "50", "2026-10-12 09:00:00")] * 3)
+
+    async def scenario():
+        await rollups.catch_up()
+        db.connection.db.execute("UPDATE stats_daily SET transactions = 99")
+        await rollups.backfill()
+        return await rollups.summary("month", date(2026, 10, 1))
+
+    month = asyncio.run(scenario())
+    assert (month.transactions, month.points_earned, month.active_clients) == (3, 15, 1)
+
+
+def test_catch_up_stops_at_commit_horizon_and_tolerates_concurrent_advance(monkeypatch):
+    db = _database()
+    rollups = StatsRollups(db)
+    _transactions(db, [(1, "earn", 10, "100", "2026-10-12 09:00:00")] * 4)
+    # Транзакция с id 3 ещё открыта: сначала граница 2, потом её нет, потом 4
+    bounds = iter([2, None, 4])
+
+    async def horizon(connection, table, pending_id, pending_at):
+        return (next(bounds) if table == "point_transactions" else 0), None, None
+
+    async def fixed(connection, table, pending_id, pending_at):
+        return 5, None, None
+
+    async def lost_race(connection, name, old, new):
+        raise ConcurrentCatchUp(f"Stats rollup {name} was advanced concurrently")
+
+    async def scenario():
+        monkeypatch.setattr(stats_rollups, "id_horizon", horizon)
+        assert await rollups.catch_up() == 2
+        assert await rollups.catch_up() == 0
+        assert await rollups.catch_up() == 2
+        # Проигранная гонка с другим процессом не ошибка: пакет откатывается
+        _transactions(db, [(1, "earn", 10, "100", "2026-10-12 10:00:00")])
+        monkeypatch.setattr(stats_rollups, "id_horizon", fixed)
+        monkeypatch.setattr(rollups, "_advance", lost_race)
+        assert await rollups.catch_up() == 0
+        return await rollups.summary("day", date(2026, 10, 12))
+
+    day = asyncio.run(scenario())
+    assert (day.transactions, day.points_earned) == (4, 40)
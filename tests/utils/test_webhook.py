@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from src.utils.webhook import WebhookListener
+
+
+async def _request(port, method, path, body=b"", headers=None):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}", "Connection: close"]
+    for name, value in (headers or {}).items():
+        lines.append(f"{name}: {value}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.decode().partition("\r\n")
+    return int(status_line.split()[1]), rest.split("\r\n\r\n", 1)[1]
+
+
+def test_listener_accepts_updates_and_checks_secret():
+    async def scenario():
+        received = []
+
+        async def on_update(payload):
+            received.append(payload)
+
+        listener = WebhookListener(on_update, port=0, path="/hook", secret_token="s3cret")
+        listener.add_route("/stats", lambda: ("application/json", json.dumps({"ok": True})))
+        await listener.start()
+        port = listener.bound_port
+        try:
+            body = json.dumps({"update_id": 1}).encode()
+            ok = await _request(port, "POST", "/hook", body, {"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            forbidden = await _request(port, "POST", "/hook", body, {"X-Telegram-Bot-Api-Secret-Token": "nope"})
+            bad = await _request(port, "POST", "/hook", b"{not json", {"X-Telegram-Bot-Api-Secret-Token": "s3cret"})
+            stats = await _request(port, "GET", "/stats")
+            missing = await _request(port, "GET", "/nowhere")
+        finally:
+            await listener.stop()
+        return received, ok, forbidden, bad, stats, missing
+
+    received, ok, forbidden, bad, stats, missing = asyncio.run(scenario())
+    assert received == [{"update_id": 1}]
+    assert ok[0] == 200
+    assert forbidden[0] == 403
+    assert bad[0] == 400
+    assert stats == (200, '{"ok": true}')
+    assert missing[0] == 404
+
+
+def test_malformed_content_length_is_answered_with_bad_request():
+    async def scenario():
+        async def on_update(payload):
+            pass
+
+        listener = WebhookListener(on_update, port=0, path="/hook")
+        await listener.start()
+        try:
+            responses = []
+            for length in ("abc", "-5"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", listener.bound_port)
+                writer.write(f"POST /hook HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode())
+                await writer.drain()
+                responses.append((await reader.read()).decode().partition("\r\n")[0])
+                writer.close()
+        finally:
+            await listener.stop()
+        return responses
+
+    assert asyncio.run(scenario()) == ["HTTP/1.1 400 Bad Request"] * 2